@@ -0,0 +1,206 @@
+"""
+Latency and throughput benchmarks for every analysis service, on synthetic
+documents generated offline (see benchmarks/synthetic.py).
+
+Usage (from backend/):
+    python -m benchmarks.run --output benchmarks/baselines/main.json
+    python -m benchmarks.run --compare benchmarks/baselines/main.json
+    python -m benchmarks.run --services ela,kyc --resolutions low,medium --repeats 10
+
+With --compare, the run is checked against a stored baseline. A case whose
+median latency grew by more than --threshold (default 15%) is flagged, and
+the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+from .synthetic import RESOLUTIONS, generate_document
+
+SERVICES = ["ela", "sliding_window", "ocr", "layout", "ner", "kyc", "pdf_render"]
+# ViT patch geometry used by sliding_window_grid
+PATCH_SIZE, PATCH_STRIDE = 256, 128
+
+@dataclass
+class Case:
+    name: str
+    fn: Callable[[], object]
+    # Work items per call (pages, patches, pairs...) for the throughput figure
+    units: int = 1
+    unit: str = "doc"
+
+def _patches(size) -> int:
+    width, height = size
+    return max(1, ((width - PATCH_SIZE) // PATCH_STRIDE + 1) * ((height - PATCH_SIZE) // PATCH_STRIDE + 1))
+
+def build_cases(services: List[str], resolutions: List[str], seed: int) -> List[Case]:
+    """Generates the inputs and binds each service call to them. Models load here, not in the timings."""
+    docs = {r: generate_document(seed, r, pages=1, forgery="splice") for r in resolutions}
+    cases = []
+
+    if "ela" in services:
+        from services.fraud_detector import calculate_ela
+        for r, doc in docs.items():
+            cases.append(Case(f"ela/{r}", lambda doc=doc: calculate_ela(doc.pages[0])))
+
+    if "sliding_window" in services:
+        from services.dl_detector import dl_detector
+        from services.heatmaps import ScoreGrid, pyramid_info, render_tile
+
+        def sliding_window(page):
+            # The dl stage's patch grid plus the first full-resolution tile a viewer asks for
+            grid, _ = dl_detector.sliding_window_grid(page, PATCH_SIZE, PATCH_STRIDE)
+            score_grid = ScoreGrid(grid, (0, 0) + page.size, page.size)
+            return render_tile(score_grid, pyramid_info(page.size)["max_level"], 0, 0)
+
+        for r, doc in docs.items():
+            cases.append(Case(f"sliding_window/{r}", lambda doc=doc: sliding_window(doc.pages[0]),
+                              units=_patches(doc.pages[0].size), unit="patch"))
+
+    ocr_results = {}
+    if {"ocr", "layout", "ner"} & set(services):
+        import numpy as np
+        from services.ocr_service import ocr_service
+        # OCR output of each page, as input for the text stages
+        for r, doc in docs.items():
+            ocr_results[r] = ocr_service.extract_text(doc.pages[0])
+        if "ocr" in services:
+            for r, doc in docs.items():
+                pixels = np.array(doc.pages[0])
+                cases.append(Case(f"ocr/{r}", lambda pixels=pixels: ocr_service.extract_text(pixels)))
+
+    if "layout" in services:
+        from services.layout_analyzer import layout_analyzer
+        for r, results in ocr_results.items():
+            cases.append(Case(f"layout/{r}", lambda results=results: layout_analyzer.analyze_spatial_consistency(results)))
+
+    if "ner" in services:
+        from services.entity_extractor import entity_extractor
+        for r, results in ocr_results.items():
+            cases.append(Case(f"ner/{r}", lambda results=results: entity_extractor.extract(results)))
+
+    if "kyc" in services:
+        from services.entity_extractor import ExtractedData
+        from services.kyc_validator import kyc_validator
+        pack = [generate_document(seed + i, "low") for i in range(4)]
+        extracted = [ExtractedData(person_name=d.person_name, address=d.address) for d in pack]
+        cases.append(Case("kyc/validate", lambda: kyc_validator.validate(extracted[0], extracted[1]), unit="pair"))
+        cases.append(Case("kyc/validate_many_4", lambda: kyc_validator.validate_many(extracted), units=6, unit="pair"))
+
+    if "pdf_render" in services:
+        from services.pdf_processor import pdf_processor
+        for pages in (1, 5):
+            pdf = generate_document(seed, "low", pages=pages).to_pdf()
+            cases.append(Case(f"pdf_render/{pages}p", lambda pdf=pdf: pdf_processor.convert_to_images(pdf),
+                              units=pages, unit="page"))
+    return cases
+
+def measure(case: Case, warmup: int, repeats: int) -> dict:
+    for _ in range(warmup):
+        case.fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        case.fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        "median_s": round(median, 6),
+        "p95_s": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 6),
+        "min_s": round(samples[0], 6),
+        "mean_s": round(statistics.fmean(samples), 6),
+        "repeats": repeats,
+        "throughput": round(case.units / median, 3) if median > 0 else None,
+        "unit": f"{case.unit}/s",
+    }
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    env = {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    if "torch" in sys.modules:
+        env["torch_threads"] = sys.modules["torch"].get_num_threads()
+    return env
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Prints a comparison table and returns the regressed case names."""
+    regressions = []
+    print(f"\n{'case':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<28}{'-':>12}{current['median_s'] * 1000:>10.1f}ms{'new':>10}")
+            continue
+        change = current["median_s"] / before["median_s"] - 1 if before["median_s"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<28}{before['median_s'] * 1000:>10.1f}ms{current['median_s'] * 1000:>10.1f}ms{change:>+10.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis services on synthetic documents.")
+    parser.add_argument("--services", default=",".join(SERVICES), help=f"Comma-separated subset of: {', '.join(SERVICES)}")
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS), help=f"Comma-separated subset of: {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per case (default: 5)")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per case (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic corpus seed (default: 0)")
+    parser.add_argument("--output", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Relative slowdown flagged as a regression (default: 0.15)")
+    args = parser.parse_args(argv)
+
+    services = [s.strip() for s in args.services.split(",") if s.strip()]
+    resolutions = [r.strip() for r in args.resolutions.split(",") if r.strip()]
+    unknown = [s for s in services if s not in SERVICES] + [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"Unknown services or resolutions: {', '.join(unknown)}")
+
+    print(f"Preparing inputs and loading models for: {', '.join(services)}")
+    cases = build_cases(services, resolutions, args.seed)
+
+    results = {}
+    for case in cases:
+        results[case.name] = measure(case, args.warmup, args.repeats)
+        stats = results[case.name]
+        print(f"{case.name:<28} median {stats['median_s'] * 1000:9.1f}ms  p95 {stats['p95_s'] * 1000:9.1f}ms  "
+              f"{stats['throughput']} {stats['unit']}")
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["environment"].get("cpu_count") != report["environment"]["cpu_count"]:
+            print("Warning: baseline was recorded on a machine with a different core count")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
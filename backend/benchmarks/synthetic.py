@@ -0,0 +1,168 @@
+"""
+Offline generator of synthetic KYC-like documents for benchmarking.
+
+Documents are rendered from a seed, so every run benchmarks the exact same
+pixels: a header, identity fields, an address block and a statement table,
+optionally forged by splicing a region from another document or by
+re-compressing a region at a different JPEG quality.
+"""
+import io
+import random
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+
+# Page sizes in pixels: roughly A4 at 100, 200 and 300 DPI
+RESOLUTIONS = {
+    "low": (827, 1169),
+    "medium": (1654, 2339),
+    "high": (2480, 3508),
+}
+FORGERIES = ("none", "splice", "recompress")
+
+FIRST_NAMES = ["Alice", "Rahul", "Maria", "John", "Wei", "Fatima", "Carlos", "Anna", "David", "Priya"]
+LAST_NAMES = ["Sharma", "Smith", "Garcia", "Chen", "Khan", "Muller", "Rossi", "Okafor", "Silva", "Patel"]
+STREETS = ["Baker Street", "MG Road", "Main Street", "Elm Avenue", "Park Lane", "Station Road"]
+CITIES = ["London", "Mumbai", "New York", "Berlin", "Madrid", "Toronto"]
+ISSUERS = ["City Power & Light", "National Bank", "Metro Water Board", "Telecom Services Ltd"]
+
+_FONT_PATHS = ["DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "Arial.ttf"]
+
+@dataclass
+class SyntheticDocument:
+    name: str
+    resolution: str
+    forgery: str
+    pages: List[Image.Image]
+    # Forged region (left, top, right, bottom) on the first page, if any
+    forged_box: Optional[Tuple[int, int, int, int]]
+    person_name: str
+    address: str
+
+    def to_jpeg(self, quality: int = 92) -> bytes:
+        buffer = io.BytesIO()
+        self.pages[0].save(buffer, "JPEG", quality=quality)
+        return buffer.getvalue()
+
+    def to_pdf(self) -> bytes:
+        buffer = io.BytesIO()
+        self.pages[0].save(buffer, "PDF", save_all=True, append_images=self.pages[1:], resolution=100.0)
+        return buffer.getvalue()
+
+def _font(size: int):
+    for path in _FONT_PATHS:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def _identity(rng: random.Random) -> Tuple[str, str]:
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    address = f"{rng.randint(1, 250)} {rng.choice(STREETS)}, {rng.choice(CITIES)} {rng.randint(10000, 99999)}"
+    return name, address
+
+def _render_page(rng: random.Random, size: Tuple[int, int], person_name: str, address: str, page: int) -> Image.Image:
+    width, height = size
+    scale = width / 827
+    image = Image.new("RGB", size, (250, 250, 247))
+    draw = ImageDraw.Draw(image)
+    title, body, small = _font(int(34 * scale)), _font(int(18 * scale)), _font(int(14 * scale))
+    margin = int(60 * scale)
+    line = int(30 * scale)
+
+    # Header band with the issuer
+    draw.rectangle([0, 0, width, int(110 * scale)], fill=(28, 60, 110))
+    draw.text((margin, int(35 * scale)), rng.choice(ISSUERS), font=title, fill=(255, 255, 255))
+
+    y = int(150 * scale)
+    if page == 0:
+        fields = [
+            ("Name", person_name),
+            ("Address", address),
+            ("Date", f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/20{rng.randint(18, 25)}"),
+            ("Account No", str(rng.randint(10 ** 9, 10 ** 10 - 1))),
+        ]
+        for label, value in fields:
+            draw.text((margin, y), f"{label}:", font=body, fill=(60, 60, 60))
+            draw.text((margin + int(170 * scale), y), value, font=body, fill=(10, 10, 10))
+            y += line
+        y += line
+
+    # Statement table
+    columns = [margin, margin + int(150 * scale), margin + int(480 * scale), width - margin]
+    draw.rectangle([columns[0], y, columns[-1], y + line], fill=(225, 230, 240))
+    for x, heading in zip(columns, ("Date", "Description", "Amount")):
+        draw.text((x + 8, y + 4), heading, font=body, fill=(20, 20, 20))
+    y += line
+    rows = rng.randint(10, 18)
+    for _ in range(rows):
+        if y + line > height - margin:
+            break
+        draw.line([columns[0], y + line, columns[-1], y + line], fill=(200, 200, 200), width=max(1, int(scale)))
+        draw.text((columns[0] + 8, y + 4), f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}", font=small, fill=(40, 40, 40))
+        draw.text((columns[1] + 8, y + 4), rng.choice(["Payment", "Transfer", "Deposit", "Service charge", "Refund"]), font=small, fill=(40, 40, 40))
+        draw.text((columns[2] + 8, y + 4), f"{rng.uniform(5, 5000):,.2f}", font=small, fill=(40, 40, 40))
+        y += line
+
+    draw.text((margin, height - margin), f"Page {page + 1}", font=small, fill=(120, 120, 120))
+    return image
+
+def _recompress(region: Image.Image, quality: int) -> Image.Image:
+    buffer = io.BytesIO()
+    region.save(buffer, "JPEG", quality=quality)
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+def _forge(rng: random.Random, page: Image.Image, forgery: str, donor: Image.Image) -> Tuple[int, int, int, int]:
+    """Tampers with the identity block of `page` in place and returns the box."""
+    width, height = page.size
+    scale = width / 827
+    box = (int(220 * scale), int(145 * scale), int(700 * scale), int(215 * scale))
+    if forgery == "splice":
+        # The name/address area of another document, re-saved at another quality
+        page.paste(_recompress(donor.crop(box), quality=rng.randint(55, 75)), box[:2])
+    elif forgery == "recompress":
+        page.paste(_recompress(page.crop(box), quality=rng.randint(30, 50)), box[:2])
+    return box
+
+def generate_document(seed: int, resolution: str = "medium", pages: int = 1, forgery: str = "none") -> SyntheticDocument:
+    """Renders one synthetic document; the same arguments always give the same pixels."""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}'. Expected one of: {', '.join(RESOLUTIONS)}")
+    if forgery not in FORGERIES:
+        raise ValueError(f"Unknown forgery '{forgery}'. Expected one of: {', '.join(FORGERIES)}")
+
+    rng = random.Random(seed)
+    size = RESOLUTIONS[resolution]
+    person_name, address = _identity(rng)
+    rendered = [_render_page(rng, size, person_name, address, page) for page in range(pages)]
+
+    forged_box = None
+    if forgery != "none":
+        donor_rng = random.Random(seed + 1_000_003)
+        donor_name, donor_address = _identity(donor_rng)
+        donor = _render_page(donor_rng, size, donor_name, donor_address, 0)
+        forged_box = _forge(rng, rendered[0], forgery, donor)
+
+    # Every page goes through one JPEG round trip, like a scanned upload
+    rendered = [_recompress(page, quality=92) for page in rendered]
+    return SyntheticDocument(
+        name=f"doc-{seed}-{resolution}-{pages}p-{forgery}",
+        resolution=resolution,
+        forgery=forgery,
+        pages=rendered,
+        forged_box=forged_box,
+        person_name=person_name,
+        address=address,
+    )
+
+def generate_corpus(seed: int = 0, resolutions=tuple(RESOLUTIONS), forgeries=FORGERIES,
+                    page_counts=(1,)) -> List[SyntheticDocument]:
+    """One document per (resolution, forgery, page count) combination."""
+    corpus = []
+    for r_index, resolution in enumerate(resolutions):
+        for f_index, forgery in enumerate(forgeries):
+            for pages in page_counts:
+                corpus.append(generate_document(seed + 100 * r_index + 10 * f_index + pages, resolution, pages, forgery))
+    return corpus
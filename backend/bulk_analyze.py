@@ -0,0 +1,205 @@
+"""
+Offline bulk analysis for backfills and periodic re-screening.
+
+Runs the same analysis pipeline as the API over a directory or a manifest of
+archived documents, sharded across a process pool. Each worker process loads
+the models once. Progress is checkpointed to a JSONL file so an interrupted
+run resumes where it stopped. Results are written as Parquet or JSONL,
+without the heatmap images.
+
+Usage:
+    python bulk_analyze.py archive/ --output results.parquet --workers 16
+    python bulk_analyze.py manifest.txt --output results.jsonl --outputs ela,ner,score
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+SUPPORTED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.pdf']
+
+# Output columns and their Arrow types; every row carries all of them, so
+# an error row never narrows the schema
+RECORD_FIELDS = [
+    ("path", "string"),
+    ("filename", "string"),
+    ("sha256", "string"),
+    ("document_type", "string"),
+    ("final_score", "double"),
+    ("classification", "string"),
+    ("is_fraud", "bool"),
+    ("ela_score", "double"),
+    ("layout_score", "double"),
+    ("dl_score", "double"),
+    ("person_name", "string"),
+    ("address", "string"),
+    ("date", "string"),
+    ("pdf_suspicious", "bool"),
+    ("pdf_suspicious_reasons", "string"),
+    ("ocr_text", "string"),
+    ("stage_timings", "string"),
+    ("error", "string"),
+    ("duration_s", "double"),
+]
+
+# Set in each worker process by _init_worker
+_pipeline = None
+_outputs = None
+
+def discover_inputs(source: str):
+    """Yields document paths from a directory tree or a manifest (.txt or .csv with a `path` column)."""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    yield os.path.join(root, name)
+    elif source.endswith(".csv"):
+        with open(source, newline="") as f:
+            for row in csv.DictReader(f):
+                yield row["path"]
+    else:
+        with open(source) as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+def _read_checkpoint(checkpoint_path: str) -> dict:
+    """Latest record per path; a retried document replaces its earlier error row."""
+    records = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records[record["path"]] = record
+                except (ValueError, KeyError):
+                    # A crash can leave a truncated last line; it is simply redone
+                    continue
+    return records
+
+def load_checkpoint(checkpoint_path: str, retry_errors: bool = False) -> set:
+    """Paths already processed in a previous, possibly interrupted, run."""
+    records = _read_checkpoint(checkpoint_path)
+    return {path for path, record in records.items() if not (retry_errors and record.get("error"))}
+
+def _init_worker(outputs, threads):
+    """Loads the models once per worker process."""
+    global _pipeline, _outputs
+    import torch
+    torch.set_num_threads(threads)
+    from services import pipeline
+    _pipeline = pipeline
+    _outputs = outputs
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def analyze_file(path: str) -> dict:
+    """Analyses one document and flattens the result into a table row."""
+    record = {"path": path, "filename": os.path.basename(path)}
+    start = time.perf_counter()
+    try:
+        record["sha256"] = _sha256(path)
+        extension = os.path.splitext(path)[1].lower()
+        ctx = _pipeline.run_pipeline(path, extension, record["filename"], _outputs)
+        # Heatmaps are left out: bulk output carries scores and entities only
+        result = _pipeline.build_result(ctx, grids=False)
+        entities = result["extracted_entities"] or {}
+        pdf_metadata = result["pdf_metadata"] or {}
+        record.update({
+            "document_type": result["document_type"],
+            "final_score": result["final_score"],
+            "classification": result["classification"],
+            "is_fraud": result["is_fraud"],
+            "ela_score": result["ela_score"],
+            "layout_score": result["layout_score"],
+            "dl_score": result["dl_score"],
+            "person_name": entities.get("person_name"),
+            "address": entities.get("address"),
+            "date": entities.get("date"),
+            "pdf_suspicious": pdf_metadata.get("is_suspicious"),
+            "pdf_suspicious_reasons": "; ".join(pdf_metadata.get("suspicious_reasons", [])),
+            "ocr_text": " ".join(item["text"] for item in result["ocr_data"]),
+            "stage_timings": json.dumps(result["stage_timings"]),
+            "error": None,
+        })
+    except Exception as e:
+        record["error"] = str(e)
+    record["duration_s"] = round(time.perf_counter() - start, 4)
+    return record
+
+def write_output(checkpoint_path: str, output_path: str):
+    """Converts the checkpoint log into the final Parquet or JSONL file."""
+    records = [
+        {name: record.get(name) for name, _ in RECORD_FIELDS}
+        for record in _read_checkpoint(checkpoint_path).values()
+    ]
+
+    if output_path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output requires pyarrow (pip install pyarrow), or use a .jsonl output.")
+        schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in RECORD_FIELDS])
+        pq.write_table(pa.Table.from_pylist(records, schema=schema), output_path, compression="zstd")
+    else:
+        with open(output_path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    return len(records)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk offline document fraud analysis.")
+    parser.add_argument("input", help="Directory of documents, or a manifest (.txt, or .csv with a 'path' column)")
+    parser.add_argument("--output", required=True, help="Result file (.parquet or .jsonl)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per worker process (default: 1)")
+    parser.add_argument("--outputs", default=None, help="Comma-separated pipeline outputs (default: all)")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.checkpoint.jsonl)")
+    parser.add_argument("--retry-errors", action="store_true", help="Analyse documents that failed in a previous run again")
+    args = parser.parse_args(argv)
+
+    outputs = [name.strip() for name in args.outputs.split(",")] if args.outputs else None
+    # Fail here rather than in every worker's first document. This loads the
+    # pipeline in this process too, which the workers cannot share (spawn).
+    from services import pipeline
+    try:
+        pipeline.plan(outputs)
+    except ValueError as e:
+        parser.error(str(e))
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint.jsonl"
+
+    done = load_checkpoint(checkpoint_path, args.retry_errors)
+    pending = [path for path in discover_inputs(args.input) if path not in done]
+    print(f"{len(done)} documents already done, {len(pending)} to analyse with {args.workers} workers")
+
+    start = time.time()
+    processed = 0
+    # spawn: each worker loads its own models once instead of inheriting a
+    # half-initialised torch runtime from this process
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers, initializer=_init_worker, initargs=(outputs, args.threads)) as pool, \
+            open(checkpoint_path, "a") as checkpoint:
+        for record in pool.imap_unordered(analyze_file, pending, chunksize=1):
+            checkpoint.write(json.dumps(record) + "\n")
+            checkpoint.flush()
+            processed += 1
+            if processed % 100 == 0:
+                rate = processed / (time.time() - start) * 3600
+                print(f"{processed}/{len(pending)} documents ({rate:.0f} docs/hour)")
+
+    total = write_output(checkpoint_path, args.output)
+    elapsed = time.time() - start
+    print(f"Wrote {total} records to {args.output} ({processed} new in {elapsed:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,54 @@
 from celery import Celery
+from kombu import Queue
 import os
+from core.serialization import SERIALIZER_NAME, register_serializer
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 # Initialize Celery
 celery_app = Celery(
     "fraud_detection_tasks",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
+    broker=REDIS_URL,
+    backend=REDIS_URL
 )
 
+# Priority lanes: interactive uploads and bulk backfills are kept apart so
+# a large backfill can never starve interactive traffic.
+INTERACTIVE_QUEUE = "analysis.interactive"
+BULK_QUEUE = "analysis.bulk"
+# Redis list priorities: 0 is dequeued first, 9 last
+PRIORITY_STEPS = list(range(10))
+
+# Binary msgpack+zstd codec for tasks and results; JSON is still accepted
+# so clients that publish or read JSON keep working.
+register_serializer()
+
 # Optional configuration
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    task_serializer=SERIALIZER_NAME,
+    accept_content=[SERIALIZER_NAME, "json"],
+    result_serializer=SERIALIZER_NAME,
+    result_accept_content=[SERIALIZER_NAME, "json"],
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
     task_publish_retry=True,
+    task_queues=[Queue(INTERACTIVE_QUEUE), Queue(BULK_QUEUE)],
+    task_default_queue=INTERACTIVE_QUEUE,
+    task_default_priority=0,
+    broker_transport_options={
+        "priority_steps": PRIORITY_STEPS,
+        "sep": ":",
+        # Always drain queues in declaration order: interactive before bulk
+        "queue_order_strategy": "priority",
+    },
+    # Fetch one task at a time so priorities are honoured across workers
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
 )
 
 # Auto-discover tasks from the services directory
 celery_app.autodiscover_tasks(["services"])
+
+# Worker signal handlers: load models in the parent before the pool forks
+import core.worker_bootstrap  # noqa: E402,F401
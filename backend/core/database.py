@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -6,12 +8,50 @@ import os
 # Use SQLite for local development if no DATABASE_URL is provided
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./fraud_detection.db")
 
+# Connection pool tuning (server databases only)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Prepared statements cached per asyncpg connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        # Transparently replace connections dropped by Postgres or a proxy
+        "pool_pre_ping": True,
+    }
+
+def _async_url(url: str) -> str:
+    """Maps the sync DATABASE_URL onto its async driver (aiosqlite / asyncpg)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return str(parsed.set(drivername="sqlite+aiosqlite"))
+    if backend == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+        return parsed.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)}).render_as_string(hide_password=False)
+    return url
+
 # Fix for SQLite: check_same_thread=False is needed for FastAPI
-if DATABASE_URL.startswith("sqlite"):
+if IS_SQLITE:
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(_async_url(DATABASE_URL))
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **_pool_options())
+    async_engine = create_async_engine(
+        _async_url(DATABASE_URL),
+        connect_args={"statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+        **_pool_options()
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -21,3 +61,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """Async session for `async def` endpoints; never blocks the event loop."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,77 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+class BoundedExecutor:
+    """
+    Runs blocking, CPU-heavy work off the asyncio event loop on a fixed-size
+    thread pool, with admission control: once `max_workers + max_queue` jobs
+    are in flight, new jobs are rejected with 503 and a Retry-After header
+    instead of queueing without bound.
+
+    Threads (rather than processes) are used so jobs share the model
+    singletons already loaded in this process; torch, easyocr and OpenCV
+    release the GIL inside their heavy kernels.
+    """
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int = 5):
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        if not self._admit():
+            raise HTTPException(
+                status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"The {self.name} queue is full. Please retry shortly.",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        try:
+            future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # Release on completion rather than when the awaiting request goes
+        # away, so a disconnected client cannot free a slot that is still busy
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+# Document analysis (OCR, ViT, ELA, spaCy)
+analysis_executor = BoundedExecutor(
+    "analysis",
+    max_workers=int(os.getenv("ANALYSIS_WORKERS", "2")),
+    max_queue=int(os.getenv("ANALYSIS_QUEUE_SIZE", "8"))
+)
+
+# Copilot retrieval is kept on its own pool so it never waits behind uploads
+copilot_executor = BoundedExecutor(
+    "copilot",
+    max_workers=int(os.getenv("COPILOT_WORKERS", "4")),
+    max_queue=int(os.getenv("COPILOT_QUEUE_SIZE", "16")),
+    retry_after=1
+)
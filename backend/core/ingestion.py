@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from typing import Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+# Root of the content-addressed upload store: uploads/ab/cd/<sha256>.<ext>
+STORAGE_ROOT = os.getenv("UPLOAD_DIR", "uploads")
+INCOMING_DIR = os.path.join(STORAGE_ROOT, ".incoming")
+
+DEFAULT_MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024
+# Largest request body on any endpoint, every file of a batch included.
+# Starlette spools a multipart body to its own temporary file before the
+# handler runs, so this, not the per-file limit, bounds the memory and disk
+# a single request can take. It must cover the largest per-tenant limit.
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_MB", "100")) * 1024 * 1024
+# Uploads up to this size stay in memory; larger ones are streamed to disk
+SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MB", "8")) * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+# Magic-byte signatures of the supported formats
+SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"%PDF-", ".pdf"),
+]
+EXTENSION_ALIASES = {".jpeg": ".jpg"}
+SUPPORTED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.pdf']
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+def storage_path(sha256: str, extension: str) -> str:
+    """Sharded location of a stored upload, keyed by its content hash."""
+    return os.path.join(STORAGE_ROOT, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+class IngestedUpload:
+    """
+    An upload that has been validated, hashed and buffered. Small uploads
+    live only in memory; large ones sit in a temporary file inside the
+    upload store until `persist` renames them into place.
+    """
+    def __init__(self, filename: str, extension: str, sha256: str, size: int,
+                 data: Optional[bytes] = None, temp_path: Optional[str] = None):
+        self.filename = filename
+        self.extension = extension
+        self.sha256 = sha256
+        self.size = size
+        self._data = data
+        self._temp_path = temp_path
+        self.path = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._data is not None
+
+    def source(self):
+        """Raw bytes when buffered in memory, otherwise a path on disk."""
+        if self._data is not None:
+            return self._data
+        return self.path or self._temp_path
+
+    def persist(self) -> str:
+        """
+        Stores the upload under its sharded content-addressed path. Files
+        already on disk are moved with a rename, so no bytes are copied.
+        """
+        if self.path:
+            return self.path
+        final_path = storage_path(self.sha256, self.extension)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if self._temp_path:
+            os.replace(self._temp_path, final_path)
+            self._temp_path = None
+        elif not os.path.exists(final_path):
+            # Write next to the target and rename, so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(final_path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._data)
+            os.replace(temp_path, final_path)
+        self.path = final_path
+        return final_path
+
+    def discard(self):
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        self._temp_path = None
+
+def _request_too_large(max_bytes: int) -> str:
+    return f"Request body exceeds the {max_bytes // (1024 * 1024)} MB limit."
+
+class RequestSizeLimitMiddleware:
+    """
+    Rejects request bodies over `max_bytes` before they are spooled: at once
+    from Content-Length, or, for chunked requests, as soon as the bytes
+    received pass the limit.
+    """
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        try:
+            declared = int(content_length) if content_length is not None else None
+        except ValueError:
+            declared = None
+        if declared is not None and declared > self.max_bytes:
+            response = JSONResponse({"detail": _request_too_large(self.max_bytes)}, status_code=413,
+                                    headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside body parsing, so FastAPI answers with it
+                    raise HTTPException(status_code=413, detail=_request_too_large(self.max_bytes))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+async def ingest_upload(file: UploadFile, max_bytes: Optional[int] = None) -> IngestedUpload:
+    """
+    Reads an upload chunk by chunk: validates the declared extension against
+    the magic bytes, enforces the per-file size limit and computes the
+    SHA-256 in the same pass, without reading anything twice. By now
+    Starlette has already received the body (bounded by
+    RequestSizeLimitMiddleware), so the per-file limit bounds what is kept
+    in memory or in the upload store, not what was transferred.
+    """
+    max_bytes = max_bytes or DEFAULT_MAX_UPLOAD_BYTES
+    declared = os.path.splitext(file.filename or "")[1].lower()
+    if declared not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only JPG, PNG, and PDF documents are supported.")
+    declared = EXTENSION_ALIASES.get(declared, declared)
+
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    memory = io.BytesIO()
+    disk = None
+    temp_path = None
+    size = 0
+    extension = None
+
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            if extension is None:
+                extension = sniff_extension(chunk)
+                if extension is None:
+                    raise HTTPException(status_code=415, detail="File content is not a JPG, PNG or PDF document.")
+                if extension != declared:
+                    raise HTTPException(status_code=400, detail=f"File content ({extension}) does not match its extension ({declared}).")
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit.")
+            digest.update(chunk)
+
+            if disk is not None:
+                await loop.run_in_executor(None, disk.write, chunk)
+                continue
+
+            memory.write(chunk)
+            if size > SPOOL_MAX_BYTES:
+                # Too big to keep in memory: continue on disk inside the store,
+                # so persisting it later is a same-filesystem rename
+                os.makedirs(INCOMING_DIR, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(dir=INCOMING_DIR)
+                disk = os.fdopen(fd, "wb")
+                await loop.run_in_executor(None, disk.write, memory.getvalue())
+                memory = None
+    except BaseException:
+        if disk is not None:
+            disk.close()
+            os.remove(temp_path)
+        raise
+
+    if extension is None:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+
+    if disk is not None:
+        await loop.run_in_executor(None, disk.close)
+        return IngestedUpload(file.filename, extension, digest.hexdigest(), size, temp_path=temp_path)
+    return IngestedUpload(file.filename, extension, digest.hexdigest(), size, data=memory.getvalue())
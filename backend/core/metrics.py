@@ -0,0 +1,148 @@
+import os
+import resource
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# When set (before prometheus_client is imported), every process writes its
+# samples there and scrapes aggregate them: uvicorn workers and Celery pool
+# children then all show up on one /metrics endpoint.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Port of the Celery worker's own metrics endpoint (disabled when unset)
+WORKER_METRICS_PORT = os.getenv("WORKER_METRICS_PORT")
+
+# Pipeline stages take from milliseconds (scoring) to tens of seconds (ViT on CPU)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "fraud_stage_duration_seconds", "Wall time of each analysis stage",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+VIT_PATCHES_PER_SECOND = Histogram(
+    "fraud_vit_patches_per_second", "ViT sliding-window throughput per document",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+VIT_PATCHES = Counter("fraud_vit_patches", "ViT patches classified")
+MODEL_LOAD_SECONDS = Gauge(
+    "fraud_model_load_seconds", "Time taken to load each model",
+    ["model"], multiprocess_mode="max"
+)
+CACHE_LOOKUPS = Counter(
+    "fraud_cache_lookups", "Cache lookups by cache and outcome (hit ratio = hit / total)",
+    ["cache", "result"]
+)
+PROCESS_RSS = Gauge(
+    "fraud_process_rss_bytes", "Resident set size of each API or worker process",
+    ["role"], multiprocess_mode="liveall"
+)
+
+class stage_timer:
+    """
+    Shared timing context for analysis stages. Records the duration in the
+    stage histogram and keeps it in `elapsed` for callers that report it too:
+
+        with stage_timer("ocr") as timer:
+            ...
+        timings["ocr"] = timer.elapsed
+    """
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        STAGE_SECONDS.labels(self.stage).observe(self.elapsed)
+        return False
+
+class model_load_timer:
+    """Records how long a model took to load."""
+    def __init__(self, model: str):
+        self.model = model
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        MODEL_LOAD_SECONDS.labels(self.model).set(time.perf_counter() - self._start)
+        return False
+
+def record_vit_throughput(patches: int, seconds: float):
+    VIT_PATCHES.inc(patches)
+    if seconds > 0:
+        VIT_PATCHES_PER_SECOND.observe(patches / seconds)
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not Linux: peak RSS is the best available figure
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def record_process_rss(role: str):
+    PROCESS_RSS.labels(role).set(_rss_bytes())
+
+class QueueDepthCollector:
+    """Celery queue depth per lane and tenant, read from Redis at scrape time."""
+    def collect(self):
+        from core.scheduler import queue_depths
+        try:
+            depths = queue_depths()
+        except Exception as e:
+            print(f"Could not read queue depths: {e}")
+            return
+
+        lanes = GaugeMetricFamily("fraud_queue_depth", "Tasks waiting per priority lane", labels=["lane"])
+        for lane, depth in depths["lanes"].items():
+            lanes.add_metric([lane], depth)
+        yield lanes
+
+        tenants = GaugeMetricFamily("fraud_tenant_tasks", "Queued and running tasks per tenant", labels=["tenant", "state"])
+        for tenant, counts in depths["tenants"].items():
+            tenants.add_metric([tenant, "queued"], counts["queued"])
+            tenants.add_metric([tenant, "running"], counts["running"])
+        yield tenants
+
+# Queue depths live in Redis, not in any process: read once per scrape
+_queue_registry = CollectorRegistry(auto_describe=False)
+_queue_registry.register(QueueDepthCollector())
+
+def _process_registry() -> CollectorRegistry:
+    """This process alone, or every process sharing PROMETHEUS_MULTIPROC_DIR."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    from prometheus_client import multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def render_metrics(role: str):
+    """Prometheus text exposition and content type for the /metrics endpoint."""
+    record_process_rss(role)
+    return generate_latest(_process_registry()) + generate_latest(_queue_registry), CONTENT_TYPE_LATEST
+
+def start_worker_metrics_server():
+    """Serves the worker's metrics (all pool children) on WORKER_METRICS_PORT."""
+    if not WORKER_METRICS_PORT:
+        return
+    if not PROMETHEUS_MULTIPROC_DIR:
+        print("WORKER_METRICS_PORT needs PROMETHEUS_MULTIPROC_DIR to see the pool children; not starting")
+        return
+    from prometheus_client import start_http_server
+    start_http_server(int(WORKER_METRICS_PORT), registry=_process_registry())
+    print(f"Worker metrics on :{WORKER_METRICS_PORT}/metrics")
+
+def mark_process_dead(pid: int):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,46 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import MetaData
+
+def _default_sql(column) -> str:
+    """DEFAULT clause from a scalar Python-side default, so existing rows get it too."""
+    default = column.default
+    if default is None or not default.is_scalar or default.arg is None:
+        return ""
+    value = default.arg
+    if isinstance(value, bool):
+        value = int(value)
+    return f" DEFAULT {value}" if isinstance(value, (int, float)) else f" DEFAULT '{value}'"
+
+def upgrade_schema(engine: Engine, metadata: MetaData):
+    """
+    Brings an existing database up to the models, idempotently: creates
+    missing tables, adds missing columns and creates missing indexes.
+    Columns are only ever added, never altered or dropped, so it is safe to
+    run on every startup (create_all alone never touches existing tables).
+    """
+    # 1. New tables (with their indexes)
+    metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    # Postgres: concurrent workers starting at once must not race on ADD COLUMN
+    if_not_exists = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            # 2. Columns added to existing tables
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{column.name} {column_type}{_default_sql(column)}"
+                ))
+                print(f"Schema upgrade: added column {table.name}.{column.name}")
+
+            # 3. Indexes added to existing tables
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn, checkfirst=True)
+                    print(f"Schema upgrade: created index {index.name}")
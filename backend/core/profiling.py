@@ -0,0 +1,135 @@
+import contextlib
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+from typing import Optional
+import zstandard
+from core.progress import get_redis
+
+# Fraction of analyses profiled without being asked (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# How long captured profiles are kept
+PROFILE_TTL_SECONDS = int(os.getenv("PROFILE_TTL_SECONDS", "86400"))
+# Request header carrying the admin key to ask for a profile of that request.
+# It is separate from X-API-Key, so operators can profile a customer's request.
+PROFILE_HEADER = "X-Profile"
+
+PROFILE_KEY = "profile:{profile_id}"
+
+# Both profilers are process-wide: cProfile cannot run twice at once (from
+# Python 3.12) and the torch profiler records every thread's operators. So
+# only one run per process is profiled at a time; others run unprofiled.
+_profiling = threading.Lock()
+
+def profile_key(profile_id: str) -> str:
+    return PROFILE_KEY.format(profile_id=profile_id)
+
+def should_profile(header_value: Optional[str]) -> bool:
+    """Profiled when X-Profile carries the admin key; otherwise sampled at PROFILE_SAMPLE_RATE."""
+    from core.security import is_admin_key
+    if header_value and is_admin_key(header_value):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+class PipelineProfile:
+    """
+    Captures one pipeline run: cProfile over all Python code, plus the torch
+    profiler's operator summary for the model calls (ViT, Grad-CAM, OCR).
+    """
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.torch_profiler = None
+        self.wall_time = 0.0
+
+    def __enter__(self):
+        try:
+            import torch
+            self.torch_profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            self.torch_profiler.__enter__()
+        except ImportError:
+            self.torch_profiler = None
+        self._start = time.perf_counter()
+        try:
+            self.profiler.enable()
+        except Exception:
+            if self.torch_profiler is not None:
+                self.torch_profiler.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self.wall_time = time.perf_counter() - self._start
+        if self.torch_profiler is not None:
+            self.torch_profiler.__exit__(*exc)
+        return False
+
+    def summary(self, rows: int = 40) -> str:
+        out = io.StringIO()
+        out.write(f"Pipeline wall time: {self.wall_time:.3f}s\n\n")
+        out.write("=== Python (cProfile, by cumulative time) ===\n")
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(rows)
+        if self.torch_profiler is not None:
+            out.write("\n=== Torch operators (by self CPU time) ===\n")
+            out.write(self.torch_profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=rows))
+        return out.getvalue()
+
+    def save(self, profile_id: str):
+        """
+        Stores the text summary and the raw pstats data in Redis, so the API
+        can serve profiles captured on any worker.
+        """
+        self.profiler.create_stats()
+        stats = zstandard.ZstdCompressor().compress(marshal.dumps(self.profiler.stats))
+        key = profile_key(profile_id)
+        pipe = get_redis().pipeline()
+        pipe.hset(key, mapping={"summary": self.summary(), "pstats": stats, "created": time.time()})
+        pipe.expire(key, PROFILE_TTL_SECONDS)
+        pipe.execute()
+
+@contextlib.contextmanager
+def maybe_profile(profile_id: Optional[str]):
+    """
+    Profiles the block when a profile id is given; costs nothing otherwise.
+    A lost profile must never fail the analysis: when another run is being
+    profiled, or a profiler fails to start, the block runs unprofiled.
+    """
+    if profile_id is None:
+        yield
+        return
+    if not _profiling.acquire(blocking=False):
+        print(f"Profile {profile_id} skipped: another run in this process is being profiled")
+        yield
+        return
+    try:
+        profile = PipelineProfile()
+        try:
+            profile.__enter__()
+        except Exception as e:
+            print(f"Profile {profile_id} skipped: {e}")
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.__exit__(None, None, None)
+                try:
+                    profile.save(profile_id)
+                except Exception as e:
+                    print(f"Could not store profile {profile_id}: {e}")
+    finally:
+        _profiling.release()
+
+def load_profile(profile_id: str) -> Optional[dict]:
+    data = get_redis().hgetall(profile_key(profile_id))
+    if not data:
+        return None
+    return {
+        "summary": data[b"summary"].decode(),
+        "pstats": zstandard.ZstdDecompressor().decompress(data[b"pstats"]),
+    }
@@ -0,0 +1,55 @@
+import json
+import os
+import redis
+import redis.asyncio as aioredis
+from core.celery_app import REDIS_URL
+
+# Per-task pub/sub channel used to push progress events to streaming clients
+PROGRESS_CHANNEL = "task-progress:{task_id}"
+# Marks task ids issued by the API: Celery reports an unknown id as PENDING,
+# exactly like a queued task. Kept as long as Celery keeps results.
+SUBMITTED_KEY = "task-submitted:{task_id}"
+SUBMITTED_TTL_S = int(os.getenv("TASK_RECORD_TTL_S", "86400"))
+
+_sync_client = None
+_async_client = None
+
+def progress_channel(task_id: str) -> str:
+    return PROGRESS_CHANNEL.format(task_id=task_id)
+
+def get_redis():
+    """Lazily created synchronous client (Celery workers)."""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(REDIS_URL)
+    return _sync_client
+
+def get_async_redis():
+    """Lazily created asyncio client (FastAPI endpoints)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.Redis.from_url(REDIS_URL)
+    return _async_client
+
+def mark_submitted(task_id: str):
+    get_redis().set(SUBMITTED_KEY.format(task_id=task_id), 1, ex=SUBMITTED_TTL_S)
+
+async def was_submitted(task_id: str) -> bool:
+    return bool(await get_async_redis().exists(SUBMITTED_KEY.format(task_id=task_id)))
+
+def report_progress(task, stage: str, progress: int, message: str):
+    """
+    Stores the stage-level progress on the Celery result backend and pushes
+    the same event to subscribers of the task's progress channel.
+    """
+    meta = {"stage": stage, "progress": progress, "message": message}
+    task.update_state(state='PROGRESS', meta=meta)
+    publish_event(task.request.id, "progress", meta)
+
+def publish_event(task_id: str, event: str, data: dict):
+    payload = json.dumps({"event": event, **data})
+    try:
+        get_redis().publish(progress_channel(task_id), payload)
+    except redis.RedisError as e:
+        # Progress streaming is best-effort; /status still reflects the state
+        print(f"Failed to publish progress for {task_id}: {e}")
@@ -0,0 +1,39 @@
+from collections import Counter
+from typing import Iterable, Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models.schema import ScanDailyRollup
+
+SCORE_BUCKETS = 10
+
+def score_bucket(score: Optional[float]) -> int:
+    """Histogram bucket of a 0-100 confidence score."""
+    return min(max(int((score or 0.0) // (100 / SCORE_BUCKETS)), 0), SCORE_BUCKETS - 1)
+
+def update_daily_rollups(db: Session, records: Iterable[dict]):
+    """
+    Adds a batch of scan records to the daily rollups with one upsert per
+    (tenant, day, label, bucket) group. Runs in the caller's transaction, so
+    rollups and raw records are committed together.
+    Anonymous and unscored scans are not rolled up.
+    """
+    counts = Counter(
+        (r["company_id"], r["timestamp"].date(), r["classification_label"], score_bucket(r["confidence_score"]))
+        for r in records
+        if r["company_id"] is not None and r["classification_label"] is not None
+    )
+    if not counts:
+        return
+
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(ScanDailyRollup).values([
+        {"company_id": company_id, "day": day, "classification_label": label,
+         "score_bucket": bucket, "scan_count": count}
+        for (company_id, day, label, bucket), count in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["company_id", "day", "classification_label", "score_bucket"],
+        set_={"scan_count": ScanDailyRollup.scan_count + stmt.excluded.scan_count}
+    )
+    db.execute(stmt)
@@ -0,0 +1,118 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import insert
+from core.database import SessionLocal
+from core.metrics import stage_timer
+from core.rollups import update_daily_rollups
+from models.schema import ScanRecord
+
+SCAN_LOG_BATCH_SIZE = int(os.getenv("SCAN_LOG_BATCH_SIZE", "200"))
+SCAN_LOG_FLUSH_MS = int(os.getenv("SCAN_LOG_FLUSH_MS", "500"))
+SCAN_LOG_MAX_BUFFER = int(os.getenv("SCAN_LOG_MAX_BUFFER", "50000"))
+
+class ScanLogWriter:
+    """
+    Write-behind buffer for ScanRecord rows. `log` only enqueues, so it adds
+    no latency to the request; a background thread bulk-inserts the buffered
+    rows every `batch_size` records or `flush_ms` milliseconds, whichever
+    comes first.
+
+    The thread is started lazily and restarted after a fork, so the writer
+    can be imported in a Celery parent and used in its pool children.
+    """
+    def __init__(self, session_factory, batch_size: int, flush_ms: int, max_buffer: int):
+        self._session_factory = session_factory
+        self._batch_size = batch_size
+        self._flush_interval = flush_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_buffer)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # Forked child: the parent's thread and buffer did not come along
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="scan-log-writer", daemon=True)
+            self._thread.start()
+
+    def log(self, company_id: Optional[int], filename: Optional[str], final_score: Optional[float],
+            classification: Optional[str], stage_scores: Optional[Dict[str, float]] = None,
+            stage_durations: Optional[Dict[str, float]] = None):
+        self._ensure_started()
+        record = {
+            "timestamp": datetime.utcnow(),
+            "company_id": company_id,
+            "filename": filename,
+            "confidence_score": final_score,
+            "classification_label": classification,
+            "stage_scores": stage_scores or {},
+            "stage_durations": stage_durations or {},
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Never block the response path; losing a log row beats stalling
+            print("Scan log buffer full, dropping record")
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self._flush_interval
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0.01)))
+            except queue.Empty:
+                pass
+            if len(batch) >= self._batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self._flush_interval
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        db = self._session_factory()
+        try:
+            # One multi-row INSERT per batch, plus the matching rollup upserts
+            with stage_timer("db_commit"):
+                db.execute(insert(ScanRecord), batch)
+                update_daily_rollups(db, batch)
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Failed to write {len(batch)} scan records: {e}")
+        finally:
+            db.close()
+
+    def close(self):
+        """Flushes everything still buffered. Called on shutdown."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+def stage_scores(result: dict) -> Dict[str, float]:
+    """Per-stage scores of a pipeline result, for the scan log."""
+    return {
+        name: result[f"{name}_score"]
+        for name in ("ela", "layout", "dl")
+        if result.get(f"{name}_score") is not None
+    }
+
+scan_logger = ScanLogWriter(SessionLocal, SCAN_LOG_BATCH_SIZE, SCAN_LOG_FLUSH_MS, SCAN_LOG_MAX_BUFFER)
+atexit.register(scan_logger.close)
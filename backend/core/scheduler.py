@@ -0,0 +1,118 @@
+import os
+import time
+from typing import Optional
+from core.celery_app import INTERACTIVE_QUEUE, BULK_QUEUE, PRIORITY_STEPS
+from core.progress import get_redis
+
+# Priority lanes. Workers consume them in this order (see celery_app), so
+# interactive uploads are always dequeued before any bulk backfill work.
+INTERACTIVE_LANE = "interactive"
+BULK_LANE = "bulk"
+LANE_QUEUES = {
+    INTERACTIVE_LANE: INTERACTIVE_QUEUE,
+    BULK_LANE: BULK_QUEUE,
+}
+
+# Tenant used for requests that do not carry an API key
+ANONYMOUS_TENANT = "public"
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "4"))
+DEFAULT_WEIGHT = int(os.getenv("TENANT_WEIGHT", "1"))
+# Queued tasks a tenant of weight 1 may have before it drops one priority step
+FAIR_SHARE_STEP = int(os.getenv("TENANT_FAIR_SHARE_STEP", "20"))
+# Running-slot lease; a crashed worker's slot frees itself after this long
+SLOT_LEASE_SECONDS = int(os.getenv("TENANT_SLOT_LEASE_SECONDS", "900"))
+# Queued entries are leased too: a task lost without a revoke stops counting
+# against its tenant after this long
+QUEUED_LEASE_SECONDS = int(os.getenv("TENANT_QUEUED_LEASE_SECONDS", "21600"))
+
+# Tenants that have queued work at some point, for queue_depths
+TENANTS_KEY = "scheduler:tenants"
+
+def _queued_key(tenant: str) -> str:
+    return f"scheduler:queued:{tenant}"
+
+def _running_key(tenant: str) -> str:
+    return f"scheduler:running:{tenant}"
+
+def tenant_key(company) -> str:
+    return str(company.id) if company is not None else ANONYMOUS_TENANT
+
+def lane_queue(lane: str) -> str:
+    if lane not in LANE_QUEUES:
+        raise ValueError(f"Unknown lane '{lane}'. Expected one of: {', '.join(LANE_QUEUES)}")
+    return LANE_QUEUES[lane]
+
+def fair_priority(tenant: str, weight: Optional[int] = None) -> int:
+    """
+    Weighted fair share: the more tasks a tenant already has queued relative
+    to its weight, the lower the priority of its next task. A tenant with a
+    large backfill therefore sinks behind tenants with short queues.
+    """
+    weight = max(weight or DEFAULT_WEIGHT, 1)
+    return min(queued_count(tenant) // (FAIR_SHARE_STEP * weight), PRIORITY_STEPS[-1])
+
+def queued_count(tenant: str) -> int:
+    """Tasks the tenant has queued, not counting expired entries (which are pruned)."""
+    key = _queued_key(tenant)
+    pipe = get_redis().pipeline()
+    pipe.zremrangebyscore(key, 0, time.time() - QUEUED_LEASE_SECONDS)
+    pipe.zcard(key)
+    return pipe.execute()[1]
+
+def mark_enqueued(tenant: str, task_id: str):
+    key = _queued_key(tenant)
+    pipe = get_redis().pipeline()
+    pipe.zadd(key, {task_id: time.time()})
+    # An idle tenant's key disappears on its own
+    pipe.expire(key, QUEUED_LEASE_SECONDS)
+    pipe.sadd(TENANTS_KEY, tenant)
+    pipe.execute()
+
+def mark_dequeued(tenant: str, task_id: str):
+    """Called when the task starts, is revoked, or could not be published."""
+    get_redis().zrem(_queued_key(tenant), task_id)
+
+def acquire_slot(tenant: str, task_id: str, max_concurrency: Optional[int] = None) -> bool:
+    """
+    Claims one of the tenant's concurrent execution slots. Slots are leased
+    so that a worker crash cannot leak them.
+    """
+    limit = max_concurrency or DEFAULT_MAX_CONCURRENCY
+    key = _running_key(tenant)
+    now = time.time()
+    r = get_redis()
+    pipe = r.pipeline()
+    pipe.zremrangebyscore(key, 0, now - SLOT_LEASE_SECONDS)
+    pipe.zadd(key, {task_id: now})
+    pipe.zcard(key)
+    _, _, running = pipe.execute()
+    if running > limit:
+        r.zrem(key, task_id)
+        return False
+    return True
+
+def release_slot(tenant: str, task_id: str):
+    get_redis().zrem(_running_key(tenant), task_id)
+
+def queue_depths() -> dict:
+    """Queue depth per lane and per tenant, plus currently running tasks per tenant."""
+    r = get_redis()
+    lanes = {}
+    for lane, queue in LANE_QUEUES.items():
+        # kombu stores each priority step of a queue under its own list key
+        keys = [queue] + [f"{queue}:{p}" for p in PRIORITY_STEPS[1:]]
+        pipe = r.pipeline()
+        for key in keys:
+            pipe.llen(key)
+        lanes[lane] = sum(pipe.execute())
+
+    tenants = {}
+    now = time.time()
+    for tenant in sorted(member.decode() for member in r.smembers(TENANTS_KEY)):
+        queued = r.zcount(_queued_key(tenant), now - QUEUED_LEASE_SECONDS, "+inf")
+        running = r.zcount(_running_key(tenant), now - SLOT_LEASE_SECONDS, "+inf")
+        if queued or running:
+            tenants[tenant] = {"queued": queued, "running": running}
+
+    return {"lanes": lanes, "tenants": tenants}
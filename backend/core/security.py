@@ -1,16 +1,25 @@
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from fastapi import Security, HTTPException, Depends
 from fastapi.security.api_key import APIKeyHeader
-from sqlalchemy.orm import Session
-from core.database import get_db
+from pydantic import BaseModel
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import get_async_db
+from core.metrics import record_cache_lookup
 from models.schema import ClientCompany
-from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_402_PAYMENT_REQUIRED
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_402_PAYMENT_REQUIRED, HTTP_403_FORBIDDEN
 
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
 async def get_client_company(
     api_key: str = Security(api_key_header),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not api_key:
         raise HTTPException(
@@ -18,23 +27,136 @@ async def get_client_company(
             detail="API Key missing"
         )
     
-    company = db.query(ClientCompany).filter(ClientCompany.api_key == api_key).first()
+    return await _authenticate(api_key, db)
+
+async def get_optional_client_company(
+    api_key: str = Security(api_key_header),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Like get_client_company, but anonymous requests are allowed and yield None.
+    """
+    if not api_key:
+        return None
+    
+    return await _authenticate(api_key, db)
+
+async def get_current_company(
+    api_key: str = Security(api_key_header),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Authenticates without charging a credit, for read-only endpoints such
+    as the scan history.
+    """
+    if not api_key:
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="API Key missing"
+        )
+
+    return await _authenticate(api_key, db, charge=False)
+
+# Operator key for maintenance endpoints; they are disabled when unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+def is_admin_key(api_key: Optional[str]) -> bool:
+    return bool(ADMIN_API_KEY and api_key and hmac.compare_digest(api_key, ADMIN_API_KEY))
+
+async def require_admin(api_key: str = Security(api_key_header)):
+    if not is_admin_key(api_key):
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN,
+            detail="Admin API Key required"
+        )
+
+class AuthenticatedCompany(BaseModel):
+    """Immutable snapshot of the authenticated client company."""
+    id: int
+    name: str
+    credits_remaining: int
+    max_concurrent_tasks: Optional[int] = None
+    scheduling_weight: Optional[int] = None
+    max_upload_mb: Optional[int] = None
+
+# In-process API key cache: api_key -> (expires_at, company or None for unknown keys)
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_NEGATIVE_CACHE_TTL = float(os.getenv("AUTH_NEGATIVE_CACHE_TTL", "5"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+_api_key_cache: "OrderedDict[str, Tuple[float, Optional[AuthenticatedCompany]]]" = OrderedDict()
+_api_key_cache_lock = threading.Lock()
+
+def invalidate_api_key(api_key: str):
+    """Drops a key from the cache, e.g. after it was rotated or its limits changed."""
+    with _api_key_cache_lock:
+        _api_key_cache.pop(api_key, None)
+
+async def _lookup_company(api_key: str, db: AsyncSession) -> Optional[AuthenticatedCompany]:
+    now = time.monotonic()
+    with _api_key_cache_lock:
+        cached = _api_key_cache.get(api_key)
+        if cached and cached[0] > now:
+            _api_key_cache.move_to_end(api_key)
+            record_cache_lookup("api_key", True)
+            return cached[1]
+    record_cache_lookup("api_key", False)
+
+    company = (await db.execute(
+        select(ClientCompany).where(ClientCompany.api_key == api_key)
+    )).scalars().first()
+    snapshot = None
+    ttl = AUTH_NEGATIVE_CACHE_TTL
+    if company:
+        snapshot = AuthenticatedCompany(
+            id=company.id,
+            name=company.name,
+            credits_remaining=company.credits_remaining,
+            max_concurrent_tasks=company.max_concurrent_tasks,
+            scheduling_weight=company.scheduling_weight,
+            max_upload_mb=company.max_upload_mb
+        )
+        ttl = AUTH_CACHE_TTL
+
+    with _api_key_cache_lock:
+        _api_key_cache[api_key] = (now + ttl, snapshot)
+        _api_key_cache.move_to_end(api_key)
+        while len(_api_key_cache) > AUTH_CACHE_SIZE:
+            _api_key_cache.popitem(last=False)
+    return snapshot
+
+async def _consume_credit(company_id: int, db: AsyncSession) -> Optional[int]:
+    """
+    Atomically deducts one credit in a single conditional UPDATE. Returns the
+    remaining balance, or None when the company has no credits left, so
+    concurrent requests can never overspend.
+    """
+    row = (await db.execute(
+        update(ClientCompany)
+        .where(ClientCompany.id == company_id, ClientCompany.credits_remaining > 0)
+        .values(credits_remaining=ClientCompany.credits_remaining - 1)
+        .returning(ClientCompany.credits_remaining)
+    )).first()
+    await db.commit()
+    return row[0] if row else None
+
+async def _authenticate(api_key: str, db: AsyncSession, charge: bool = True) -> AuthenticatedCompany:
+    company = await _lookup_company(api_key, db)
     
     if not company:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="Invalid API Key"
         )
-    
-    if company.credits_remaining <= 0:
+
+    if not charge:
+        return company
+
+    # Deduct 1 credit
+    remaining = await _consume_credit(company.id, db)
+    if remaining is None:
         raise HTTPException(
             status_code=HTTP_402_PAYMENT_REQUIRED,
             detail="Insufficient credits. Please top up your account."
         )
     
-    # Deduct 1 credit
-    company.credits_remaining -= 1
-    db.commit()
-    db.refresh(company)
-    
-    return company
+    return company.model_copy(update={"credits_remaining": remaining})
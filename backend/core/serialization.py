@@ -0,0 +1,59 @@
+import threading
+import msgpack
+import numpy as np
+import zstandard
+from kombu.serialization import register
+
+# Compact binary codec for Celery messages and results: msgpack with native
+# NumPy arrays and raw bytes, compressed with zstd.
+SERIALIZER_NAME = "msgpack-zstd"
+CONTENT_TYPE = "application/x-msgpack-zstd"
+
+ZSTD_LEVEL = 3
+_NDARRAY_EXT = 1
+
+# zstd (de)compressor objects must not be shared between threads
+_local = threading.local()
+
+def _compressor():
+    if not hasattr(_local, "compressor"):
+        _local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.compressor, _local.decompressor
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        array = np.ascontiguousarray(obj)
+        payload = msgpack.packb((array.dtype.str, array.shape, array.tobytes()), use_bin_type=True)
+        return msgpack.ExtType(_NDARRAY_EXT, payload)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+def _ext_hook(code, data):
+    if code == _NDARRAY_EXT:
+        dtype, shape, buffer = msgpack.unpackb(data, raw=False)
+        return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+    return msgpack.ExtType(code, data)
+
+def dumps(obj) -> bytes:
+    compressor, _ = _compressor()
+    return compressor.compress(msgpack.packb(obj, default=_default, use_bin_type=True))
+
+def loads(data) -> object:
+    _, decompressor = _compressor()
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    # Frames always carry their content size, so no output bound is needed
+    return msgpack.unpackb(decompressor.decompress(data), ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+def register_serializer():
+    register(
+        SERIALIZER_NAME,
+        dumps,
+        loads,
+        content_type=CONTENT_TYPE,
+        content_encoding="binary"
+    )
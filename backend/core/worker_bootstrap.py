@@ -0,0 +1,65 @@
+import gc
+import os
+import time
+from celery.signals import task_postrun, worker_init, worker_process_init, worker_process_shutdown
+from core.metrics import mark_process_dead, record_process_rss, start_worker_metrics_server
+
+# Intra-op threads per pool child. Defaults to an even split of the cores
+# across the prefork pool so children do not oversubscribe the CPU.
+WORKER_TORCH_THREADS = os.getenv("WORKER_TORCH_THREADS")
+
+_threads_per_child = 1
+
+@worker_init.connect
+def preload_models(sender=None, **kwargs):
+    """
+    Runs once in the worker's parent process, before the prefork pool starts.
+    Every model is loaded here so children inherit the weights through fork
+    and share them copy-on-write instead of loading their own copies.
+    """
+    global _threads_per_child
+    import torch
+
+    concurrency = getattr(sender, "concurrency", None) or os.cpu_count() or 1
+    if WORKER_TORCH_THREADS:
+        _threads_per_child = int(WORKER_TORCH_THREADS)
+    else:
+        _threads_per_child = max(1, (os.cpu_count() or 1) // concurrency)
+
+    # Keep the parent single-threaded: an OpenMP pool started before fork
+    # is not usable in the children and can deadlock them.
+    torch.set_num_threads(1)
+
+    start = time.time()
+    # Importing the task module instantiates the easyocr, ViT and spaCy singletons
+    import services.tasks  # noqa: F401
+    print(f"Preloaded models in {time.time() - start:.1f}s "
+          f"({concurrency} children x {_threads_per_child} threads)")
+
+    # Move everything allocated so far into the permanent generation. The
+    # collector then never touches (and dirties) these pages in the children.
+    gc.collect()
+    gc.freeze()
+
+    start_worker_metrics_server()
+
+@worker_process_init.connect
+def configure_child(**kwargs):
+    """Runs in each pool child right after fork."""
+    import torch
+    import cv2
+
+    torch.set_num_threads(_threads_per_child)
+    cv2.setNumThreads(_threads_per_child)
+
+@worker_process_shutdown.connect
+def flush_scan_log(**kwargs):
+    """Writes out the scan records still buffered in this child."""
+    from core.scan_logger import scan_logger
+    scan_logger.close()
+    mark_process_dead(os.getpid())
+
+@task_postrun.connect
+def sample_memory(**kwargs):
+    """Per-child RSS after each task, to spot copy-on-write growth and leaks."""
+    record_process_rss("worker")
@@ -0,0 +1,440 @@
+"""
+Self-contained end-to-end load test.
+
+Starts the FastAPI app and a Celery worker as subprocesses against local
+stand-ins: an in-process fakeredis TCP server and a throwaway SQLite
+database. It then replays a seeded arrival pattern of mixed JPG and PDF
+uploads (synthetic, see benchmarks/synthetic.py) against /analyze,
+/status, /upload and /analyze-batch, and reports:
+  - throughput and latency percentiles per endpoint
+  - queue wait versus service time for Celery tasks
+  - peak and mean RSS of the API and worker process trees
+
+Usage (from backend/):
+    python -m loadtest.run --pattern poisson --rate 1 --duration 120 --worker-concurrency 2
+    python -m loadtest.run --pattern burst --rate 4 --mix analyze=1 --output loadtest.json
+    python -m loadtest.run --redis-url redis://localhost:6379/0   # use a real Redis instead
+
+Requires httpx and fakeredis (pip install httpx "fakeredis[lua]").
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("The load test requires httpx (pip install httpx).")
+
+from benchmarks.synthetic import generate_document
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("analyze", "upload", "batch")
+PATTERNS = ("constant", "poisson", "burst", "ramp")
+LOADTEST_API_KEY = "loadtest-key"
+
+# --- Stand-ins and processes ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_fake_redis() -> str:
+    """Runs a fakeredis TCP server in a daemon thread and returns its URL."""
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        sys.exit('No --redis-url given and fakeredis is missing (pip install "fakeredis[lua]").')
+    port = _free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    # Connection handler threads must not keep the harness alive at exit
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+def seed_database(database_url: str):
+    """Creates the schema and a client company with enough credits for the whole run."""
+    os.environ["DATABASE_URL"] = database_url
+    from core.database import Base, SessionLocal, engine
+    from models.schema import ClientCompany
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add(ClientCompany(name="Load Test", api_key=LOADTEST_API_KEY, credits_remaining=10 ** 9,
+                             max_concurrent_tasks=1000))
+        db.commit()
+    finally:
+        db.close()
+
+class Stack:
+    """The API and worker subprocesses plus their shared environment."""
+    def __init__(self, redis_url: str, workdir: str, api_port: int, worker_concurrency: int, api_workers: int):
+        self.env = {
+            **os.environ,
+            "REDIS_URL": redis_url,
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+            "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+            "PYTHONPATH": BACKEND_DIR,
+        }
+        self.api_port = api_port
+        self.worker_concurrency = worker_concurrency
+        self.api_workers = api_workers
+        self.log_path = os.path.join(workdir, "stack.log")
+        self.api = None
+        self.worker = None
+
+    def start(self, timeout: float):
+        seed_database(self.env["DATABASE_URL"])
+        log = open(self.log_path, "ab")
+        self.api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.api_port),
+             "--workers", str(self.api_workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.env, stdout=log, stderr=subprocess.STDOUT
+        )
+        self.worker = subprocess.Popen(
+            [sys.executable, "-m", "celery", "-A", "core.celery_app", "worker",
+             "-Q", "analysis.interactive,analysis.bulk", "--concurrency", str(self.worker_concurrency),
+             "--loglevel", "warning"],
+            cwd=BACKEND_DIR, env=self.env, stdout=log, stderr=subprocess.STDOUT
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            for process in (self.api, self.worker):
+                if process.poll() is not None:
+                    self.stop()
+                    sys.exit(f"A service exited during startup; see {self.log_path}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{self.api_port}/", timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(1)
+        self.stop()
+        sys.exit(f"API did not come up within {timeout:.0f}s; see {self.log_path}")
+
+    def stop(self):
+        for process in (self.worker, self.api):
+            if process is not None and process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in (self.worker, self.api):
+            if process is not None:
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+# --- Memory sampling ---
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def _process_tree(pid: int) -> List[int]:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+class MemorySampler(threading.Thread):
+    """Samples the total RSS of the API and worker process trees every `interval` seconds."""
+    def __init__(self, roots: Dict[str, int], interval: float = 1.0):
+        super().__init__(name="memory-sampler", daemon=True)
+        self.roots = roots
+        self.interval = interval
+        self.samples: Dict[str, List[int]] = defaultdict(list)
+        self._finished = threading.Event()
+
+    def run(self):
+        while not self._finished.wait(self.interval):
+            for role, pid in self.roots.items():
+                self.samples[role].append(sum(_rss_kb(p) for p in _process_tree(pid)))
+
+    def stop(self) -> dict:
+        self._finished.set()
+        self.join()
+        return {
+            role: {"peak_mb": round(max(values) / 1024, 1), "mean_mb": round(statistics.fmean(values) / 1024, 1)}
+            for role, values in self.samples.items() if values
+        }
+
+# --- Workload ---
+
+def arrival_times(pattern: str, rate: float, duration: float, rng: random.Random) -> List[float]:
+    """Request start offsets (seconds) for an average of `rate` requests per second."""
+    times, t = [], 0.0
+    if pattern == "constant":
+        return [i / rate for i in range(int(duration * rate))]
+    if pattern == "poisson":
+        while True:
+            t += rng.expovariate(rate)
+            if t >= duration:
+                return times
+            times.append(t)
+    if pattern == "burst":
+        # 10 s cycles: everything arrives in the first 2 s of each cycle
+        cycle, on = 10.0, 2.0
+        while t < duration:
+            count = int(rate * cycle)
+            times.extend(t + rng.uniform(0, on) for _ in range(count))
+            t += cycle
+        return sorted(x for x in times if x < duration)
+    # ramp: linearly from 0 to 2x rate over the run (same average)
+    while True:
+        current = max(2 * rate * t / duration, rate * 0.05)
+        t += rng.expovariate(current)
+        if t >= duration:
+            return times
+        times.append(t)
+
+def build_documents(count: int, pdf_ratio: float, seed: int) -> List[tuple]:
+    """A small pool of synthetic (filename, bytes, content type) uploads, reused round-robin."""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        forgery = rng.choice(["none", "splice", "recompress"])
+        resolution = rng.choice(["low", "medium"])
+        if rng.random() < pdf_ratio:
+            doc = generate_document(seed + i, resolution, pages=rng.choice([1, 2]), forgery=forgery)
+            documents.append((f"{doc.name}.pdf", doc.to_pdf(), "application/pdf"))
+        else:
+            doc = generate_document(seed + i, resolution, forgery=forgery)
+            documents.append((f"{doc.name}.jpg", doc.to_jpeg(), "image/jpeg"))
+    return documents
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.queue_wait: List[float] = []
+        self.service_time: List[float] = []
+
+    def ok(self, endpoint: str, seconds: float):
+        self.latencies[endpoint].append(seconds)
+
+    def error(self, endpoint: str, reason: str):
+        self.errors[endpoint][reason] += 1
+
+async def run_analyze(client: httpx.AsyncClient, document: tuple, recorder: Recorder):
+    """/analyze, then follow the task over /stream and fetch the result from /status."""
+    submitted = time.perf_counter()
+    response = await client.post("/analyze", files={"file": document})
+    if response.status_code != 200:
+        recorder.error("analyze", str(response.status_code))
+        return
+    recorder.ok("analyze", time.perf_counter() - submitted)
+    task_id = response.json()["task_id"]
+
+    started = None
+    final_status = None
+    async with client.stream("GET", f"/stream/{task_id}", params={"images": False}, timeout=None) as stream:
+        async for line in stream.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):])
+            # The worker reports the "init" stage as soon as it picks the task up
+            if started is None and event.get("stage") is not None:
+                started = time.perf_counter()
+            if event["status"] in ("SUCCESS", "FAILURE"):
+                final_status = event["status"]
+                break
+    finished = time.perf_counter()
+
+    if final_status != "SUCCESS":
+        recorder.error("task", final_status or "stream closed")
+        return
+    started = started or finished
+    recorder.queue_wait.append(started - submitted)
+    recorder.service_time.append(finished - started)
+    recorder.ok("task_end_to_end", finished - submitted)
+
+    status_start = time.perf_counter()
+    status = await client.get(f"/status/{task_id}", params={"images": False})
+    if status.status_code == 200:
+        recorder.ok("status", time.perf_counter() - status_start)
+    else:
+        recorder.error("status", str(status.status_code))
+
+async def run_upload(client: httpx.AsyncClient, document: tuple, recorder: Recorder):
+    start = time.perf_counter()
+    response = await client.post("/upload", files={"file": document}, headers={"X-API-Key": LOADTEST_API_KEY})
+    if response.status_code == 200:
+        recorder.ok("upload", time.perf_counter() - start)
+    else:
+        recorder.error("upload", str(response.status_code))
+
+async def run_batch(client: httpx.AsyncClient, documents: List[tuple], recorder: Recorder):
+    start = time.perf_counter()
+    async with client.stream("POST", "/analyze-batch", files=[("files", d) for d in documents], timeout=None) as response:
+        if response.status_code != 200:
+            recorder.error("batch", str(response.status_code))
+            return
+        async for line in response.aiter_lines():
+            if line and json.loads(line)["type"] == "error":
+                recorder.error("batch_document", "error")
+    recorder.ok("batch", time.perf_counter() - start)
+
+async def replay(base_url: str, arrivals: List[float], mix: Dict[str, float], documents: List[tuple],
+                 batch_size: int, seed: int) -> Recorder:
+    rng = random.Random(seed)
+    recorder = Recorder()
+    endpoints, weights = zip(*mix.items())
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(600.0, connect=10.0), limits=limits) as client:
+        async def one(index: int, endpoint: str):
+            try:
+                if endpoint == "analyze":
+                    await run_analyze(client, documents[index % len(documents)], recorder)
+                elif endpoint == "upload":
+                    await run_upload(client, documents[index % len(documents)], recorder)
+                else:
+                    pack = [documents[(index + i) % len(documents)] for i in range(batch_size)]
+                    await run_batch(client, pack, recorder)
+            except httpx.HTTPError as e:
+                recorder.error(endpoint, type(e).__name__)
+
+        start = time.perf_counter()
+        tasks = []
+        for index, offset in enumerate(arrivals):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(index, rng.choices(endpoints, weights)[0])))
+        await asyncio.gather(*tasks)
+    return recorder
+
+# --- Report ---
+
+def _percentiles(values: List[float]) -> dict:
+    values = sorted(values)
+    def pct(p):
+        return round(values[min(len(values) - 1, int(p * len(values)))], 3)
+    return {"p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99), "max": round(values[-1], 3)}
+
+def build_report(recorder: Recorder, elapsed: float, memory: dict, settings: dict) -> dict:
+    endpoints = {}
+    for name in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = recorder.latencies.get(name, [])
+        endpoints[name] = {
+            "completed": len(values),
+            "errors": dict(recorder.errors.get(name, {})),
+            "throughput_per_s": round(len(values) / elapsed, 3),
+            "latency_s": _percentiles(values) if values else None,
+        }
+    return {
+        "settings": settings,
+        "elapsed_s": round(elapsed, 1),
+        "endpoints": endpoints,
+        "tasks": {
+            "queue_wait_s": _percentiles(recorder.queue_wait) if recorder.queue_wait else None,
+            "service_time_s": _percentiles(recorder.service_time) if recorder.service_time else None,
+        },
+        "memory": memory,
+    }
+
+def print_report(report: dict):
+    print(f"\nRan for {report['elapsed_s']}s with {report['settings']}")
+    print(f"\n{'endpoint':<18}{'done':>7}{'errors':>8}{'req/s':>8}{'p50':>9}{'p90':>9}{'p99':>9}")
+    for name, stats in report["endpoints"].items():
+        latency = stats["latency_s"] or {"p50": 0, "p90": 0, "p99": 0}
+        errors = sum(stats["errors"].values())
+        print(f"{name:<18}{stats['completed']:>7}{errors:>8}{stats['throughput_per_s']:>8.2f}"
+              f"{latency['p50']:>8.2f}s{latency['p90']:>8.2f}s{latency['p99']:>8.2f}s")
+    for label, key in (("queue wait", "queue_wait_s"), ("service time", "service_time_s")):
+        stats = report["tasks"][key]
+        if stats:
+            print(f"task {label:<13} p50 {stats['p50']:.2f}s  p90 {stats['p90']:.2f}s  p99 {stats['p99']:.2f}s")
+    for role, stats in report["memory"].items():
+        print(f"{role:<6} RSS peak {stats['peak_mb']:.0f} MB, mean {stats['mean_mb']:.0f} MB")
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}'. Expected any of: {', '.join(ENDPOINTS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end load test against local Redis and SQLite stand-ins.")
+    parser.add_argument("--pattern", choices=PATTERNS, default="poisson", help="Arrival pattern (default: poisson)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Average requests per second (default: 1)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of arrivals (default: 60)")
+    parser.add_argument("--mix", default="analyze=0.6,upload=0.3,batch=0.1",
+                        help="Endpoint weights (default: analyze=0.6,upload=0.3,batch=0.1)")
+    parser.add_argument("--pdf-ratio", type=float, default=0.3, help="Share of PDF uploads (default: 0.3)")
+    parser.add_argument("--batch-size", type=int, default=3, help="Documents per /analyze-batch call (default: 3)")
+    parser.add_argument("--documents", type=int, default=12, help="Distinct synthetic documents (default: 12)")
+    parser.add_argument("--worker-concurrency", type=int, default=2, help="Celery pool processes (default: 2)")
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn worker processes (default: 1)")
+    parser.add_argument("--redis-url", help="Use this Redis instead of an in-process fakeredis server")
+    parser.add_argument("--startup-timeout", type=float, default=300.0, help="Seconds to wait for model loading")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rng = random.Random(args.seed)
+    arrivals = arrival_times(args.pattern, args.rate, args.duration, rng)
+    documents = build_documents(args.documents, args.pdf_ratio, args.seed)
+    print(f"{len(arrivals)} requests over {args.duration:.0f}s ({args.pattern}), {len(documents)} documents")
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    redis_url = args.redis_url or start_fake_redis()
+    stack = Stack(redis_url, workdir, _free_port(), args.worker_concurrency, args.api_workers)
+    print(f"Starting API and worker (logs: {stack.log_path})...")
+    stack.start(args.startup_timeout)
+
+    sampler = MemorySampler({"api": stack.api.pid, "worker": stack.worker.pid})
+    sampler.start()
+    try:
+        start = time.perf_counter()
+        recorder = asyncio.run(replay(f"http://127.0.0.1:{stack.api_port}", arrivals, mix, documents,
+                                      args.batch_size, args.seed))
+        elapsed = time.perf_counter() - start
+    finally:
+        memory = sampler.stop()
+        stack.stop()
+
+    settings = {
+        "pattern": args.pattern, "rate": args.rate, "duration": args.duration, "mix": mix,
+        "worker_concurrency": args.worker_concurrency, "api_workers": args.api_workers,
+    }
+    report = build_report(recorder, elapsed, memory, settings)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+if __name__ == "__main__":
+    main()
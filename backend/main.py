@@ -1,32 +1,50 @@
 import os
+import re
+import json
+import base64
+import asyncio
+import hashlib
 import uuid
-import shutil
-import numpy as np
-import cv2
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+import logging
+import redis
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from typing import List, Optional
-from sqlalchemy.orm import Session
-
-from core.database import engine, Base, get_db, SessionLocal
-from core.security import get_client_company
-from models.schema import ClientCompany, ScanRecord
-from services.ocr_service import ocr_service
-from services.fraud_detector import calculate_ela, image_to_base64
-from services.layout_analyzer import layout_analyzer
-from services.scoring_engine import calculate_final_score
-from services.entity_extractor import entity_extractor, ExtractedData
+from typing import Dict, List, Optional
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database import engine, Base, SessionLocal, get_async_db
+from core.migrations import upgrade_schema
+from core.security import get_client_company, get_optional_client_company, get_current_company, require_admin, AuthenticatedCompany
+from core.scheduler import INTERACTIVE_LANE, LANE_QUEUES, queue_depths
+from core.executor import analysis_executor, copilot_executor
+from core.ingestion import STORAGE_ROOT, DEFAULT_MAX_UPLOAD_BYTES, IngestedUpload, RequestSizeLimitMiddleware, ingest_upload
+from core.scan_logger import scan_logger, stage_scores
+from core.rollups import SCORE_BUCKETS
+from core.metrics import render_metrics
+from core.profiling import PROFILE_HEADER, should_profile, maybe_profile, load_profile
+from models.schema import ClientCompany, ScanRecord, ScanDailyRollup
+from services.entity_extractor import ExtractedData
 from services.kyc_validator import kyc_validator, ValidationResult
-from services.dl_detector import dl_detector, dl_image_to_base64
-from services.pdf_processor import pdf_processor, PDFMetadata
-from services.rag_service import rag_service, ChatResponse
-from services.tasks import analyze_document_task
+from services.pdf_processor import PDFMetadata
+from services.pipeline import GRID_STAGES, run_pipeline, build_result, parse_outputs, plan
+from services.heatmaps import ScoreGrid, pyramid_info, render_image, render_tile
+from services.retriever import LRUCache
+from services.rag_service import rag_service, ChatResponse, IngestionReport
+from services.tasks import submit_analysis
 from core.celery_app import celery_app
+from core.progress import get_redis, get_async_redis, progress_channel, was_submitted
 from celery.result import AsyncResult
 
-# Create tables on startup
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Create tables and add new columns/indexes to existing ones on startup
+upgrade_schema(engine, Base.metadata)
 
 # Dependency to check/init test data
 def init_db():
@@ -52,28 +70,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Bounds every request body before Starlette spools it
+app.add_middleware(RequestSizeLimitMiddleware)
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+@app.on_event("shutdown")
+def shutdown_executors():
+    # Let in-flight analyses finish before the worker exits, then flush
+    # the scan records they buffered
+    analysis_executor.shutdown()
+    copilot_executor.shutdown()
+    scan_logger.close()
+
+os.makedirs(STORAGE_ROOT, exist_ok=True)
 
 class FraudResult(BaseModel):
+    # Fields are empty when the stage producing them was not requested
     filename: str
-    final_score: float
-    classification: str
-    ela_score: float
-    layout_score: float
-    is_fraud: bool
-    ocr_data: List[dict]
-    heatmap_base64: str
-    dl_heatmap_base64: str
-    dl_score: float
+    final_score: Optional[float] = None
+    classification: Optional[str] = None
+    ela_score: Optional[float] = None
+    layout_score: Optional[float] = None
+    is_fraud: Optional[bool] = None
+    ocr_data: List[dict] = []
+    dl_score: Optional[float] = None
+    # Raw heatmaps by stage (ela, dl, gradcam): `shape` uint8 cells in
+    # base64 `values` (0-255 for scores 0-1), laid over `box` in page pixels.
+    # Rendered PNGs come from /results/{result_id}/artifacts and /tiles.
+    score_grids: Dict[str, dict] = {}
+    # Synchronous results only: the id their heatmaps are rendered under
+    # (the upload's sha256) and the PNG URL of each heatmap
+    result_id: Optional[str] = None
+    artifact_urls: Dict[str, str] = {}
     extracted_entities: Optional[ExtractedData] = None
     pdf_metadata: Optional[PDFMetadata] = None
-    ai_explanation_64: Optional[str] = None
-
-class BatchFraudResult(BaseModel):
-    results: List[FraudResult]
-    kyc_validation: ValidationResult
+    # Detected document type, and the router's evidence, cost and narrowed stages
+    document_type: Optional[str] = None
+    routing: Optional[dict] = None
+    # Page sizes and per-stage working scales; OCR boxes are in original
+    # pixels, score grids in `page_size` pixels
+    normalization: Optional[dict] = None
+    stages: List[str] = []
+    stage_timings: Dict[str, float] = {}
 
 class CopilotRequest(BaseModel):
     question: str
@@ -82,230 +119,662 @@ class TaskResponse(BaseModel):
     task_id: str
     status: str
 
+def _upload_limit(company: Optional[AuthenticatedCompany]) -> int:
+    """Per-tenant upload size limit in bytes."""
+    if company is not None and company.max_upload_mb:
+        return company.max_upload_mb * 1024 * 1024
+    return DEFAULT_MAX_UPLOAD_BYTES
+
 @app.post("/analyze", response_model=TaskResponse)
 async def analyze_document_simple(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    lane: str = INTERACTIVE_LANE,
+    outputs: Optional[str] = None,
+    x_profile: Optional[str] = Header(None, alias=PROFILE_HEADER),
+    company: Optional[AuthenticatedCompany] = Depends(get_optional_client_company)
 ):
     """
     Triggers an asynchronous Celery task to analyze the document.
+    `lane` selects the priority lane ("interactive" or "bulk"); tasks are
+    scheduled fairly per client company. `outputs` selects the pipeline
+    outputs to compute, as for /upload. Profiled runs (X-Profile header
+    with the admin key, or sampling) are stored under the task id.
     """
-    file_id = str(uuid.uuid4())
-    extension = os.path.splitext(file.filename)[1].lower()
-    
-    if extension not in ['.jpg', '.jpeg', '.png', '.pdf']:
-        raise HTTPException(status_code=400, detail="Only JPG, PNG, and PDF documents are supported.")
+    if lane not in LANE_QUEUES:
+        raise HTTPException(status_code=400, detail=f"Unknown lane '{lane}'. Expected one of: {', '.join(LANE_QUEUES)}")
+    requested = _requested_outputs(outputs)
 
-    saved_path = os.path.join(UPLOAD_DIR, f"{file_id}{extension}")
-    with open(saved_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    upload = await ingest_upload(file, _upload_limit(company))
+    # The worker needs the file on disk: small uploads are written once,
+    # large ones are renamed into the store
+    saved_path = await asyncio.get_running_loop().run_in_executor(None, upload.persist)
     
     # Trigger Celery task
-    task = analyze_document_task.delay(saved_path, file.filename)
+    task = submit_analysis(saved_path, file.filename, company=company, lane=lane, outputs=requested,
+                           profile=should_profile(x_profile))
     
     return TaskResponse(task_id=task.id, status="Processing")
 
-@app.get("/status/{task_id}")
-async def get_task_status(task_id: str):
+def _jsonable_result(result):
+    """Base64-encodes the raw image bytes carried in binary task results."""
+    if isinstance(result, dict):
+        return {k: _jsonable_result(v) for k, v in result.items()}
+    if isinstance(result, list):
+        return [_jsonable_result(v) for v in result]
+    if isinstance(result, (bytes, bytearray)):
+        return base64.b64encode(result).decode()
+    return result
+
+def _without_images(result: dict) -> dict:
+    """Drops the score grids from a result, listing the artifacts to fetch instead."""
+    light = dict(result)
+    light["artifacts"] = [name for name in GRID_STAGES if name in (light.get("score_grids") or {})]
+    light["score_grids"] = {}
+    return light
+
+def _task_status_payload(task_result: AsyncResult, images: bool = True) -> dict:
     """
-    Check the status of a Celery task and return results if finished.
+    Maps a Celery task state onto the /status response body. With
+    `images=False` a finished result carries only artifact names; the
+    heatmaps are then fetched one by one from /results/{task_id}/artifacts.
     """
-    task_result = AsyncResult(task_id, app=celery_app)
-    
-    if task_result.state == 'PENDING':
+    state = task_result.state
+    if state == 'PENDING':
         return {"status": "Processing", "progress": 0}
-    elif task_result.state == 'PROGRESS':
-        return {"status": "Processing", "progress": 50, "message": task_result.info.get('message', '')}
-    elif task_result.state == 'SUCCESS':
+    elif state == 'RETRY':
+        return {"status": "Processing", "progress": 0, "message": "Waiting for a free worker slot..."}
+    elif state in ('STARTED', 'PROGRESS'):
+        info = task_result.info if isinstance(task_result.info, dict) else {}
+        return {
+            "status": "Processing",
+            "progress": info.get('progress', 0),
+            "stage": info.get('stage'),
+            "message": info.get('message', '')
+        }
+    elif state == 'SUCCESS':
+        result = task_result.result
+        if not images and isinstance(result, dict):
+            result = _without_images(result)
         return {
             "status": "SUCCESS",
-            "result": task_result.result
+            "progress": 100,
+            "result": _jsonable_result(result)
         }
-    elif task_result.state == 'FAILURE':
+    elif state == 'FAILURE':
         return {
             "status": "FAILURE",
             "error": str(task_result.info)
         }
     
-    return {"status": task_result.state}
+    return {"status": state}
+
+def _status_etag(task_id: str, payload: dict, images: bool = True) -> str:
+    # Finished results never change, so the state alone identifies them;
+    # in-flight tasks are versioned by their current stage and progress.
+    if payload["status"] in ("SUCCESS", "FAILURE"):
+        version = payload["status"]
+    else:
+        version = f"{payload['status']}:{payload.get('stage')}:{payload.get('progress')}"
+    digest = hashlib.sha1(f"{task_id}:{version}:{images}".encode()).hexdigest()[:16]
+    return f'"{digest}"'
+
+@app.get("/status/{task_id}")
+async def get_task_status(task_id: str, request: Request, response: Response, images: bool = True):
+    """
+    Check the status of a Celery task and return results if finished.
+    `images=false` leaves the heatmaps out of the result.
+    Supports conditional requests via ETag / If-None-Match.
+    """
+    task_result = AsyncResult(task_id, app=celery_app)
+    payload = _task_status_payload(task_result, images)
+    
+    etag = _status_etag(task_id, payload, images)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    return payload
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, ViT throughput, model
+    load times, cache lookups, queue depths and process RSS. With
+    PROMETHEUS_MULTIPROC_DIR set, this covers every API and worker process
+    sharing that directory.
+    """
+    content, content_type = await asyncio.get_running_loop().run_in_executor(None, render_metrics, "api")
+    return Response(content=content, media_type=content_type)
+
+@app.get("/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str, format: str = "text"):
+    """
+    A captured pipeline profile, by task id (or X-Profile-Id for /upload):
+    the cProfile and torch operator summary as text, or `format=pstats` for
+    the raw stats file (e.g. for snakeviz).
+    """
+    if format not in ("text", "pstats"):
+        raise HTTPException(status_code=400, detail="format must be 'text' or 'pstats'")
+    profile = await asyncio.get_running_loop().run_in_executor(None, load_profile, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile stored for this id")
+    if format == "pstats":
+        return Response(
+            content=profile["pstats"],
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'}
+        )
+    return Response(content=profile["summary"], media_type="text/plain")
+
+@app.get("/queues", dependencies=[Depends(require_admin)])
+async def get_queue_depths():
+    """
+    Queue depth per priority lane and per tenant (queued and running tasks).
+    Admin only: it lists tenant ids.
+    """
+    return queue_depths()
+
+# Longest a single /stream connection is held open; clients reconnect (or
+# poll /status) after its `timeout` event
+STREAM_MAX_SECONDS = int(os.getenv("STREAM_MAX_SECONDS", "600"))
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/stream/{task_id}")
+async def stream_task_status(task_id: str, images: bool = True):
+    """
+    Server-Sent Events stream of stage-level progress for a Celery task,
+    terminated by a single `result` (or `error`) event, or by a `timeout`
+    event after STREAM_MAX_SECONDS. `images` is as for /status.
+    Unknown or expired task ids get a 404.
+    """
+    if AsyncResult(task_id, app=celery_app).state == 'PENDING' and not await was_submitted(task_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired task")
+
+    async def event_stream():
+        deadline = asyncio.get_running_loop().time() + STREAM_MAX_SECONDS
+        pubsub = get_async_redis().pubsub()
+        # Subscribe before inspecting the state so no event can slip between the two
+        await pubsub.subscribe(progress_channel(task_id))
+        try:
+            payload = _task_status_payload(AsyncResult(task_id, app=celery_app), images)
+            while payload["status"] not in ("SUCCESS", "FAILURE"):
+                yield _sse("progress", payload)
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    yield _sse("timeout", payload)
+                    return
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(15.0, remaining))
+                if message is None:
+                    # Keep-alive comment for proxies, then re-check in case the task was lost
+                    yield ": keep-alive\n\n"
+                    payload = _task_status_payload(AsyncResult(task_id, app=celery_app), images)
+                    continue
+                event = json.loads(message["data"])
+                if event.get("event") == "done":
+                    payload = _task_status_payload(AsyncResult(task_id, app=celery_app), images)
+                else:
+                    payload = {
+                        "status": "Processing",
+                        "progress": event.get("progress", 0),
+                        "stage": event.get("stage"),
+                        "message": event.get("message", "")
+                    }
+
+            if payload["status"] == "SUCCESS":
+                yield _sse("result", payload)
+            else:
+                yield _sse("error", payload)
+        finally:
+            await pubsub.unsubscribe(progress_channel(task_id))
+            await pubsub.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
+# Decoded score grids of recently viewed results, and their rendered tiles.
+# Results are immutable, so neither cache needs invalidating.
+score_grid_cache = LRUCache(int(os.getenv("SCORE_GRID_CACHE_SIZE", "256")), name="score_grids")
+tile_cache = LRUCache(int(os.getenv("TILE_CACHE_SIZE", "4096")), name="heatmap_tiles")
+
+# Score grids of synchronous results (/upload, /analyze-batch) are kept in
+# Redis under the upload's sha256, so any API process can render them.
+# Defaults to Celery's own result lifetime.
+SYNC_RESULT_TTL_S = int(os.getenv("SYNC_RESULT_TTL_S", "86400"))
+SYNC_GRIDS_KEY = "score-grids:{result_id}"
+_SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+IMMUTABLE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+def _artifact_urls(result_id: str, score_grids: dict) -> Dict[str, str]:
+    return {name: f"/results/{result_id}/artifacts/{name}" for name in GRID_STAGES if name in score_grids}
+
+def _store_score_grids(result_id: str, score_grids: dict):
+    """
+    Keeps the (base64) grids of a synchronous result for the artifact and
+    tile endpoints. The same file always yields the same grids, so a later
+    request for other outputs only adds fields.
+    """
+    if not score_grids:
+        return
+    key = SYNC_GRIDS_KEY.format(result_id=result_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hset(key, mapping={name: json.dumps(grid) for name, grid in score_grids.items()})
+        pipe.expire(key, SYNC_RESULT_TTL_S)
+        pipe.execute()
+    except redis.RedisError as e:
+        # Heatmaps are best-effort; the scores are returned regardless
+        logger.warning("Failed to store score grids for %s: %s", result_id, e)
+
+def _load_score_grids(result_id: str) -> Dict[str, ScoreGrid]:
+    if _SHA256_RE.fullmatch(result_id):
+        stored = {
+            name.decode(): json.loads(value)
+            for name, value in get_redis().hgetall(SYNC_GRIDS_KEY.format(result_id=result_id)).items()
+        }
+        if not stored:
+            raise HTTPException(status_code=404, detail="No stored result with this id")
+    else:
+        task_result = AsyncResult(result_id, app=celery_app)
+        if task_result.state != 'SUCCESS':
+            raise HTTPException(status_code=404, detail="No finished result for this task")
+        stored = (task_result.result or {}).get("score_grids") or {}
+    return {key: ScoreGrid.from_dict(value) for key, value in stored.items()}
+
+def _score_grid(result_id: str, name: str) -> ScoreGrid:
+    """
+    One score grid of a finished task (by task id) or synchronous result
+    (by result id), raising 404 when there is none.
+    """
+    if name not in GRID_STAGES:
+        raise HTTPException(status_code=404, detail=f"Unknown artifact '{name}'. Expected one of: {', '.join(GRID_STAGES)}")
+    grids = score_grid_cache.get(result_id)
+    # A synchronous result can gain grids when the same file is analysed again
+    if grids is None or name not in grids:
+        grids = _load_score_grids(result_id)
+        score_grid_cache.put(result_id, grids)
+    if name not in grids:
+        raise HTTPException(status_code=404, detail=f"Artifact '{name}' was not produced for this result")
+    return grids[name]
+
+@app.get("/results/{result_id}/artifacts/{name}")
+async def get_result_artifact(result_id: str, name: str, width: Optional[int] = None):
+    """
+    One heatmap (`ela`, `dl` or `gradcam`) of a finished task, or of a
+    synchronous result by its `result_id`, as a PNG rendered from its score
+    grid at `width` pixels (default 1024, never wider than the page).
+    Results are immutable, so the response may be cached indefinitely.
+    """
+    if width is not None and not 16 <= width <= 4096:
+        raise HTTPException(status_code=400, detail="width must be between 16 and 4096")
+    grid = _score_grid(result_id, name)
+    content = await asyncio.get_running_loop().run_in_executor(None, render_image, grid, width)
+    return Response(content=content, media_type="image/png", headers=IMMUTABLE_HEADERS)
+
+@app.get("/results/{result_id}/tiles/{name}")
+async def get_tile_pyramid(result_id: str, name: str):
+    """
+    Deep-zoom layout of a heatmap: page size, tile size and levels. Tiles
+    are fetched from /results/{result_id}/tiles/{name}/{level}/{col}_{row}.png.
+    """
+    grid = _score_grid(result_id, name)
+    return {**pyramid_info(grid.page_size), "url": f"/results/{result_id}/tiles/{name}/{{level}}/{{col}}_{{row}}.png"}
+
+@app.get("/results/{result_id}/tiles/{name}/{level}/{col}_{row}.png")
+async def get_heatmap_tile(result_id: str, name: str, level: int, col: int, row: int):
+    """One heatmap tile, rendered on first request and then served from the cache."""
+    key = (result_id, name, level, col, row)
+    content = tile_cache.get(key)
+    if content is None:
+        grid = _score_grid(result_id, name)
+        try:
+            content = await asyncio.get_running_loop().run_in_executor(None, render_tile, grid, level, col, row)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        tile_cache.put(key, content)
+    return Response(content=content, media_type="image/png", headers=IMMUTABLE_HEADERS)
+
+def _requested_outputs(outputs: Optional[str]) -> List[str]:
+    """Parses and validates the comma-separated `outputs` parameter."""
+    requested = parse_outputs(outputs)
+    try:
+        plan(requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return requested
+
+def _analyze_upload(upload: IngestedUpload, outputs: List[str], company_id: Optional[int] = None,
+                    profile_id: Optional[str] = None) -> FraudResult:
+    """
+    Runs the stages needed for `outputs` on an ingested upload, straight
+    from memory for small files, and logs the scan (write-behind).
+    The heatmaps stay renderable under the upload's sha256 (`result_id`).
+    With `profile_id`, the run is profiled and stored under that id.
+    Blocking and CPU-heavy: call it through the analysis executor.
+    """
+    with maybe_profile(profile_id):
+        ctx = run_pipeline(upload.source(), upload.extension, upload.filename, outputs)
+    result = build_result(ctx, base64_values=True)
+    _store_score_grids(upload.sha256, result["score_grids"])
+    result["result_id"] = upload.sha256
+    result["artifact_urls"] = _artifact_urls(upload.sha256, result["score_grids"])
+    scan_logger.log(
+        company_id=company_id,
+        filename=upload.filename,
+        final_score=result["final_score"],
+        classification=result["classification"],
+        stage_scores=stage_scores(result),
+        stage_durations=result["stage_timings"]
+    )
+    return FraudResult(**result)
 
 @app.post("/upload", response_model=FraudResult)
 async def upload_document(
+    response: Response,
     file: UploadFile = File(...),
-    company: ClientCompany = Depends(get_client_company),
-    db: Session = Depends(get_db)
+    outputs: Optional[str] = None,
+    x_profile: Optional[str] = Header(None, alias=PROFILE_HEADER),
+    company: AuthenticatedCompany = Depends(get_client_company)
 ):
-    # 1. Save File
-    file_id = str(uuid.uuid4())
-    extension = os.path.splitext(file.filename)[1].lower()
-    
-    if extension not in ['.jpg', '.jpeg', '.png', '.pdf']:
-        raise HTTPException(status_code=400, detail="Only JPG, PNG, and PDF documents are supported.")
+    """
+    Synchronous analysis. `outputs` is a comma-separated subset of the
+    pipeline outputs (pdf_meta, ocr, layout, ela, dl, gradcam, ner, score);
+    only the stages they need are run. Defaults to all. A profiled run
+    returns its profile id in the X-Profile-Id header.
+    """
+    requested = _requested_outputs(outputs)
+    profile_id = None
+    if should_profile(x_profile):
+        profile_id = uuid.uuid4().hex
+        response.headers["X-Profile-Id"] = profile_id
 
-    saved_path = os.path.join(UPLOAD_DIR, f"{file_id}{extension}")
-    with open(saved_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # 1. Validate, hash and buffer the upload
+    upload = await ingest_upload(file, _upload_limit(company))
     
+    def analyze():
+        if not upload.in_memory:
+            # Large uploads are kept in the store rather than a temp file
+            upload.persist()
+        return _analyze_upload(upload, requested, company.id, profile_id)
+
     try:
-        # 2. PDF Handling
-        pdf_metadata = None
-        processing_path = saved_path
-        
-        if extension == '.pdf':
-            pdf_metadata = pdf_processor.extract_metadata(saved_path)
-            images = pdf_processor.convert_to_images(saved_path)
-            if not images:
-                raise HTTPException(status_code=500, detail="Failed to convert PDF to image.")
-            temp_img_path = os.path.join(UPLOAD_DIR, f"{file_id}_page1.jpg")
-            images[0].save(temp_img_path, "JPEG")
-            processing_path = temp_img_path
-
-        # 3. OCR and Layout Analysis
-        ocr_results = ocr_service.extract_text(processing_path)
-        layout_score = layout_analyzer.analyze_spatial_consistency(ocr_results)
-        
-        # 4. Visual Fraud Detection
-        ela_image, ela_score = calculate_ela(processing_path)
-        heatmap_base64 = image_to_base64(ela_image)
-        
-        dl_image, dl_score = dl_detector.sliding_window_inference(processing_path)
-        dl_heatmap_base64 = dl_image_to_base64(dl_image)
-        
-        # 5. Final Scoring
-        final_score, classification = calculate_final_score(ela_score, layout_score, dl_score)
-        
-        # 6. NLP Entity Extraction
-        extracted_entities = entity_extractor.extract(ocr_results)
-        
-        # 7. Log Scan Record to DB
-        scan_log = ScanRecord(
-            confidence_score=final_score,
-            classification_label=classification,
-            company_id=company.id
-        )
-        db.add(scan_log)
-        db.commit()
-        
-        return FraudResult(
-            filename=file.filename,
-            final_score=final_score,
-            classification=classification,
-            ela_score=round(float(ela_score), 4),
-            layout_score=round(float(layout_score), 4),
-            dl_score=round(float(dl_score), 4),
-            is_fraud=classification != "Authentic" or (pdf_metadata.is_suspicious if pdf_metadata else False),
-            ocr_data=ocr_results,
-            heatmap_base64=heatmap_base64,
-            dl_heatmap_base64=dl_heatmap_base64,
-            extracted_entities=extracted_entities,
-            pdf_metadata=pdf_metadata,
-            ai_explanation_64=dl_image_to_base64(dl_detector.generate_explanation(processing_path)) if dl_score > 0.2 else None
-        )
+        # 2. Analysis runs on the bounded executor, never on the event loop
+        return await analysis_executor.run(analyze)
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        # Optional: Clean up saved file after processing
-        # if os.path.exists(saved_path): os.remove(saved_path)
-        pass
+        upload.discard()
 
-@app.post("/analyze-batch", response_model=BatchFraudResult)
+@app.post("/analyze-batch")
 async def analyze_batch(
+    request: Request,
     files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db)
+    outputs: Optional[str] = None,
+    company: Optional[AuthenticatedCompany] = Depends(get_optional_client_company)
 ):
     """
     Multi-document batch analysis with KYC cross-validation.
+
+    Documents are analysed concurrently and each result is streamed the
+    moment it is ready, as NDJSON (or as Server-Sent Events when the client
+    accepts text/event-stream). Messages, in completion order:
+      {"type": "result", "index": i, "result": FraudResult}
+      {"type": "error", "index": i, "filename": ..., "error": ...}
+    and finally one {"type": "kyc_validation", "kyc_validation": ValidationResult}.
     """
     if len(files) < 2:
         raise HTTPException(status_code=400, detail="At least two documents are required for KYC cross-validation.")
+    # Cross-validation always needs the extracted entities
+    requested = _requested_outputs(outputs)
+    if "ner" not in requested:
+        requested.append("ner")
+
+    # 1. Validate, hash and buffer every upload; invalid files are skipped
+    uploads = []
 
-    results = []
-    extracted_docs_data = []
+    def discard_uploads():
+        for upload in uploads:
+            upload.discard()
 
-    for file in files:
-        # 1. Save File
-        file_id = str(uuid.uuid4())
-        extension = os.path.splitext(file.filename)[1].lower()
-        if extension not in ['.jpg', '.jpeg', '.png', '.pdf']:
-            continue
+    try:
+        for file in files:
+            try:
+                uploads.append(await ingest_upload(file, _upload_limit(company)))
+            except HTTPException as e:
+                print(f"Skipping {file.filename}: {e.detail}")
+    except BaseException:
+        discard_uploads()
+        raise
+    company_id = company.id if company is not None else None
+
+    # A single batch never holds more than the pool's worker count, so it
+    # cannot trip the executor's admission control on its own
+    batch_slots = asyncio.Semaphore(analysis_executor.max_workers)
+
+    async def analyze_one(index: int, upload: IngestedUpload):
+        async with batch_slots:
+            try:
+                if not upload.in_memory:
+                    await asyncio.get_running_loop().run_in_executor(None, upload.persist)
+                return index, upload, await analysis_executor.run(_analyze_upload, upload, requested, company_id), None
+            except HTTPException as e:
+                return index, upload, None, e.detail
+            except Exception as e:
+                print(f"Error processing {upload.filename}: {e}")
+                return index, upload, None, str(e)
+
+    use_sse = "text/event-stream" in request.headers.get("accept", "")
 
-        saved_path = os.path.join(UPLOAD_DIR, f"{file_id}{extension}")
-        with open(saved_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    def encode(message: dict) -> str:
+        if use_sse:
+            return _sse(message["type"], message)
+        return json.dumps(message) + "\n"
 
+    async def result_stream():
+        # 2. Fan out across the analysis pool; stream results as they finish
+        pending = [asyncio.create_task(analyze_one(i, u)) for i, u in enumerate(uploads)]
+        extracted_docs_data = {}
         try:
-            # 2. PDF Handling
-            pdf_metadata = None
-            processing_path = saved_path
-            
-            if extension == '.pdf':
-                pdf_metadata = pdf_processor.extract_metadata(saved_path)
-                images = pdf_processor.convert_to_images(saved_path)
-                if images:
-                    temp_img_path = os.path.join(UPLOAD_DIR, f"{file_id}_page1.jpg")
-                    images[0].save(temp_img_path, "JPEG")
-                    processing_path = temp_img_path
-
-            # 3. Visual Fraud Analysis
-            ocr_results = ocr_service.extract_text(processing_path)
-            layout_score = layout_analyzer.analyze_spatial_consistency(ocr_results)
-            ela_image, ela_score = calculate_ela(processing_path)
-            heatmap_base64 = image_to_base64(ela_image)
-            
-            # Deep Learning Visual Analysis
-            dl_image, dl_score = dl_detector.sliding_window_inference(processing_path)
-            dl_heatmap_base64 = dl_image_to_base64(dl_image)
-            
-            final_score, classification = calculate_final_score(ela_score, layout_score, dl_score)
-
-            # 4. NLP Entity Extraction
-            extracted_entities = entity_extractor.extract(ocr_results)
-            extracted_docs_data.append(extracted_entities)
-
-            results.append(FraudResult(
-                filename=file.filename,
-                final_score=final_score,
-                classification=classification,
-                ela_score=round(float(ela_score), 4),
-                layout_score=round(float(layout_score), 4),
-                dl_score=round(float(dl_score), 4),
-                is_fraud=classification != "Authentic" or (pdf_metadata.is_suspicious if pdf_metadata else False),
-                ocr_data=ocr_results,
-                heatmap_base64=heatmap_base64,
-                dl_heatmap_base64=dl_heatmap_base64,
-                extracted_entities=extracted_entities,
-                pdf_metadata=pdf_metadata,
-                ai_explanation_64=dl_image_to_base64(dl_detector.generate_explanation(processing_path)) if dl_score > 0.2 else None
-            ))
-        except Exception as e:
-            print(f"Error processing {file.filename}: {e}")
-            continue
-
-    # 4. KYC Cross-Validation (between first two valid documents)
-    if len(extracted_docs_data) >= 2:
-        val_result = kyc_validator.validate(extracted_docs_data[0], extracted_docs_data[1])
-    else:
-        val_result = ValidationResult(consistency_score=0, mismatches=["Not enough valid documents"], is_valid=False)
+            for next_done in asyncio.as_completed(pending):
+                index, upload, result, error = await next_done
+                if result is None:
+                    yield encode({"type": "error", "index": index, "filename": upload.filename, "error": error})
+                    continue
+                extracted_docs_data[index] = result.extracted_entities
+                yield encode({"type": "result", "index": index, "result": jsonable_encoder(result)})
+        finally:
+            for task in pending:
+                task.cancel()
+            # Uploads the analyses did not persist (errors, disconnects) leave no temp files
+            discard_uploads()
+
+        # 3. KYC Cross-Validation (across all valid documents, in upload order)
+        valid_docs = [extracted_docs_data[i] for i in sorted(extracted_docs_data)]
+        if len(valid_docs) >= 2:
+            val_result = kyc_validator.validate_many(valid_docs)
+        else:
+            val_result = ValidationResult(consistency_score=0, mismatches=["Not enough valid documents"], is_valid=False)
+        yield encode({"type": "kyc_validation", "kyc_validation": jsonable_encoder(val_result)})
 
-    return BatchFraudResult(
-        results=results,
-        kyc_validation=val_result
+    return StreamingResponse(
+        result_stream(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also covers a stream that never started; discarding twice is harmless
+        background=BackgroundTask(discard_uploads)
     )
 
+class CrossValidationRequest(BaseModel):
+    # Finished /analyze tasks, in document order
+    task_ids: List[str]
+
+@app.post("/kyc/cross-validate", response_model=ValidationResult)
+async def cross_validate(request: CrossValidationRequest):
+    """
+    KYC cross-validation of documents already analysed through /analyze.
+    Clients submit each document as its own task, concurrently, and call
+    this once every task has finished.
+    """
+    if len(request.task_ids) < 2:
+        raise HTTPException(status_code=400, detail="At least two documents are required for KYC cross-validation.")
+
+    docs = []
+    for task_id in request.task_ids:
+        task_result = AsyncResult(task_id, app=celery_app)
+        if task_result.state != 'SUCCESS':
+            raise HTTPException(status_code=409, detail=f"Task {task_id} has not finished successfully")
+        entities = (task_result.result or {}).get("extracted_entities")
+        if not entities:
+            raise HTTPException(status_code=400, detail=f"Task {task_id} has no extracted entities; request the 'ner' output")
+        docs.append(ExtractedData(**entities))
+    return kyc_validator.validate_many(docs)
+
+class ScanItem(BaseModel):
+    id: int
+    timestamp: datetime
+    filename: Optional[str] = None
+    confidence_score: Optional[float] = None
+    classification_label: Optional[str] = None
+    stage_scores: Dict[str, float] = {}
+    stage_durations: Dict[str, float] = {}
+
+class ScanPage(BaseModel):
+    items: List[ScanItem]
+    next_cursor: Optional[str] = None
+
+class DailyScanSummary(BaseModel):
+    day: date
+    total: int
+    by_label: Dict[str, int]
+    # Scan counts per 10-point score bucket: [0-10%, 10-20%, ..., 90-100%]
+    score_histogram: List[int]
+
+MAX_SCAN_PAGE_SIZE = 500
+
+def _encode_cursor(scan: ScanRecord) -> str:
+    raw = f"{scan.timestamp.isoformat()}|{scan.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, scan_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(scan_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/scans", response_model=ScanPage)
+async def list_scans(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    label: Optional[str] = None,
+    company: AuthenticatedCompany = Depends(get_current_company),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Scan history of the calling company, newest first. Pages are keyed on
+    (timestamp, id) rather than offsets, so every page is a single index
+    range scan however deep the client pages. Pass `next_cursor` back as
+    `cursor` to get the next page.
+    """
+    if not 1 <= limit <= MAX_SCAN_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SCAN_PAGE_SIZE}")
+
+    query = select(ScanRecord).where(ScanRecord.company_id == company.id)
+    if since is not None:
+        query = query.where(ScanRecord.timestamp >= since)
+    if until is not None:
+        query = query.where(ScanRecord.timestamp < until)
+    if label is not None:
+        query = query.where(ScanRecord.classification_label == label)
+    if cursor:
+        query = query.where(tuple_(ScanRecord.timestamp, ScanRecord.id) < tuple_(*_decode_cursor(cursor)))
+    # One extra row tells whether there is a next page
+    query = query.order_by(ScanRecord.timestamp.desc(), ScanRecord.id.desc()).limit(limit + 1)
+
+    scans = (await db.execute(query)).scalars().all()
+    next_cursor = _encode_cursor(scans[limit - 1]) if len(scans) > limit else None
+    return ScanPage(
+        items=[
+            ScanItem(
+                id=scan.id,
+                timestamp=scan.timestamp,
+                filename=scan.filename,
+                confidence_score=scan.confidence_score,
+                classification_label=scan.classification_label,
+                stage_scores=scan.stage_scores or {},
+                stage_durations=scan.stage_durations or {}
+            )
+            for scan in scans[:limit]
+        ],
+        next_cursor=next_cursor
+    )
+
+@app.get("/scans/rollups", response_model=List[DailyScanSummary])
+async def scan_rollups(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    company: AuthenticatedCompany = Depends(get_current_company),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Daily scan counts per classification label and score histogram for the
+    calling company, from `start` to `end` inclusive (default: the last 30
+    days). Served from the pre-aggregated rollup table only.
+    """
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    rows = (await db.execute(
+        select(ScanDailyRollup)
+        .where(ScanDailyRollup.company_id == company.id, ScanDailyRollup.day.between(start, end))
+        .order_by(ScanDailyRollup.day)
+    )).scalars().all()
+
+    days: Dict[date, DailyScanSummary] = {}
+    for row in rows:
+        summary = days.setdefault(row.day, DailyScanSummary(
+            day=row.day, total=0, by_label={}, score_histogram=[0] * SCORE_BUCKETS
+        ))
+        summary.total += row.scan_count
+        summary.by_label[row.classification_label] = summary.by_label.get(row.classification_label, 0) + row.scan_count
+        summary.score_histogram[row.score_bucket] += row.scan_count
+    return list(days.values())
+
 @app.post("/copilot-chat", response_model=ChatResponse)
 async def copilot_chat(request: CopilotRequest):
     """
     RAG-based Analyst Copilot Chat.
     """
     try:
-        response = rag_service.query(request.question)
+        response = await copilot_executor.run(rag_service.query, request.question)
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/copilot/reindex", response_model=IngestionReport, dependencies=[Depends(require_admin)])
+async def reindex_policies():
+    """
+    Re-indexes the policy folder without a restart. Only new or edited
+    chunks are embedded, so this is cheap when little has changed.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, rag_service.sync_policies)
+
 @app.get("/")
 async def root():
     return {"message": "AI Document Fraud Detection API is running"}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from core.database import Base
@@ -10,6 +10,11 @@ class ClientCompany(Base):
     name = Column(String, unique=True, index=True)
     api_key = Column(String, unique=True, index=True)
     credits_remaining = Column(Integer, default=100)
+    # Scheduling: concurrent analysis tasks allowed and fair-share weight
+    max_concurrent_tasks = Column(Integer, default=4)
+    scheduling_weight = Column(Integer, default=1)
+    # Upload size limit; falls back to MAX_UPLOAD_MB when unset
+    max_upload_mb = Column(Integer, nullable=True)
 
     scans = relationship("ScanRecord", back_populates="company")
 
@@ -21,5 +26,28 @@ class ScanRecord(Base):
     confidence_score = Column(Float)
     classification_label = Column(String)
     company_id = Column(Integer, ForeignKey("client_companies.id"))
+    filename = Column(String, nullable=True)
+    # Per-stage scores ({"ela": .., "layout": .., "dl": ..}) and durations in seconds
+    stage_scores = Column(JSON, nullable=True)
+    stage_durations = Column(JSON, nullable=True)
 
     company = relationship("ClientCompany", back_populates="scans")
+
+    __table_args__ = (
+        # Serves per-tenant history queries and keyset pagination by (timestamp, id)
+        Index("ix_scan_records_company_timestamp", "company_id", "timestamp", "id"),
+    )
+
+class ScanDailyRollup(Base):
+    """
+    Incrementally maintained per-tenant daily counts, one row per
+    classification label and score bucket (0-9 for 0-10%, ..., 90-100%),
+    so dashboards never scan the raw scan_records table.
+    """
+    __tablename__ = "scan_daily_rollups"
+
+    company_id = Column(Integer, ForeignKey("client_companies.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    classification_label = Column(String, primary_key=True)
+    score_bucket = Column(Integer, primary_key=True)
+    scan_count = Column(Integer, nullable=False, default=0)
@@ -1,105 +1,128 @@
 import torch
 import torch.nn as nn
 import timm
-from PIL import Image
 import numpy as np
-import cv2
-import io
-import base64
+import os
+import time
 from torchvision import transforms
 from .explainability import XAIExplainer
+from .image_io import load_image
+from .model_server import get_model_client
+from core.metrics import model_load_timer, record_vit_throughput
+
+# Patches per ViT forward pass
+VIT_BATCH_SIZE = int(os.getenv("VIT_BATCH_SIZE", "16"))
 
 class DeepFraudDetector:
     def __init__(self, model_name="vit_tiny_patch16_224", device=None):
-        self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Initializing Deep Learning Detector on {self.device}...")
-        
-        # Load pre-trained model
-        # Using a tiny ViT for performance since we are doing sliding window on CPU/low-end GPU
-        self.model = timm.create_model(model_name, pretrained=True, num_classes=2)
-        self.model.to(self.device)
-        self.model.eval()
-        
         self.transform = transforms.Compose([
             transforms.Resize((224, 224)),
             transforms.ToTensor(),
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
+
+        # With a model server on this node, the ViT lives there
+        self.client = get_model_client()
+        if self.client is not None:
+            print("Deep Learning Detector served by the model server")
+            self.model = None
+            self.explainer = None
+            return
+
+        self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
+        print(f"Initializing Deep Learning Detector on {self.device}...")
+        
+        # Load pre-trained model
+        # Using a tiny ViT for performance since we are doing sliding window on CPU/low-end GPU
+        with model_load_timer("vit"):
+            self.model = timm.create_model(model_name, pretrained=True, num_classes=2)
+            self.model.to(self.device)
+            self.model.eval()
         
         # Initialize XAI Explainer
         self.explainer = XAIExplainer(self.model)
 
-    def sliding_window_inference(self, image_path, patch_size=256, stride=128):
+    def classify_patches(self, patches, batch_size=VIT_BATCH_SIZE):
+        """Forgery probability (class 1) of each patch in a (N, 3, 224, 224) batch."""
+        probs = []
+        with torch.no_grad():
+            for start in range(0, len(patches), batch_size):
+                outputs = self.model(patches[start:start + batch_size].to(self.device))
+                probs.append(torch.softmax(outputs, dim=1)[:, 1].cpu().numpy())
+        return np.concatenate(probs)
+
+    def patch_scores(self, img, patch_size=256, stride=128, classify=None, batch_size=VIT_BATCH_SIZE):
         """
-        Performs patch-based inference to detect localized tampering.
+        Forgery probability of every patch, as a (rows, cols) grid. Patches
+        are transformed and classified a batch at a time, so memory stays
+        flat whatever the page size; `classify` replaces the local model
+        (the model server passes its cross-request batcher).
         """
-        img = Image.open(image_path).convert('RGB')
+        classify = classify or self.classify_patches
+        w, h = img.size
+        cols = (w - patch_size) // stride + 1
+        rows = (h - patch_size) // stride + 1
+        positions = [(i, j) for i in range(rows) for j in range(cols)]
+
+        heatmap_grid = np.zeros((rows, cols))
+        start = time.perf_counter()
+        for offset in range(0, len(positions), batch_size):
+            chunk = positions[offset:offset + batch_size]
+            patches = torch.stack([
+                self.transform(img.crop((j * stride, i * stride, j * stride + patch_size, i * stride + patch_size)))
+                for i, j in chunk
+            ])
+            for (i, j), prob in zip(chunk, classify(patches)):
+                heatmap_grid[i, j] = prob
+        record_vit_throughput(len(positions), time.perf_counter() - start)
+        return heatmap_grid
+
+    def sliding_window_grid(self, image_path, patch_size=256, stride=128):
+        """
+        Patch-based inference to detect localized tampering. Returns the
+        (rows, cols) grid of patch forgery probabilities and their mean.
+        """
+        img = load_image(image_path)
         w, h = img.size
-        
-        # Initialize score map
-        # We'll use a smaller grid and then upscale for efficiency
         cols = (w - patch_size) // stride + 1
         rows = (h - patch_size) // stride + 1
         
         if cols <= 0 or rows <= 0:
             # Image smaller than patch size, just run once on the whole thing (resized)
-            return self.single_inference(img), 0.5
+            prob = self.single_inference(img)
+            return np.array([[prob]]), float(prob)
 
-        heatmap_grid = np.zeros((rows, cols))
-        
-        with torch.no_grad():
-            for i in range(rows):
-                for j in range(cols):
-                    left = j * stride
-                    top = i * stride
-                    right = left + patch_size
-                    bottom = top + patch_size
-                    
-                    patch = img.crop((left, top, right, bottom))
-                    input_tensor = self.transform(patch).unsqueeze(0).to(self.device)
-                    
-                    outputs = self.model(input_tensor)
-                    probs = torch.softmax(outputs, dim=1)
-                    # Use class 1 as "forgery" probability
-                    forgery_prob = probs[0][1].item()
-                    heatmap_grid[i, j] = forgery_prob
+        if self.client is not None:
+            _, heatmap_grid = self.client.call("vit", np.asarray(img), patch_size=patch_size, stride=stride)
+        else:
+            heatmap_grid = self.patch_scores(img, patch_size, stride)
 
         # Average probability across all patches for the combined score
-        avg_score = float(np.mean(heatmap_grid))
-        
-        # Generate high-resolution heatmap
-        heatmap_resized = cv2.resize(heatmap_grid, (w, h), interpolation=cv2.INTER_LINEAR)
-        heatmap_normalized = np.uint8(255 * heatmap_resized)
-        heatmap_color = cv2.applyColorMap(heatmap_normalized, cv2.COLORMAP_JET)
-        
-        # Convert to RGB for PIL/Base64
-        heatmap_rgb = cv2.cvtColor(heatmap_color, cv2.COLOR_BGR2RGB)
-        return Image.fromarray(heatmap_rgb), avg_score
+        return heatmap_grid, float(np.mean(heatmap_grid))
 
     def single_inference(self, pil_img):
         """Fallback for small images"""
+        if self.client is not None:
+            prob, _ = self.client.call("vit_single", np.asarray(pil_img))
+            return prob
         with torch.no_grad():
             input_tensor = self.transform(pil_img).unsqueeze(0).to(self.device)
             outputs = self.model(input_tensor)
             probs = torch.softmax(outputs, dim=1)
             return probs[0][1].item()
 
-    def generate_explanation(self, image_path):
+    def explanation_grid(self, image_path):
         """
-        Generates a Grad-CAM explanation image for the whole document.
+        Raw Grad-CAM of the whole document, as a (224, 224) grid in [0, 1].
         """
-        img = Image.open(image_path).convert('RGB')
+        img = load_image(image_path)
+        if self.client is not None:
+            _, grayscale_cam = self.client.call("gradcam", np.asarray(img))
+            return grayscale_cam
         input_tensor = self.transform(img).unsqueeze(0).to(self.device)
         # Enable gradients for Grad-CAM
         input_tensor.requires_grad = True
-        
-        explanation_img = self.explainer.generate_explanation(input_tensor, img)
-        return explanation_img
-
-def dl_image_to_base64(image):
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+        return self.explainer.grayscale_cam(input_tensor)
 
 # Singleton instance
 dl_detector = DeepFraudDetector()
@@ -0,0 +1,195 @@
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel
+
+# Set to "false" to send every document through the generic pipeline
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+# Below this score, or this close to the runner-up, the document is "generic"
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.5"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.15"))
+# OCR lines from the top of the page checked for keywords
+ROUTER_OCR_LINES = int(os.getenv("ROUTER_OCR_LINES", "12"))
+# Long side of the thumbnails: text rows need more pixels than a face
+THUMBNAIL_SIDE = 768
+FACE_THUMBNAIL_SIDE = 320
+
+@dataclass(frozen=True)
+class DocumentProfile:
+    """How the pipeline treats one document type."""
+    name: str
+    # "page" runs the ViT over the whole page in overlapping patches,
+    # "coarse" in non-overlapping ones (about 4x cheaper), "face" over the
+    # portrait only
+    dl_region: str = "page"
+    # Adds the statement table checks to the layout score
+    table_checks: bool = False
+    # Visual signals that must all be present before the profile applies.
+    # Keywords are printed by the submitter, so text alone never reduces
+    # the forensic checks a page gets.
+    visual_evidence: Tuple[str, ...] = ()
+
+PROFILES: Dict[str, DocumentProfile] = {
+    "id_card": DocumentProfile("id_card", dl_region="face", visual_evidence=("face",)),
+    "bank_statement": DocumentProfile("bank_statement", dl_region="coarse", table_checks=True,
+                                      visual_evidence=("portrait_page", "many_rows")),
+    "utility_bill": DocumentProfile("utility_bill", table_checks=True),
+    "generic": DocumentProfile("generic"),
+}
+DOCUMENT_TYPES = ["id_card", "bank_statement", "utility_bill"]
+
+KEYWORDS = {
+    "id_card": ["passport", "identity", "identification", "id card", "national id", "driving licence",
+                "driver license", "driving license", "date of birth", "dob", "nationality", "aadhaar",
+                "permanent account number", "sex", "expiry"],
+    "bank_statement": ["statement", "opening balance", "closing balance", "balance", "transactions",
+                       "account no", "account number", "iban", "sort code", "bank", "withdrawal", "deposit"],
+    "utility_bill": ["bill", "invoice", "amount due", "due date", "electricity", "water", "gas", "kwh",
+                     "meter", "tariff", "units", "power", "telecom", "billing period"],
+}
+_KEYWORD_RES = {
+    doc_type: re.compile(r"\b(" + "|".join(re.escape(word) for word in words) + r")\b")
+    for doc_type, words in KEYWORDS.items()
+}
+
+class RoutingDecision(BaseModel):
+    document_type: str
+    # The document type's profile, or "generic" when its visual evidence is missing
+    profile: str
+    confidence: float
+    scores: Dict[str, float] = {}
+    # Evidence behind the scores, e.g. "face", "many_rows", "keyword:statement"
+    signals: List[str] = []
+    # Visual signals that allowed the profile to apply
+    evidence: List[str] = []
+    # Detected portrait as (left, top, right, bottom) fractions of the page
+    face_box: Optional[List[float]] = None
+    used_ocr: bool = False
+    cost_ms: float = 0.0
+
+def _shrink(image: Image.Image, side: int) -> Image.Image:
+    """Box-filters the image by an integer factor, to a long side of `side` up to 2x that."""
+    return image.reduce(max(1, max(image.size) // side))
+
+class DocumentRouter:
+    """
+    Cheap rule-based document classifier: a thumbnail (shape, colour, text
+    rows, portrait) plus keywords in the first OCR lines when OCR has
+    already run. Takes a few milliseconds, so it can pick the pipeline
+    profile before any heavy stage.
+    """
+    def __init__(self):
+        self.face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+    def _thumbnail_features(self, image: Image.Image) -> dict:
+        thumbnail = _shrink(image, THUMBNAIL_SIDE)
+        width, height = thumbnail.size
+        gray = thumbnail.convert("L")
+        saturation = float(np.asarray(thumbnail.convert("HSV"))[..., 1].mean() / 255.0)
+
+        # Text rows: runs of image rows that contain ink
+        ink_rows = (np.asarray(gray) < 128).mean(axis=1) > 0.01
+        rows = int(np.count_nonzero(ink_rows[1:] & ~ink_rows[:-1]) + ink_rows[0])
+
+        small = np.asarray(_shrink(gray, FACE_THUMBNAIL_SIDE))
+        faces = self.face_detector.detectMultiScale(small, scaleFactor=1.25, minNeighbors=5, minSize=(32, 32))
+        face_box = None
+        if len(faces):
+            x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+            face_box = [x / small.shape[1], y / small.shape[0], (x + w) / small.shape[1], (y + h) / small.shape[0]]
+        return {
+            "landscape": width > height,
+            "aspect": max(width, height) / max(1, min(width, height)),
+            "saturation": saturation,
+            "rows": rows,
+            "face_box": face_box,
+        }
+
+    def route(self, image: Image.Image, ocr_results: Optional[List[dict]] = None) -> RoutingDecision:
+        """Classifies the page; `ocr_results` (full-page OCR), if given, adds keyword evidence."""
+        start = time.perf_counter()
+        if not ROUTER_ENABLED:
+            return RoutingDecision(document_type="generic", profile="generic", confidence=0.0)
+
+        features = self._thumbnail_features(image)
+        scores = {doc_type: 0.0 for doc_type in DOCUMENT_TYPES}
+        signals = []
+
+        # 1. Visual evidence
+        if features["face_box"]:
+            scores["id_card"] += 0.4
+            signals.append("face")
+        if features["landscape"] and 1.4 <= features["aspect"] <= 1.75:
+            scores["id_card"] += 0.25
+            signals.append("card_shape")
+        if features["saturation"] > 0.15:
+            scores["id_card"] += 0.15
+            signals.append("colourful")
+        if not features["landscape"]:
+            scores["bank_statement"] += 0.2
+            scores["utility_bill"] += 0.2
+            signals.append("portrait_page")
+        if features["rows"] >= 18:
+            scores["bank_statement"] += 0.2
+            signals.append("many_rows")
+        elif features["rows"] < 10:
+            scores["id_card"] += 0.2
+            signals.append("few_rows")
+
+        # 2. Keywords in the first lines of text
+        used_ocr = bool(ocr_results)
+        if used_ocr:
+            top_lines = sorted(ocr_results, key=lambda item: item["bounding_box"][0][1])[:ROUTER_OCR_LINES]
+            text = " ".join(item["text"] for item in top_lines).lower()
+            for doc_type, pattern in _KEYWORD_RES.items():
+                hits = set(pattern.findall(text))
+                if hits:
+                    scores[doc_type] += min(0.6, 0.3 * len(hits))
+                    signals.extend(f"keyword:{word}" for word in sorted(hits))
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best, best_score), (_, runner_up) = ranked[0], ranked[1]
+        document_type = best if best_score >= ROUTER_MIN_SCORE and best_score - runner_up >= ROUTER_MIN_MARGIN else "generic"
+
+        # 3. The profile only applies when the page also looks the part
+        required = PROFILES[document_type].visual_evidence
+        profile = document_type if all(signal in signals for signal in required) else "generic"
+
+        return RoutingDecision(
+            document_type=document_type,
+            profile=profile,
+            confidence=round(min(best_score, 1.0), 3),
+            scores={doc_type: round(score, 3) for doc_type, score in scores.items()},
+            signals=signals,
+            evidence=list(required) if profile != "generic" else [],
+            face_box=features["face_box"],
+            used_ocr=used_ocr,
+            cost_ms=round((time.perf_counter() - start) * 1000, 2),
+        )
+
+def get_profile(decision: Optional[RoutingDecision]) -> DocumentProfile:
+    return PROFILES[decision.profile] if decision is not None else PROFILES["generic"]
+
+def region_box(relative_box: List[float], size: Tuple[int, int], margin: float = 0.5,
+               min_side: int = 0) -> Tuple[int, int, int, int]:
+    """
+    Pixel box of a relative region on an image of `size`, grown by `margin`
+    on each side and to at least `min_side`, clamped to the image.
+    """
+    width, height = size
+    left, top, right, bottom = relative_box
+    box_w, box_h = (right - left) * width, (bottom - top) * height
+    cx, cy = (left + right) / 2 * width, (top + bottom) / 2 * height
+    half_w = min(width, max(box_w * (1 + 2 * margin), min_side)) / 2
+    half_h = min(height, max(box_h * (1 + 2 * margin), min_side)) / 2
+    cx = min(max(cx, half_w), width - half_w)
+    cy = min(max(cy, half_h), height - half_h)
+    return int(cx - half_w), int(cy - half_h), int(cx + half_w), int(cy + half_h)
+
+# Singleton
+document_router = DocumentRouter()
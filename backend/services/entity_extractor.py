@@ -2,6 +2,8 @@ import spacy
 from pydantic import BaseModel
 from typing import Optional, List
 import re
+from core.metrics import model_load_timer
+from .model_server import get_model_client
 
 class ExtractedData(BaseModel):
     person_name: Optional[str] = "Unknown"
@@ -10,8 +12,14 @@ class ExtractedData(BaseModel):
 
 class EntityExtractor:
     def __init__(self):
+        # With a model server on this node, the spaCy pipeline lives there
+        self.client = get_model_client()
+        if self.client is not None:
+            self.nlp = None
+            return
         try:
-            self.nlp = spacy.load("en_core_web_sm")
+            with model_load_timer("spacy"):
+                self.nlp = spacy.load("en_core_web_sm")
         except:
             # Fallback if model not loaded yet in this session
             self.nlp = None
@@ -22,14 +30,13 @@ class EntityExtractor:
         """
         full_text = " ".join([item['text'] for item in text_list])
         
-        if not self.nlp:
-            try:
-                self.nlp = spacy.load("en_core_web_sm")
-            except:
-                return ExtractedData(person_name="Model Loading", address="N/A", date="N/A")
+        if self.client is not None:
+            found, _ = self.client.call("ner", text=full_text)
+        else:
+            found = self.entities(full_text)
+        if found is None:
+            return ExtractedData(person_name="Model Loading", address="N/A", date="N/A")
 
-        doc = self.nlp(full_text)
-        
         entities = {
             "PERSON": [],
             "GPE": [], # Geopolitical entity (cities, states, etc.)
@@ -38,9 +45,9 @@ class EntityExtractor:
             "FAC": []  # Buildings, airports, highways, bridges, etc.
         }
 
-        for ent in doc.ents:
-            if ent.label_ in entities:
-                entities[ent.label_].append(ent.text)
+        for label, text in found:
+            if label in entities:
+                entities[label].append(text)
 
         # Simple logic to pick the best candidates
         name = entities["PERSON"][0] if entities["PERSON"] else "Unknown"
@@ -60,5 +67,14 @@ class EntityExtractor:
             date=date
         )
 
+    def entities(self, text: str) -> Optional[List[List[str]]]:
+        """(label, text) of every entity spaCy finds, or None if the model is unavailable."""
+        if not self.nlp:
+            try:
+                self.nlp = spacy.load("en_core_web_sm")
+            except:
+                return None
+        return [[ent.label_, ent.text] for ent in self.nlp(text).ents]
+
 # Singleton
 entity_extractor = EntityExtractor()
@@ -26,9 +26,9 @@ class XAIExplainer:
             
         self.cam = GradCAM(model=model, target_layers=self.target_layers)
 
-    def generate_explanation(self, input_tensor, original_image_pil, target_category=1):
+    def grayscale_cam(self, input_tensor, target_category=1):
         """
-        Generates Grad-CAM visualization for the specified category.
+        Raw Grad-CAM for the specified category: a (224, 224) grid in [0, 1].
         """
         # input_tensor is (1, 3, 224, 224)
         targets = [ClassifierOutputTarget(target_category)]
@@ -37,8 +37,13 @@ class XAIExplainer:
         grayscale_cam = self.cam(input_tensor=input_tensor, targets=targets)
         
         # grayscale_cam is (1, 224, 224)
-        grayscale_cam = grayscale_cam[0, :]
-        
+        return grayscale_cam[0, :]
+
+    @staticmethod
+    def overlay(grayscale_cam, original_image_pil):
+        """
+        Blends a Grad-CAM grid over the image, at the image's full size.
+        """
         # Prepare original image for overlay (resized to 224, 224 for Grad-CAM)
         img_np = np.array(original_image_pil.resize((224, 224))) / 255.0
         
@@ -51,6 +56,12 @@ class XAIExplainer:
         
         return Image.fromarray(visualization_high_res)
 
+    def generate_explanation(self, input_tensor, original_image_pil, target_category=1):
+        """
+        Generates Grad-CAM visualization for the specified category.
+        """
+        return self.overlay(self.grayscale_cam(input_tensor, target_category), original_image_pil)
+
 def xai_image_to_base64(image):
     buffered = io.BytesIO()
     image.save(buffered, format="PNG")
@@ -1,20 +1,22 @@
 from PIL import Image, ImageChops, ImageEnhance
-import os
 import numpy as np
 import cv2
 import io
 import base64
+from .image_io import load_image
 
-def calculate_ela(image_path: str, quality: int = 90):
+def calculate_ela(image_path, quality: int = 90):
     """
     Error Level Analysis (ELA) implementation.
+    Accepts a file path, raw bytes or a PIL image.
     """
-    temp_path = "temp_ela.jpg"
-    original = Image.open(image_path).convert('RGB')
+    original = load_image(image_path)
     
-    # Save at a specific quality
-    original.save(temp_path, 'JPEG', quality=quality)
-    resaved = Image.open(temp_path)
+    # Save at a specific quality (in memory, so concurrent calls never collide)
+    resaved_buffer = io.BytesIO()
+    original.save(resaved_buffer, 'JPEG', quality=quality)
+    resaved_buffer.seek(0)
+    resaved = Image.open(resaved_buffer)
     
     # Calculate difference
     ela_image = ImageChops.difference(original, resaved)
@@ -32,18 +34,19 @@ def calculate_ela(image_path: str, quality: int = 90):
     # Higher variance often indicates non-uniform compression levels (potential tampering)
     ela_array = np.array(ela_image)
     anomaly_score = float(np.var(ela_array) / 100.0) # Normalized score
-    
-    # Cleanup
-    if os.path.exists(temp_path):
-        os.remove(temp_path)
         
     return ela_image, anomaly_score
 
-def image_to_base64(image):
+def image_to_png(image) -> bytes:
     """
-    Converts a PIL image to a base64 encoded string.
+    Encodes a PIL image as raw PNG bytes.
     """
     buffered = io.BytesIO()
     image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return img_str
+    return buffered.getvalue()
+
+def image_to_base64(image):
+    """
+    Converts a PIL image to a base64 encoded string.
+    """
+    return base64.b64encode(image_to_png(image)).decode()
@@ -0,0 +1,129 @@
+import base64
+import io
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image
+
+# Deep-zoom tile edge, in pixels
+TILE_SIZE = 256
+# Width of an artifact rendered without an explicit width
+DEFAULT_ARTIFACT_WIDTH = 1024
+# Side of the ELA blocks averaged into one grid cell, on the forensic image
+ELA_BLOCK = 8
+
+COLORMAPS = {"jet": cv2.COLORMAP_JET, "gray": None}
+
+@dataclass
+class ScoreGrid:
+    """
+    Raw scores in [0, 1] laid over a region of the page. Colorized heatmaps
+    are rendered from it on request, at the zoom level asked for.
+    """
+    values: np.ndarray
+    # Page pixels the grid covers: (left, top, right, bottom)
+    box: Tuple[float, float, float, float]
+    page_size: Tuple[int, int]
+    colormap: str = "jet"
+
+    def to_dict(self, base64_values: bool = False) -> dict:
+        """Compact form for results: scores quantized to one byte each."""
+        quantized = np.clip(np.rint(np.asarray(self.values, dtype=np.float32) * 255), 0, 255).astype(np.uint8)
+        values = quantized.tobytes()
+        return {
+            "shape": list(quantized.shape),
+            "dtype": "uint8",
+            "values": base64.b64encode(values).decode() if base64_values else values,
+            "box": [round(float(v), 2) for v in self.box],
+            "page_size": list(self.page_size),
+            "colormap": self.colormap,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ScoreGrid":
+        values = data["values"]
+        if isinstance(values, str):
+            values = base64.b64decode(values)
+        grid = np.frombuffer(values, dtype=np.uint8).reshape(data["shape"]).astype(np.float32) / 255.0
+        return cls(grid, tuple(data["box"]), tuple(data["page_size"]), data.get("colormap", "jet"))
+
+def ela_grid(ela_image: Image.Image, block: int = ELA_BLOCK) -> np.ndarray:
+    """Mean ELA intensity (strongest channel) per block, in [0, 1]."""
+    intensity = np.asarray(ela_image).max(axis=2)
+    height, width = intensity.shape
+    cols, rows = max(1, math.ceil(width / block)), max(1, math.ceil(height / block))
+    return cv2.resize(intensity, (cols, rows), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+# --- Rendering ---
+
+def _axis_weights(positions: np.ndarray, start: float, end: float, cells: int):
+    """Neighbouring cells and weights for bilinear sampling along one axis."""
+    coords = np.clip((positions - start) / (end - start) * cells - 0.5, 0, cells - 1)
+    low = np.floor(coords).astype(np.int64)
+    high = np.minimum(low + 1, cells - 1)
+    inside = (positions >= start) & (positions < end)
+    return low, high, coords - low, inside
+
+def render_region(grid: ScoreGrid, scale: float, left: int, top: int, width: int, height: int) -> Image.Image:
+    """
+    Renders the window (left, top, width, height) of the page drawn at
+    `scale`, as RGBA. Only this window is computed, so a tile costs the
+    same at every zoom level; cells are interpolated like cv2.resize.
+    """
+    box_left, box_top, box_right, box_bottom = grid.box
+    rows, cols = grid.values.shape
+    # Pixel centres, in page coordinates
+    xs = (left + np.arange(width) + 0.5) / scale
+    ys = (top + np.arange(height) + 0.5) / scale
+    x0, x1, wx, inside_x = _axis_weights(xs, box_left, box_right, cols)
+    y0, y1, wy, inside_y = _axis_weights(ys, box_top, box_bottom, rows)
+
+    across = grid.values[:, x0] * (1 - wx) + grid.values[:, x1] * wx
+    sampled = across[y0] * (1 - wy)[:, None] + across[y1] * wy[:, None]
+    intensity = np.uint8(np.clip(sampled, 0, 1) * 255)
+
+    colormap = COLORMAPS.get(grid.colormap)
+    if colormap is None:
+        rgb = np.repeat(intensity[..., None], 3, axis=2)
+    else:
+        rgb = cv2.cvtColor(cv2.applyColorMap(intensity, colormap), cv2.COLOR_BGR2RGB)
+    # Outside the grid's region nothing was analysed: leave it transparent
+    alpha = np.uint8(np.outer(inside_y, inside_x) * 255)
+    return Image.fromarray(np.dstack([rgb, alpha]), "RGBA")
+
+def _png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def render_image(grid: ScoreGrid, width: Optional[int] = None) -> bytes:
+    """The whole heatmap as a PNG `width` pixels wide (never wider than the page)."""
+    page_width, page_height = grid.page_size
+    width = min(width or DEFAULT_ARTIFACT_WIDTH, page_width)
+    scale = width / page_width
+    return _png(render_region(grid, scale, 0, 0, width, max(1, round(page_height * scale))))
+
+def pyramid_info(page_size: Tuple[int, int]) -> dict:
+    """
+    Deep-zoom layout: level `max_level` is the page at full size, each level
+    below halves it, down to a single pixel at level 0.
+    """
+    width, height = page_size
+    max_level = math.ceil(math.log2(max(width, height, 1)))
+    return {"width": width, "height": height, "tile_size": TILE_SIZE, "max_level": max_level, "format": "png"}
+
+def render_tile(grid: ScoreGrid, level: int, col: int, row: int) -> bytes:
+    """One TILE_SIZE tile of a pyramid level as a PNG; edge tiles are cropped to the page."""
+    info = pyramid_info(grid.page_size)
+    if not 0 <= level <= info["max_level"]:
+        raise ValueError(f"level must be between 0 and {info['max_level']}")
+    scale = 2.0 ** (level - info["max_level"])
+    level_width = max(1, math.ceil(info["width"] * scale))
+    level_height = max(1, math.ceil(info["height"] * scale))
+    left, top = col * TILE_SIZE, row * TILE_SIZE
+    if col < 0 or row < 0 or left >= level_width or top >= level_height:
+        raise ValueError(f"Tile {col}_{row} is outside level {level}")
+    width, height = min(TILE_SIZE, level_width - left), min(TILE_SIZE, level_height - top)
+    return _png(render_region(grid, scale, left, top, width, height))
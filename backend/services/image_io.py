@@ -0,0 +1,25 @@
+import io
+import math
+from typing import Optional
+from PIL import Image
+
+def load_image(source, max_pixels: Optional[int] = None) -> Image.Image:
+    """
+    Opens an image given a file path, raw bytes, a binary file object or an
+    already decoded PIL image, and returns it in RGB mode.
+
+    With `max_pixels`, JPEGs larger than the budget are decoded directly at
+    a reduced scale (1/2, 1/4 or 1/8, never below the budget); the size of
+    the file is kept in `info["original_size"]`.
+    """
+    if isinstance(source, Image.Image):
+        return source.convert('RGB')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    if max_pixels and image.width * image.height > max_pixels:
+        original_size = image.size
+        scale = math.sqrt(max_pixels / (image.width * image.height))
+        image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image.info["original_size"] = original_size
+    return image.convert('RGB')
@@ -1,6 +1,7 @@
 from thefuzz import fuzz
 from pydantic import BaseModel
-from typing import List, Dict
+from itertools import combinations
+from typing import List, Dict, Tuple
 from .entity_extractor import ExtractedData
 
 class ValidationResult(BaseModel):
@@ -12,10 +13,8 @@ class KYCValidator:
     def __init__(self, threshold: int = 80):
         self.threshold = threshold
 
-    def validate(self, doc_a_data: ExtractedData, doc_b_data: ExtractedData) -> ValidationResult:
-        """
-        Compares extracted data from two documents using fuzzy matching.
-        """
+    def _compare(self, doc_a_data: ExtractedData, doc_b_data: ExtractedData) -> Tuple[List[int], List[str]]:
+        """Fuzzy scores and mismatch messages for one pair of documents."""
         mismatches = []
         scores = []
 
@@ -32,6 +31,30 @@ class KYCValidator:
         if addr_score < self.threshold:
             mismatches.append(f"Address mismatch detected: '{doc_a_data.address}' vs '{doc_b_data.address}' ({addr_score}%)")
 
+        return scores, mismatches
+
+    def validate(self, doc_a_data: ExtractedData, doc_b_data: ExtractedData) -> ValidationResult:
+        """
+        Compares extracted data from two documents using fuzzy matching.
+        """
+        return self.validate_many([doc_a_data, doc_b_data])
+
+    def validate_many(self, docs: List[ExtractedData]) -> ValidationResult:
+        """
+        Cross-validates any number of documents, every pair against each
+        other. Mismatches name the documents involved (Doc A, Doc B, ...)
+        when there are more than two.
+        """
+        mismatches = []
+        scores = []
+
+        for (i, doc_a_data), (j, doc_b_data) in combinations(enumerate(docs), 2):
+            pair_scores, pair_mismatches = self._compare(doc_a_data, doc_b_data)
+            scores.extend(pair_scores)
+            if len(docs) > 2:
+                pair_mismatches = [f"Doc {chr(65 + i)} vs Doc {chr(65 + j)}: {m}" for m in pair_mismatches]
+            mismatches.extend(pair_mismatches)
+
         # Calculate average consistency score
         avg_score = sum(scores) / len(scores) if scores else 0
         
@@ -1,5 +1,9 @@
+import re
 import numpy as np
 
+# A money amount as printed in a statement column: 1,234.56 / -45.00 / $12.30
+AMOUNT_RE = re.compile(r"^[-+]?[$€£₹]?\s?\d{1,3}(,\d{3})*\.\d{2}$|^[-+]?\d+\.\d{2}$")
+
 class LayoutAnalyzer:
     def __init__(self):
         pass
@@ -41,5 +45,39 @@ class LayoutAnalyzer:
 
         return float(np.clip(anomaly_score, 0.0, 1.0))
 
+    def analyze_table_consistency(self, ocr_results):
+        """
+        Statement-style table check: amounts are right-aligned in their
+        column, so their right edges should agree. Returns the share of
+        amounts that sit off their column's edge.
+        """
+        amounts = [res for res in ocr_results if AMOUNT_RE.match(res['text'].strip().replace(' ', ''))]
+        if len(amounts) < 4:
+            return 0.0
+
+        heights = [max(p[1] for p in res['bounding_box']) - min(p[1] for p in res['bounding_box']) for res in amounts]
+        line_height = max(float(np.median(heights)), 1.0)
+        right_edges = sorted(max(p[0] for p in res['bounding_box']) for res in amounts)
+
+        # 1. Group the edges into columns, split at gaps wider than a few lines
+        columns = [[right_edges[0]]]
+        for edge in right_edges[1:]:
+            if edge - columns[-1][-1] > 3 * line_height:
+                columns.append([edge])
+            else:
+                columns[-1].append(edge)
+
+        # 2. Count amounts off their column's median edge
+        checked = misaligned = 0
+        for column in columns:
+            if len(column) < 3:
+                continue
+            median = float(np.median(column))
+            checked += len(column)
+            misaligned += sum(1 for edge in column if abs(edge - median) > 0.3 * line_height)
+        if checked == 0:
+            return 0.0
+        return float(min(misaligned / checked * 2, 1.0))
+
 # Singleton
 layout_analyzer = LayoutAnalyzer()
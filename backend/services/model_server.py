@@ -0,0 +1,346 @@
+"""
+Node-local model server: one process holds the ViT, easyocr and spaCy
+models for every API and worker process on the machine.
+
+Each client process maps a shared-memory segment cut into slots. A slot is
+a ring entry plus its own Unix-socket connection: the client writes the
+image into the slot and sends a short control message; the server reads
+the pixels in place, runs the model and writes array results (score grids,
+Grad-CAM maps) back into the same slot. Pixels are never pickled or
+sent over the socket. ViT patches from concurrent requests are merged into
+shared forward passes.
+
+Usage (from backend/):
+    python -m services.model_server
+and start uvicorn and the Celery workers with the same MODEL_SERVER_SOCKET.
+"""
+import atexit
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Optional, Tuple
+import msgpack
+import numpy as np
+
+# Unix socket of the model server; unset keeps the models in-process
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET")
+# Concurrent requests per client process, i.e. slots in its ring
+MODEL_SERVER_SLOTS = int(os.getenv("MODEL_SERVER_SLOTS", "4"))
+# Fits the largest normalized working image (OCR and forensic pages)
+MODEL_SERVER_SLOT_MB = int(os.getenv("MODEL_SERVER_SLOT_MB", "24"))
+# Patches per ViT forward pass on the server, and how long a pass waits
+# for patches from other requests
+MODEL_SERVER_BATCH_SIZE = int(os.getenv("MODEL_SERVER_BATCH_SIZE", "64"))
+MODEL_SERVER_BATCH_WAIT_MS = float(os.getenv("MODEL_SERVER_BATCH_WAIT_MS", "5"))
+MODEL_SERVER_TORCH_THREADS = os.getenv("MODEL_SERVER_TORCH_THREADS")
+
+_HEADER = struct.Struct("!I")
+
+# True inside the server process, whose services must load the real models
+_serving = False
+
+def send_message(sock: socket.socket, message: dict):
+    payload = msgpack.packb(message, use_bin_type=True)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv_message(sock: socket.socket) -> Optional[dict]:
+    """Next control message, or None once the peer has closed the connection."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    payload = _recv_exact(sock, _HEADER.unpack(header)[0])
+    return None if payload is None else msgpack.unpackb(payload, raw=False)
+
+class ModelServerError(RuntimeError):
+    pass
+
+# --- Client ---
+
+class _Slot:
+    def __init__(self, client: "ModelClient", index: int):
+        self.offset = index * client.slot_bytes
+        self.size = client.slot_bytes
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(client.socket_path)
+        send_message(self.sock, {"shm": client.shm.name, "offset": self.offset, "size": self.size})
+
+    def view(self, buf, shape, dtype) -> np.ndarray:
+        return np.ndarray(shape, dtype=dtype, buffer=buf, offset=self.offset)
+
+class ModelClient:
+    """
+    Sends inference requests to the model server. The shared-memory ring and
+    the connections are created on first use in each process, so a client
+    built before a prefork never shares them with the children.
+    """
+    def __init__(self, socket_path: str, slots: int = MODEL_SERVER_SLOTS,
+                 slot_bytes: int = MODEL_SERVER_SLOT_MB * 1024 * 1024):
+        self.socket_path = socket_path
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = None
+        self._free: "queue.Queue[Tuple[int, Optional[_Slot]]]" = queue.Queue()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_process(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+            atexit.register(self._cleanup, self.shm)
+            # Connections are opened lazily, so an idle slot costs nothing
+            self._free = queue.Queue()
+            for index in range(self.slots):
+                self._free.put((index, None))
+            self._pid = os.getpid()
+
+    @staticmethod
+    def _cleanup(shm):
+        try:
+            shm.close()
+            shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+
+    def _connect(self, index: int) -> _Slot:
+        try:
+            return _Slot(self, index)
+        except OSError as e:
+            raise ModelServerError(f"Model server unavailable at {self.socket_path}: {e}")
+
+    def call(self, op: str, array: Optional[np.ndarray] = None, **args) -> Tuple[Any, Optional[np.ndarray]]:
+        """
+        Runs `op` on the server. Returns its result and, for ops that produce
+        one, an output array copied out of the slot.
+        """
+        self._ensure_process()
+        if array is not None and array.nbytes > self.slot_bytes:
+            raise ValueError(f"Input of {array.nbytes} bytes exceeds the {self.slot_bytes}-byte model server slot. "
+                             f"Raise MODEL_SERVER_SLOT_MB.")
+        free = self._free
+        index, slot = free.get()
+        try:
+            if slot is None:
+                slot = self._connect(index)
+
+            message = {"op": op, "args": args}
+            if array is not None:
+                array = np.ascontiguousarray(array)
+                slot.view(self.shm.buf, array.shape, array.dtype)[...] = array
+                message.update(shape=list(array.shape), dtype=array.dtype.str)
+            try:
+                send_message(slot.sock, message)
+                reply = recv_message(slot.sock)
+            except OSError:
+                reply = None
+            if reply is None:
+                # Reconnect on next use, e.g. after a server restart
+                slot.sock.close()
+                slot = None
+                raise ModelServerError(f"Model server at {self.socket_path} closed the connection")
+            if not reply["ok"]:
+                raise ModelServerError(reply["error"])
+
+            output = None
+            if "shape" in reply:
+                output = slot.view(self.shm.buf, reply["shape"], np.dtype(reply["dtype"])).copy()
+            return reply.get("result"), output
+        finally:
+            free.put((index, slot))
+
+_client: Optional[ModelClient] = None
+_client_lock = threading.Lock()
+
+def get_model_client() -> Optional[ModelClient]:
+    """The process-wide client, or None when the models run in-process."""
+    global _client
+    if not MODEL_SERVER_SOCKET or _serving:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = ModelClient(MODEL_SERVER_SOCKET)
+        return _client
+
+# --- Server ---
+
+class PatchBatcher:
+    """Merges ViT patch batches submitted by concurrent requests into shared forward passes."""
+    def __init__(self, classify, max_batch: int = MODEL_SERVER_BATCH_SIZE,
+                 max_wait_ms: float = MODEL_SERVER_BATCH_WAIT_MS):
+        self.classify = classify
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        threading.Thread(target=self._run, name="vit-batcher", daemon=True).start()
+
+    def submit(self, patches) -> np.ndarray:
+        future = Future()
+        self._queue.put((patches, future))
+        return future.result()
+
+    def _run(self):
+        import torch
+        while True:
+            items = [self._queue.get()]
+            size = len(items[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            try:
+                probs = self.classify(torch.cat([patches for patches, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for patches, future in items:
+                future.set_result(probs[start:start + len(patches)])
+                start += len(patches)
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        from PIL import Image
+        from .dl_detector import dl_detector
+        from .ocr_service import ocr_service
+        from .entity_extractor import entity_extractor
+
+        self.batcher = PatchBatcher(lambda patches: dl_detector.classify_patches(patches, batch_size=MODEL_SERVER_BATCH_SIZE))
+        # Grad-CAM hooks and easyocr keep per-call state on the model
+        gradcam_lock, ocr_lock, ner_lock = threading.Lock(), threading.Lock(), threading.Lock()
+
+        def vit(image, patch_size, stride):
+            grid = dl_detector.patch_scores(Image.fromarray(image), patch_size, stride,
+                                            classify=self.batcher.submit, batch_size=MODEL_SERVER_BATCH_SIZE)
+            return None, grid.astype(np.float32)
+
+        def vit_single(image):
+            return dl_detector.single_inference(Image.fromarray(image)), None
+
+        def gradcam(image):
+            with gradcam_lock:
+                grayscale_cam = dl_detector.explanation_grid(Image.fromarray(image))
+            return None, np.asarray(grayscale_cam, dtype=np.float32)
+
+        def ocr(image):
+            with ocr_lock:
+                return ocr_service.read(image), None
+
+        def ner(text):
+            with ner_lock:
+                return entity_extractor.entities(text), None
+
+        self.ops = {"vit": vit, "vit_single": vit_single, "gradcam": gradcam, "ocr": ocr, "ner": ner}
+        self._segments: Dict[str, list] = {}
+        self._segments_lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+
+    def attach(self, name: str) -> shared_memory.SharedMemory:
+        with self._segments_lock:
+            if name not in self._segments:
+                shm = shared_memory.SharedMemory(name=name)
+                # The client owns the segment; stop this process's resource
+                # tracker from unlinking it when the server exits
+                resource_tracker.unregister(shm._name, "shared_memory")
+                self._segments[name] = [shm, 0]
+            self._segments[name][1] += 1
+            return self._segments[name][0]
+
+    def release(self, name: str):
+        with self._segments_lock:
+            entry = self._segments[name]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._segments[name]
+                entry[0].close()
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        hello = recv_message(self.request)
+        if hello is None:
+            return
+        server: ModelServer = self.server
+        shm = server.attach(hello["shm"])
+        try:
+            while True:
+                message = recv_message(self.request)
+                if message is None:
+                    return
+                send_message(self.request, self._run(server, shm, hello, message))
+        finally:
+            server.release(hello["shm"])
+
+    @staticmethod
+    def _run(server: ModelServer, shm, hello: dict, message: dict) -> dict:
+        try:
+            op = server.ops[message["op"]]
+            args = message.get("args", {})
+            if "shape" in message:
+                image = np.ndarray(message["shape"], dtype=np.dtype(message["dtype"]), buffer=shm.buf, offset=hello["offset"])
+                result, output = op(image, **args)
+                del image
+            else:
+                result, output = op(**args)
+        except Exception as e:
+            return {"ok": False, "error": f"{message.get('op')}: {type(e).__name__}: {e}"}
+
+        reply = {"ok": True, "result": result}
+        if output is not None:
+            if output.nbytes > hello["size"]:
+                return {"ok": False, "error": f"{message['op']}: output does not fit the slot"}
+            np.ndarray(output.shape, dtype=output.dtype, buffer=shm.buf, offset=hello["offset"])[...] = output
+            reply.update(shape=list(output.shape), dtype=output.dtype.str)
+        return reply
+
+def main():
+    if not MODEL_SERVER_SOCKET:
+        raise SystemExit("Set MODEL_SERVER_SOCKET to the Unix socket path to serve on.")
+    # Under `python -m` this file is __main__; the services read the flag
+    # from the imported module
+    from services import model_server
+    model_server._serving = True
+
+    import torch
+    torch.set_num_threads(int(MODEL_SERVER_TORCH_THREADS) if MODEL_SERVER_TORCH_THREADS else (os.cpu_count() or 1))
+
+    start = time.time()
+    server = model_server.ModelServer(MODEL_SERVER_SOCKET)
+    print(f"Model server loaded models in {time.time() - start:.1f}s, listening on {MODEL_SERVER_SOCKET}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(MODEL_SERVER_SOCKET)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import math
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from PIL import Image
+
+# Largest page kept in memory; bigger uploads are downscaled once, up front
+MAX_PAGE_PIXELS = int(os.getenv("MAX_PAGE_PIXELS", str(24_000_000)))
+# easyocr shrinks the long side to its 2560px canvas anyway, so a larger
+# input only costs time and memory
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2560"))
+# ELA and the ViT compare pixels at a fixed physical density, so a 600 DPI
+# scan and a 200 DPI scan of the same document cost about the same
+FORENSIC_TARGET_DPI = float(os.getenv("FORENSIC_TARGET_DPI", "200"))
+# Hard cap on the forensic working image (about 11x17 ViT patches at 200 DPI A4)
+FORENSIC_MAX_PIXELS = int(os.getenv("FORENSIC_MAX_PIXELS", str(6_000_000)))
+
+# Long side of an A4 page, used when the file carries no believable DPI
+ASSUMED_LONG_SIDE_INCHES = 11.69
+# Physical long sides a KYC document can plausibly have (ID card to A3)
+PLAUSIBLE_LONG_SIDE_INCHES = (3.0, 20.0)
+
+@dataclass
+class NormalizedPage:
+    """
+    The page at its working resolutions. Scales are relative to the
+    uploaded image, so a box found on `ocr_image` maps back with
+    `to_original(box, ocr_scale)`.
+    """
+    original_size: Tuple[int, int]
+    page: Image.Image
+    page_scale: float
+    ocr_image: Image.Image
+    ocr_scale: float
+    forensic_image: Image.Image
+    forensic_scale: float
+    dpi: float
+    dpi_source: str
+
+    def to_original(self, box: List[List[float]], scale: float) -> List[List[float]]:
+        return [[x / scale, y / scale] for x, y in box]
+
+    def to_page_box(self, box, scale: float) -> Tuple[float, float, float, float]:
+        """Maps a (left, top, right, bottom) box on a working image to page pixels."""
+        factor = self.page_scale / scale
+        return tuple(value * factor for value in box)
+
+    def summary(self) -> dict:
+        return {
+            "original_size": list(self.original_size),
+            "page_size": list(self.page.size),
+            "dpi": round(self.dpi, 1),
+            "dpi_source": self.dpi_source,
+            "scales": {
+                "page": round(self.page_scale, 4),
+                "ocr": round(self.ocr_scale, 4),
+                "forensic": round(self.forensic_scale, 4),
+            },
+        }
+
+def estimate_dpi(size: Tuple[int, int], metadata_dpi=None) -> Tuple[float, str]:
+    """
+    Physical pixel density of a page of `size` pixels. The file's DPI is
+    used when it gives a document-sized page (cameras write 72 DPI on
+    every photo); otherwise the page is assumed to be A4.
+    """
+    long_side = max(size)
+    if metadata_dpi:
+        dpi = float(metadata_dpi[0] if isinstance(metadata_dpi, (tuple, list)) else metadata_dpi)
+        low, high = PLAUSIBLE_LONG_SIDE_INCHES
+        if dpi > 0 and low <= long_side / dpi <= high:
+            return dpi, "metadata"
+    return long_side / ASSUMED_LONG_SIDE_INCHES, "estimated"
+
+def _fit(size: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+def _resize(image: Image.Image, scale: float) -> Image.Image:
+    if scale >= 1.0:
+        return image
+    return image.resize(_fit(image.size, scale), Image.LANCZOS, reducing_gap=3.0)
+
+def normalize_page(image: Image.Image, max_pixels: Optional[int] = None) -> NormalizedPage:
+    """
+    Derives the working images of every stage from a decoded page. Images
+    are only ever shrunk: upscaling adds cost without adding evidence.
+    `image.info["original_size"]` is honoured when the decoder already
+    reduced the page (see image_io.load_image).
+    """
+    max_pixels = max_pixels or MAX_PAGE_PIXELS
+    original_size = tuple(image.info.get("original_size", image.size))
+    width, height = original_size
+
+    # 1. Pixel budget for the page itself
+    page_scale = min(1.0, math.sqrt(max_pixels / (width * height)), image.width / width)
+    page = _resize(image, page_scale * width / image.width)
+    page_scale = page.width / width
+
+    # 2. OCR at a fixed size
+    ocr_scale = min(page_scale, OCR_MAX_SIDE / max(original_size))
+    ocr_image = _resize(page, ocr_scale / page_scale)
+    ocr_scale = ocr_image.width / width
+
+    # 3. ELA / ViT at the target physical density, within their own budget
+    dpi, dpi_source = estimate_dpi(original_size, image.info.get("dpi"))
+    forensic_scale = min(page_scale, FORENSIC_TARGET_DPI / dpi, math.sqrt(FORENSIC_MAX_PIXELS / (width * height)))
+    forensic_image = _resize(page, forensic_scale / page_scale)
+    forensic_scale = forensic_image.width / width
+
+    return NormalizedPage(
+        original_size=original_size,
+        page=page,
+        page_scale=page_scale,
+        ocr_image=ocr_image,
+        ocr_scale=ocr_scale,
+        forensic_image=forensic_image,
+        forensic_scale=forensic_scale,
+        dpi=dpi,
+        dpi_source=dpi_source,
+    )
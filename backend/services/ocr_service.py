@@ -1,17 +1,38 @@
 import easyocr
 import numpy as np
 from PIL import Image
+from core.metrics import model_load_timer
+from .image_io import load_image
+from .model_server import get_model_client
 
 class OCRService:
     def __init__(self, languages=['en']):
+        # With a model server on this node, the reader lives there
+        self.client = get_model_client()
+        if self.client is not None:
+            self.reader = None
+            return
         # Initialize easyocr reader (will download model on first run)
-        self.reader = easyocr.Reader(languages, gpu=False)
+        with model_load_timer("easyocr"):
+            self.reader = easyocr.Reader(languages, gpu=False)
 
-    def extract_text(self, image_path: str):
+    def extract_text(self, image_path):
         """
         Extracts text from image and returns a list of results with bounding boxes.
+        Accepts a file path, raw bytes or a PIL image.
         """
-        results = self.reader.readtext(image_path)
+        if self.client is not None:
+            if not isinstance(image_path, np.ndarray):
+                image_path = np.asarray(load_image(image_path))
+            structured_data, _ = self.client.call("ocr", image_path)
+            return structured_data
+        if isinstance(image_path, Image.Image):
+            image_path = np.array(image_path.convert('RGB'))
+        return self.read(image_path)
+
+    def read(self, image):
+        """Runs the local reader on an image array or path."""
+        results = self.reader.readtext(image)
         
         structured_data = []
         for (bbox, text, prob) in results:
@@ -7,6 +7,9 @@ from datetime import datetime
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
 
+# Resolution pages are rendered at; also recorded as the page image's DPI
+RENDER_DPI = 200
+
 class PDFMetadata(BaseModel):
     author: Optional[str] = "Unknown"
     creator: Optional[str] = "Unknown"
@@ -22,27 +25,31 @@ class PDFProcessor:
         "quartz pdfcontext", "acrobat distill", "nitro pdf", "foxit"
     ]
 
-    def convert_to_images(self, pdf_path: str) -> List[Image.Image]:
+    def convert_to_images(self, pdf_path) -> List[Image.Image]:
         """
-        Converts PDF pages to PIL Images.
+        Converts PDF pages to PIL Images. Accepts a file path or raw bytes.
         """
         try:
-            images = convert_from_path(pdf_path, dpi=200)
+            if isinstance(pdf_path, (bytes, bytearray)):
+                images = convert_from_bytes(bytes(pdf_path), dpi=RENDER_DPI)
+            else:
+                images = convert_from_path(pdf_path, dpi=RENDER_DPI)
             return images
         except Exception as e:
             print(f"Error converting PDF to image: {e}")
             return []
 
-    def extract_metadata(self, pdf_path: str) -> PDFMetadata:
+    def extract_metadata(self, pdf_path) -> PDFMetadata:
         """
         Extracts metadata and performs forensic rule-based analysis.
+        Accepts a file path or raw bytes.
         """
         metadata_dict = {}
         suspicious_reasons = []
         is_suspicious = False
 
         try:
-            with open(pdf_path, 'rb') as f:
+            with (io.BytesIO(pdf_path) if isinstance(pdf_path, (bytes, bytearray)) else open(pdf_path, 'rb')) as f:
                 reader = PyPDF2.PdfReader(f)
                 info = reader.metadata
                 if info:
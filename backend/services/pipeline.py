@@ -0,0 +1,260 @@
+import io
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from .ocr_service import ocr_service
+from .fraud_detector import calculate_ela
+from .layout_analyzer import layout_analyzer
+from .scoring_engine import calculate_final_score
+from .entity_extractor import entity_extractor
+from .dl_detector import dl_detector
+from .pdf_processor import pdf_processor, RENDER_DPI
+from .image_io import load_image
+from .normalization import MAX_PAGE_PIXELS, normalize_page
+from .document_router import document_router, get_profile, region_box
+from .heatmaps import ScoreGrid, ela_grid
+from core.metrics import stage_timer
+
+# Grad-CAM is only worth computing when the ViT flags something
+EXPLANATION_THRESHOLD = 0.2
+# Smallest region worth a sliding window (one ViT patch)
+MIN_DL_REGION = 256
+
+class Stage:
+    """
+    One node of the analysis graph. `requires` must run first; `optional`
+    inputs are used when they are part of the selected graph anyway, but
+    never pull extra work in on their own.
+    """
+    def __init__(self, name: str, fn: Callable, requires: Tuple[str, ...] = (),
+                 optional: Tuple[str, ...] = (), label: str = ""):
+        self.name = name
+        self.fn = fn
+        self.requires = requires
+        self.optional = optional
+        self.label = label or name
+
+# Registry of stages, in a valid execution order
+STAGES: Dict[str, Stage] = {}
+
+def stage(name: str, requires: Tuple[str, ...] = (), optional: Tuple[str, ...] = (), label: str = ""):
+    def decorator(fn):
+        STAGES[name] = Stage(name, fn, requires, optional, label)
+        return fn
+    return decorator
+
+class PipelineContext:
+    """Input document plus the outputs and timings of the stages run so far."""
+    def __init__(self, source, extension: str, filename: str):
+        self.source = source
+        self.extension = extension
+        self.filename = filename
+        self.outputs: Dict[str, object] = {}
+        self.timings: Dict[str, float] = {}
+        # Forensic stages the routed profile narrowed, with the router's
+        # signals behind it, for auditing
+        self.reductions: Dict[str, dict] = {}
+
+    def reduce(self, name: str, mode: str):
+        decision = self.outputs["route"]
+        self.reductions[name] = {
+            "mode": mode,
+            "profile": decision.profile,
+            "evidence": list(decision.evidence),
+            "signals": list(decision.signals),
+        }
+
+    def has(self, name: str) -> bool:
+        return name in self.outputs
+
+    def __getitem__(self, name: str):
+        return self.outputs[name]
+
+# --- Stages ---
+
+@stage("pdf_meta", label="Extracting PDF metadata...")
+def _pdf_meta(ctx: PipelineContext):
+    if ctx.extension != '.pdf':
+        return None
+    return pdf_processor.extract_metadata(ctx.source)
+
+@stage("rasterize", label="Preparing page image...")
+def _rasterize(ctx: PipelineContext):
+    if ctx.extension != '.pdf':
+        return load_image(ctx.source, max_pixels=MAX_PAGE_PIXELS)
+    images = pdf_processor.convert_to_images(ctx.source)
+    if not images:
+        raise ValueError("Failed to convert PDF to image.")
+    # The first page is analysed as a JPEG, as if it had been saved to disk
+    page = io.BytesIO()
+    images[0].save(page, "JPEG", dpi=(RENDER_DPI, RENDER_DPI))
+    return load_image(page.getvalue(), max_pixels=MAX_PAGE_PIXELS)
+
+@stage("normalize", requires=("rasterize",), label="Normalizing resolution...")
+def _normalize(ctx: PipelineContext):
+    return normalize_page(ctx["rasterize"])
+
+@stage("ocr", requires=("normalize",), label="Running OCR...")
+def _ocr(ctx: PipelineContext):
+    page = ctx["normalize"]
+    results = ocr_service.extract_text(page.ocr_image)
+    # Boxes are reported in the coordinates of the uploaded image
+    for result in results:
+        result["bounding_box"] = page.to_original(result["bounding_box"], page.ocr_scale)
+    return results
+
+@stage("route", requires=("normalize",), optional=("ocr",), label="Identifying document type...")
+def _route(ctx: PipelineContext):
+    return document_router.route(ctx["normalize"].forensic_image, ctx.outputs.get("ocr"))
+
+@stage("layout", requires=("ocr", "route"), label="Running Layout Analysis...")
+def _layout(ctx: PipelineContext):
+    score = layout_analyzer.analyze_spatial_consistency(ctx["ocr"])
+    if get_profile(ctx["route"]).table_checks:
+        score = max(score, layout_analyzer.analyze_table_consistency(ctx["ocr"]))
+    return score
+
+def _forensic_grid(page, values, box=None, colormap: str = "jet") -> ScoreGrid:
+    """A score grid computed on the forensic image (over `box`, or all of it), in page coordinates."""
+    box = box or (0, 0) + page.forensic_image.size
+    return ScoreGrid(values, page.to_page_box(box, page.forensic_scale), page.page.size, colormap)
+
+@stage("ela", requires=("normalize",), label="Running Error Level Analysis...")
+def _ela(ctx: PipelineContext):
+    page = ctx["normalize"]
+    ela_image, ela_score = calculate_ela(page.forensic_image)
+    return _forensic_grid(page, ela_grid(ela_image), colormap="gray"), ela_score
+
+@stage("dl", requires=("normalize", "route"), label="Running Forensic Vision Models...")
+def _dl(ctx: PipelineContext):
+    page, decision = ctx["normalize"], ctx["route"]
+    dl_region = get_profile(decision).dl_region
+    image = page.forensic_image
+    box = None
+    stride = MIN_DL_REGION // 2
+    if dl_region == "face" and decision.face_box and min(image.size) >= MIN_DL_REGION:
+        # Only the portrait is scanned; the grid covers just that region
+        box = region_box(decision.face_box, image.size, min_side=MIN_DL_REGION)
+        image = image.crop(box)
+        ctx.reduce("dl", "face")
+    elif dl_region == "coarse":
+        # Whole page, non-overlapping patches
+        stride = MIN_DL_REGION
+        ctx.reduce("dl", "coarse")
+    grid, dl_score = dl_detector.sliding_window_grid(image, MIN_DL_REGION, stride)
+    return _forensic_grid(page, grid, box), dl_score
+
+@stage("gradcam", requires=("normalize", "dl"), label="Generating AI Explainability Map...")
+def _gradcam(ctx: PipelineContext):
+    _, dl_score = ctx["dl"]
+    if dl_score <= EXPLANATION_THRESHOLD:
+        return None
+    page = ctx["normalize"]
+    return _forensic_grid(page, dl_detector.explanation_grid(page.forensic_image))
+
+@stage("ner", requires=("ocr",), label="Extracting intelligent entities...")
+def _ner(ctx: PipelineContext):
+    return entity_extractor.extract(ctx["ocr"])
+
+@stage("score", requires=("ela", "layout"), optional=("dl",), label="Computing final score...")
+def _score(ctx: PipelineContext):
+    _, ela_score = ctx["ela"]
+    dl_score = ctx["dl"][1] if ctx.has("dl") else None
+    return calculate_final_score(ela_score, ctx["layout"], dl_score)
+
+# Outputs a caller can ask for. `rasterize` and `normalize` are internal.
+OUTPUTS = ["pdf_meta", "ocr", "route", "layout", "ela", "dl", "gradcam", "ner", "score"]
+DEFAULT_OUTPUTS = OUTPUTS
+
+def parse_outputs(outputs: Optional[str]) -> List[str]:
+    """Parses a comma-separated `outputs` request parameter."""
+    if not outputs:
+        return list(DEFAULT_OUTPUTS)
+    return [name.strip() for name in outputs.split(",") if name.strip()]
+
+def plan(outputs: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Resolves the requested outputs to the minimal set of stages that
+    produces them, in execution order.
+    """
+    requested = list(outputs) if outputs is not None else list(DEFAULT_OUTPUTS)
+    unknown = [name for name in requested if name not in OUTPUTS]
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(unknown)}. Expected any of: {', '.join(OUTPUTS)}")
+
+    selected = set()
+    pending = list(requested)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(STAGES[name].requires)
+    return [name for name in STAGES if name in selected]
+
+def run_pipeline(source, extension: str, filename: str, outputs: Optional[Iterable[str]] = None,
+                 on_stage: Optional[Callable[[Stage, int, int], None]] = None) -> PipelineContext:
+    """
+    Runs only the subgraph needed for `outputs` on a document given as a
+    path, raw bytes or PIL image. `on_stage(stage, index, total)` is called
+    before each stage, e.g. to report progress.
+    """
+    ctx = PipelineContext(source, extension, filename)
+    stages = plan(outputs)
+    for index, name in enumerate(stages):
+        current = STAGES[name]
+        if on_stage:
+            on_stage(current, index, len(stages))
+        with stage_timer(name) as timer:
+            ctx.outputs[name] = current.fn(ctx)
+        ctx.timings[name] = round(timer.elapsed, 4)
+    return ctx
+
+def _as_dict(model):
+    if model is None:
+        return None
+    return model.dict() if hasattr(model, "dict") else model
+
+# Stages producing a score grid, i.e. a heatmap artifact
+GRID_STAGES = ["ela", "dl", "gradcam"]
+
+def build_result(ctx: PipelineContext, grids: bool = True, base64_values: bool = False) -> dict:
+    """
+    Assembles the FraudResult-shaped dict from whichever stages ran.
+    Heatmaps are returned as compact score grids (raw bytes, or base64 for
+    JSON with `base64_values`); `grids=False` leaves them out.
+    """
+    def score(name):
+        return round(float(ctx[name][1]), 4) if ctx.has(name) else None
+
+    score_grids = {}
+    for name in GRID_STAGES if grids else []:
+        value = ctx.outputs.get(name)
+        if value is not None:
+            grid = value[0] if isinstance(value, tuple) else value
+            score_grids[name] = grid.to_dict(base64_values)
+
+    pdf_metadata = _as_dict(ctx.outputs.get("pdf_meta"))
+    routing = None
+    if ctx.has("route"):
+        routing = {**ctx["route"].dict(), "reduced_stages": ctx.reductions}
+    final_score, classification = ctx["score"] if ctx.has("score") else (None, None)
+    is_fraud = None
+    if classification is not None:
+        is_fraud = classification != "Authentic" or (pdf_metadata['is_suspicious'] if pdf_metadata else False)
+
+    return {
+        "filename": ctx.filename,
+        "final_score": final_score,
+        "classification": classification,
+        "ela_score": score("ela"),
+        "layout_score": round(float(ctx["layout"]), 4) if ctx.has("layout") else None,
+        "dl_score": score("dl"),
+        "is_fraud": is_fraud,
+        "ocr_data": ctx.outputs.get("ocr") or [],
+        "score_grids": score_grids,
+        "extracted_entities": _as_dict(ctx.outputs.get("ner")),
+        "pdf_metadata": pdf_metadata,
+        "document_type": routing["document_type"] if routing else None,
+        "routing": routing,
+        "normalization": ctx["normalize"].summary() if ctx.has("normalize") else None,
+        "stages": list(ctx.outputs),
+        "stage_timings": dict(ctx.timings)
+    }
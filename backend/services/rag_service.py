@@ -1,81 +1,283 @@
+import codecs
+import hashlib
+import json
 import os
+import shutil
+import threading
+import time
 from typing import List, Dict, Any, Optional
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from pydantic import BaseModel
+from .retriever import HybridRetriever, LRUCache
+from core.metrics import model_load_timer
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[str]
 
+# Policy files picked up from the policy folder
+POLICY_EXTENSIONS = (".pdf", ".txt", ".md")
+# Chunks per add_texts call, and sentences per MiniLM forward pass
+RAG_INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "512"))
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "128"))
+# Analysts ask the same questions all day: cache embeddings and answers
+RAG_QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+
+class IngestionReport(BaseModel):
+    files_scanned: int = 0
+    files_changed: int = 0
+    files_removed: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    chunks_unchanged: int = 0
+    # File path -> load error; such files keep their previously indexed chunks
+    errors: Dict[str, str] = {}
+    duration_s: float = 0.0
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+def _bom_encoding(path: str) -> Optional[str]:
+    """Encoding announced by a byte-order mark, e.g. files saved as "Unicode" on Windows."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+def _chunk_id(source: str, content: str) -> str:
+    """Content-addressed chunk id: an unchanged chunk keeps its id, and its embedding."""
+    return hashlib.sha256(f"{source}\0{content}".encode()).hexdigest()
+
 class RAGService:
-    def __init__(self, db_path: str = "vector_db", policy_doc: str = "data/KYC_Policy_Rulebook_Dummy.txt"):
+    def __init__(self, db_path: str = "vector_db", policy_dir: str = "data"):
         self.db_path = db_path
-        self.policy_doc = policy_doc
+        self.policy_dir = policy_dir
+        # file path -> {"sha256": file hash, "chunks": [chunk ids]}
+        self.manifest_path = os.path.join(db_path, "manifest.json")
         # Initialize small local embedding model
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        with model_load_timer("minilm"):
+            self.embeddings = HuggingFaceEmbeddings(
+                model_name="all-MiniLM-L6-v2",
+                encode_kwargs={"batch_size": RAG_EMBED_BATCH_SIZE}
+            )
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
         self.vector_db = None
+        self.retriever = HybridRetriever(os.path.join(db_path, "retriever"))
+        self.query_embedding_cache = LRUCache(RAG_QUERY_CACHE_SIZE, name="rag_query_embedding")
+        # Answers depend on the index contents; cleared on every reindex
+        self.answer_cache = LRUCache(RAG_QUERY_CACHE_SIZE, name="rag_answer")
+        self._sync_lock = threading.Lock()
         
         # Ensure data directory exists
-        os.makedirs("data", exist_ok=True)
+        os.makedirs(self.policy_dir, exist_ok=True)
         
         # Initialize or load the database
         self._initialize_db()
 
     def _initialize_db(self):
-        """Loads or creates the vector database from the policy PDF."""
-        if os.path.exists(self.db_path) and len(os.listdir(self.db_path)) > 0:
-            print("Loading existing vector database...")
-            self.vector_db = Chroma(persist_directory=self.db_path, embedding_function=self.embeddings)
-        else:
-            if os.path.exists(self.policy_doc):
-                print(f"Ingesting policy document: {self.policy_doc}")
-                self.ingest_document(self.policy_doc)
-            else:
-                print(f"Warning: Policy document not found at {self.policy_doc}. RAG will be limited to base knowledge.")
-                # Create empty DB
-                self.vector_db = Chroma(persist_directory=self.db_path, embedding_function=self.embeddings)
-
-    def ingest_document(self, file_path: str):
-        """Chunks and embeds a PDF or TXT document."""
-        if file_path.endswith(".pdf"):
+        """Loads the vector database and brings it up to date with the policy folder."""
+        self.vector_db = Chroma(persist_directory=self.db_path, embedding_function=self.embeddings)
+        report = self.sync_policies()
+        print(f"Policy index up to date: {report.files_scanned} files, "
+              f"{report.chunks_added} chunks embedded, {report.chunks_removed} removed "
+              f"in {report.duration_s:.2f}s")
+        for file_path, error in report.errors.items():
+            print(f"Could not index {file_path}: {error}")
+
+    def _load_manifest(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: Dict[str, Dict[str, Any]]):
+        os.makedirs(self.db_path, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _policy_files(self) -> List[str]:
+        files = []
+        for root, _, names in os.walk(self.policy_dir):
+            for name in sorted(names):
+                if name.lower().endswith(POLICY_EXTENSIONS):
+                    files.append(os.path.join(root, name))
+        return files
+
+    def _split(self, file_path: str):
+        """Chunks a PDF or text document."""
+        if file_path.lower().endswith(".pdf"):
             loader = PyPDFLoader(file_path)
         else:
-            from langchain_community.document_loaders import TextLoader
-            loader = TextLoader(file_path)
-            
-        documents = loader.load()
-        
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        chunks = text_splitter.split_documents(documents)
-        
-        self.vector_db = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings,
-            persist_directory=self.db_path
+            # Falls back to detecting the encoding when the file has no BOM and isn't UTF-8
+            loader = TextLoader(file_path, encoding=_bom_encoding(file_path), autodetect_encoding=True)
+        return self.text_splitter.split_documents(loader.load())
+
+    def sync_policies(self) -> IngestionReport:
+        """
+        Incrementally re-indexes the policy folder. Unchanged files are
+        skipped on their file hash alone; changed files are re-chunked and
+        only chunks whose content hash is not yet in the store are embedded,
+        in large batches. Chunks of edited or removed files are deleted
+        only once their replacements are stored. A file that fails to load
+        keeps its previous chunks and is listed in the report's `errors`.
+        Safe to call at runtime; concurrent calls are serialised.
+        """
+        with self._sync_lock:
+            start = time.perf_counter()
+            report = IngestionReport()
+            manifest = self._load_manifest()
+            untracked_ids = []
+            if manifest is None:
+                # Store built before chunk hashes were tracked: its ids are unknown,
+                # so everything is re-indexed and the old chunks dropped afterwards
+                untracked_ids = self.vector_db.get(include=[])["ids"]
+                manifest = {}
+
+            # 1. Diff the folder against the manifest
+            pending_ids, pending_texts, pending_metadatas = [], [], []
+            removed_ids = []
+            updated = {}
+            files = self._policy_files()
+            report.files_scanned = len(files)
+            for file_path in files:
+                file_hash = _sha256_file(file_path)
+                previous = manifest.get(file_path)
+                if previous and previous["sha256"] == file_hash:
+                    updated[file_path] = previous
+                    report.chunks_unchanged += len(previous["chunks"])
+                    continue
+
+                try:
+                    chunks = self._split(file_path)
+                except Exception as e:
+                    report.errors[file_path] = str(e)
+                    if previous:
+                        updated[file_path] = previous
+                    continue
+
+                report.files_changed += 1
+                known = set(previous["chunks"]) if previous else set()
+                chunk_ids = []
+                for chunk in chunks:
+                    chunk_id = _chunk_id(file_path, chunk.page_content)
+                    if chunk_id in chunk_ids:
+                        continue
+                    chunk_ids.append(chunk_id)
+                    if chunk_id in known:
+                        report.chunks_unchanged += 1
+                        continue
+                    pending_ids.append(chunk_id)
+                    pending_texts.append(chunk.page_content)
+                    pending_metadatas.append({**chunk.metadata, "source": file_path, "content_sha256": chunk_id})
+                removed_ids.extend(known - set(chunk_ids))
+                updated[file_path] = {"sha256": file_hash, "chunks": chunk_ids}
+
+            for file_path in set(manifest) - set(updated):
+                report.files_removed += 1
+                removed_ids.extend(manifest[file_path]["chunks"])
+
+            # An untracked store is only replaced once every file loaded; until
+            # then its old chunks stay searchable and no manifest is written
+            migrated = not untracked_ids or not report.errors
+            if untracked_ids and migrated:
+                indexed = {chunk_id for entry in updated.values() for chunk_id in entry["chunks"]}
+                removed_ids.extend(chunk_id for chunk_id in untracked_ids if chunk_id not in indexed)
+
+            # 2. Apply the diff: embed new chunks in batches, record them, then drop stale ones
+            for i in range(0, len(pending_ids), RAG_INGEST_BATCH_SIZE):
+                self.vector_db.add_texts(
+                    texts=pending_texts[i:i + RAG_INGEST_BATCH_SIZE],
+                    metadatas=pending_metadatas[i:i + RAG_INGEST_BATCH_SIZE],
+                    ids=pending_ids[i:i + RAG_INGEST_BATCH_SIZE]
+                )
+            report.chunks_added += len(pending_ids)
+            if migrated:
+                self._save_manifest(updated)
+            if removed_ids:
+                self.vector_db.delete(ids=removed_ids)
+            report.chunks_removed += len(removed_ids)
+
+            if pending_ids or removed_ids or not self.retriever.exists():
+                self._rebuild_retriever()
+            elif not self.retriever.loaded:
+                self.retriever.load()
+            report.duration_s = round(time.perf_counter() - start, 3)
+            return report
+
+    def _rebuild_retriever(self):
+        """Snapshots the store into the in-process retriever and drops stale answers."""
+        snapshot = self.vector_db.get(include=["embeddings", "documents", "metadatas"])
+        embeddings = snapshot["embeddings"]
+        self.retriever.build(
+            embeddings if embeddings is not None else [],
+            list(snapshot["documents"]),
+            list(snapshot["metadatas"])
         )
-        self.vector_db.persist()
+        self.answer_cache.clear()
+
+    def ingest_document(self, file_path: str) -> IngestionReport:
+        """Copies a PDF or TXT document into the policy folder and indexes it."""
+        target = os.path.join(self.policy_dir, os.path.basename(file_path))
+        if os.path.abspath(file_path) != os.path.abspath(target):
+            shutil.copyfile(file_path, target)
+        return self.sync_policies()
 
     def query(self, user_query: str) -> ChatResponse:
         """Retrieves relevant chunks and generates an answer."""
-        if not self.vector_db:
+        if self.retriever.size == 0:
             return ChatResponse(answer="I'm sorry, my knowledge base is not initialized.", sources=[])
 
-        # Similarity Search
-        docs = self.vector_db.similarity_search(user_query, k=3)
-        context = "\n\n".join([doc.page_content for doc in docs])
-        sources = [f"Page {doc.metadata.get('page', 'Unknown')}" for doc in docs]
+        key = " ".join(user_query.lower().split())
+        cached = self.answer_cache.get(key)
+        if cached is not None:
+            return cached
+
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(user_query)
+            self.query_embedding_cache.put(key, embedding)
+
+        # Hybrid (dense + BM25) search, in process
+        docs = self.retriever.search(user_query, embedding, k=3)
+        context = "\n\n".join([text for text, _ in docs])
+        sources = [self._source_label(metadata) for _, metadata in docs]
         
         # LLM Logic (Simulated for Local Demo - Replace with OpenAI/LLM call as needed)
         # In a real scenario, you'd pass `context` and `user_query` to an LLM chain.
         simulated_answer = self._generate_simulated_answer(user_query, context)
         
-        return ChatResponse(
+        response = ChatResponse(
             answer=simulated_answer,
             sources=list(set(sources))
         )
+        self.answer_cache.put(key, response)
+        return response
+
+    @staticmethod
+    def _source_label(metadata: Dict[str, Any]) -> str:
+        name = os.path.basename(metadata.get("source", "Policy"))
+        if "page" in metadata:
+            return f"{name}, page {metadata['page'] + 1}"
+        return name
 
     def _generate_simulated_answer(self, query: str, context: str) -> str:
         """A simple heuristic answer generator for demonstration purposes."""
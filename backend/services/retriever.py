@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+import numpy as np
+from core.metrics import record_cache_lookup
+
+# Reciprocal-rank-fusion constant; 60 is the usual choice
+RRF_K = 60
+# Candidates taken from each ranking before fusion
+FUSION_CANDIDATES = int(os.getenv("RAG_FUSION_CANDIDATES", "20"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+class LRUCache:
+    """Small thread-safe LRU cache that counts hits and misses."""
+    def __init__(self, max_size: int, name: str = "lru"):
+        self.max_size = max_size
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = self._data[key]
+            else:
+                self.misses += 1
+                value = None
+        record_cache_lookup(self.name, value is not None)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class BM25Index:
+    """In-memory Okapi BM25 over the chunk texts, with an inverted index."""
+    def __init__(self, texts: Sequence[str]):
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, freq))
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.avg_length = float(self.lengths.mean()) if len(lengths) else 0.0
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        n = len(self.lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            doc_ids = np.fromiter((d for d, _ in postings), dtype=np.int64, count=len(postings))
+            freqs = np.fromiter((f for _, f in postings), dtype=np.float32, count=len(postings))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_ids] / self.avg_length)
+            scores[doc_ids] += idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+        return scores
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best scores, best first, without a full sort."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+class _Snapshot(NamedTuple):
+    """One loaded index; replaced as a whole, never mutated."""
+    matrix: np.ndarray
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+    bm25: BM25Index
+
+_EMPTY = _Snapshot(np.empty((0, 0), dtype=np.float32), [], [], BM25Index([]))
+
+class HybridRetriever:
+    """
+    In-process retrieval over a snapshot of the vector store: a memory-mapped,
+    L2-normalised float32 embedding matrix for dense search plus a BM25
+    keyword index, fused by reciprocal rank. Queries never touch Chroma.
+    """
+    MATRIX_FILE = "embeddings.f32"
+    CHUNKS_FILE = "chunks.json"
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.loaded = False
+        self._snapshot = _EMPTY
+
+    @property
+    def size(self) -> int:
+        return len(self._snapshot.texts)
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.index_dir, self.CHUNKS_FILE))
+
+    def build(self, embeddings: Sequence[Sequence[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """Writes a new snapshot (matrix first, chunk list last) and loads it."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        if texts:
+            matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+        else:
+            # Empty policy folder: an empty index, searched as "no hits"
+            matrix = np.empty((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+
+        matrix_path = os.path.join(self.index_dir, self.MATRIX_FILE)
+        chunks_path = os.path.join(self.index_dir, self.CHUNKS_FILE)
+        matrix.tofile(f"{matrix_path}.tmp")
+        with open(f"{chunks_path}.tmp", "w") as f:
+            json.dump({"dim": matrix.shape[1], "texts": texts, "metadatas": metadatas}, f)
+        os.replace(f"{matrix_path}.tmp", matrix_path)
+        os.replace(f"{chunks_path}.tmp", chunks_path)
+        self.load()
+
+    def load(self):
+        with open(os.path.join(self.index_dir, self.CHUNKS_FILE)) as f:
+            chunks = json.load(f)
+        texts, metadatas = chunks["texts"], chunks["metadatas"]
+        matrix = np.empty((0, chunks["dim"]), dtype=np.float32)
+        if texts:
+            matrix = np.memmap(os.path.join(self.index_dir, self.MATRIX_FILE), dtype=np.float32,
+                               mode="r", shape=(len(texts), chunks["dim"]))
+        # A single attribute write, so a concurrent search sees either snapshot, never a mix
+        self._snapshot = _Snapshot(matrix, texts, metadatas, BM25Index(texts))
+        self.loaded = True
+
+    def search(self, query: str, query_embedding: Sequence[float], k: int = 3) -> List[Tuple[str, Dict[str, Any]]]:
+        matrix, texts, metadatas, bm25 = self._snapshot
+        if not texts:
+            return []
+
+        vector = np.array(query_embedding, dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        dense_ranking = _top_k(matrix @ vector, FUSION_CANDIDATES)
+        keyword_scores = bm25.scores(query)
+        keyword_ranking = _top_k(keyword_scores, FUSION_CANDIDATES)
+        keyword_ranking = keyword_ranking[keyword_scores[keyword_ranking] > 0]
+
+        fused: Dict[int, float] = {}
+        for ranking in (dense_ranking, keyword_ranking):
+            for rank, index in enumerate(ranking.tolist()):
+                fused[index] = fused.get(index, 0.0) + 1.0 / (RRF_K + rank + 1)
+        best = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [(texts[i], metadatas[i]) for i in best]
@@ -1,6 +1,8 @@
-def calculate_final_score(ela_score: float, layout_score: float, dl_score: float = 0.5):
+def calculate_final_score(ela_score: float, layout_score: float, dl_score: float = None):
     """
     Combines ELA, Layout, and Deep Learning scores into a final weighted fraud confidence score.
+    When the Deep Learning stage was not run (dl_score is None), the remaining
+    weights are rescaled to sum to one.
     Returns: (final_score, classification)
     """
     # Weights: 
@@ -11,7 +13,10 @@ def calculate_final_score(ela_score: float, layout_score: float, dl_score: float
     W_DL = 0.5
     W_LAYOUT = 0.2
     
-    final_score = (ela_score * W_ELA) + (dl_score * W_DL) + (layout_score * W_LAYOUT)
+    if dl_score is None:
+        final_score = ((ela_score * W_ELA) + (layout_score * W_LAYOUT)) / (W_ELA + W_LAYOUT)
+    else:
+        final_score = (ela_score * W_ELA) + (dl_score * W_DL) + (layout_score * W_LAYOUT)
     final_score_pct = float(final_score * 100)
     
     classification = "Authentic"
@@ -1,100 +1,109 @@
 import os
 import time
+import uuid
+from celery.signals import task_postrun, task_revoked
 from core.celery_app import celery_app
-from services.ocr_service import ocr_service
-from services.fraud_detector import calculate_ela, image_to_base64
-from services.layout_analyzer import layout_analyzer
-from services.scoring_engine import calculate_final_score
-from services.entity_extractor import entity_extractor
-from services.dl_detector import dl_detector, dl_image_to_base64
-from services.pdf_processor import pdf_processor
+from core.progress import report_progress, publish_event, mark_submitted
+from core.profiling import maybe_profile
+from core.scan_logger import scan_logger, stage_scores
+from core.scheduler import (
+    ANONYMOUS_TENANT, INTERACTIVE_LANE, lane_queue, tenant_key, fair_priority,
+    mark_enqueued, mark_dequeued, acquire_slot, release_slot
+)
+from services.pipeline import run_pipeline, build_result
+
+# Delay before a task deferred by its tenant's concurrency cap is retried
+SLOT_RETRY_SECONDS = 2
 
 @celery_app.task(bind=True)
-def analyze_document_task(self, file_path, original_filename):
+def analyze_document_task(self, file_path, original_filename, tenant=ANONYMOUS_TENANT, max_concurrency=None,
+                          outputs=None, profile=False):
     """
     Heavy ML processing task for document fraud detection.
+    `outputs` selects which pipeline outputs to compute (all by default).
+    With `profile`, the run is profiled and stored under the task id.
     """
-    file_id = os.path.basename(file_path).split('.')[0]
+    if not acquire_slot(tenant, self.request.id, max_concurrency):
+        # Tenant is at its concurrency cap: hand the worker to other tenants' work
+        raise self.retry(countdown=SLOT_RETRY_SECONDS, max_retries=None)
+    mark_dequeued(tenant, self.request.id)
+
+    try:
+        result = _run_analysis(self, file_path, original_filename, outputs, profile)
+        scan_logger.log(
+            company_id=int(tenant) if tenant != ANONYMOUS_TENANT else None,
+            filename=original_filename,
+            final_score=result["final_score"],
+            classification=result["classification"],
+            stage_scores=stage_scores(result),
+            stage_durations=result["stage_timings"]
+        )
+        return result
+    finally:
+        release_slot(tenant, self.request.id)
+
+def _run_analysis(self, file_path, original_filename, outputs=None, profile=False):
     extension = os.path.splitext(file_path)[1].lower()
-    upload_dir = os.path.dirname(file_path)
     
+    def on_stage(stage, index, total):
+        # Real percentages from the planned stage graph (5% .. 95%)
+        report_progress(self, stage.name, 5 + int(90 * index / total), stage.label)
+
     try:
         # Update state: Processing
-        self.update_state(state='PROGRESS', meta={'message': 'Initializing analysis...'})
-        
-        # 1. PDF Handling
-        pdf_metadata = None
-        processing_path = file_path
-        
-        if extension == '.pdf':
-            self.update_state(state='PROGRESS', meta={'message': 'Extracting PDF metadata...'})
-            pdf_metadata = pdf_processor.extract_metadata(file_path)
-            images = pdf_processor.convert_to_images(file_path)
-            if not images:
-                raise Exception("Failed to convert PDF to image.")
-            
-            # Use the first page for analysis
-            temp_img_path = os.path.join(upload_dir, f"{file_id}_page1.jpg")
-            images[0].save(temp_img_path, "JPEG")
-            processing_path = temp_img_path
-
-        # 2. OCR and Layout Analysis
-        self.update_state(state='PROGRESS', meta={'message': 'Running OCR and Layout Analysis...'})
-        ocr_results = ocr_service.extract_text(processing_path)
-        layout_score = layout_analyzer.analyze_spatial_consistency(ocr_results)
-        
-        # 3. Visual Fraud Detection (ELA + DL)
-        self.update_state(state='PROGRESS', meta={'message': 'Running Forensic Vision Models...'})
-        ela_image, ela_score = calculate_ela(processing_path)
-        heatmap_base64 = image_to_base64(ela_image)
-        
-        dl_image, dl_score = dl_detector.sliding_window_inference(processing_path)
-        dl_heatmap_base64 = dl_image_to_base64(dl_image)
-        
-        # 4. Final Scoring
-        final_score, classification = calculate_final_score(ela_score, layout_score, dl_score)
-        
-        # 5. NLP Entity Extraction
-        self.update_state(state='PROGRESS', meta={'message': 'Extracting intelligent entities...'})
-        extracted_entities = entity_extractor.extract(ocr_results)
-        
-        # Convert extracted entities to dict if it's a Pydantic model
-        if hasattr(extracted_entities, "dict"):
-            extracted_entities = extracted_entities.dict()
+        report_progress(self, 'init', 0, 'Initializing analysis...')
+        with maybe_profile(self.request.id if profile else None):
+            ctx = run_pipeline(file_path, extension, original_filename, outputs, on_stage=on_stage)
         
-        # Convert pdf_metadata to dict if it exists
-        if hasattr(pdf_metadata, "dict"):
-            pdf_metadata = pdf_metadata.dict()
-
-        # 6. Generate AI Explanation if needed
-        ai_explanation_64 = None
-        if dl_score > 0.2:
-            self.update_state(state='PROGRESS', meta={'message': 'Generating AI Explainability Map...'})
-            explanation_img = dl_detector.generate_explanation(processing_path)
-            ai_explanation_64 = dl_image_to_base64(explanation_img)
-
-        result = {
-            "filename": original_filename,
-            "final_score": final_score,
-            "classification": classification,
-            "ela_score": round(float(ela_score), 4),
-            "layout_score": round(float(layout_score), 4),
-            "dl_score": round(float(dl_score), 4),
-            "is_fraud": classification != "Authentic" or (pdf_metadata['is_suspicious'] if pdf_metadata else False),
-            "ocr_data": ocr_results,
-            "heatmap_base64": heatmap_base64,
-            "dl_heatmap_base64": dl_heatmap_base64,
-            "extracted_entities": extracted_entities,
-            "pdf_metadata": pdf_metadata,
-            "ai_explanation_64": ai_explanation_64
-        }
-        
-        return result
+        # Score grids travel as raw bytes through the binary result codec;
+        # the API base64-encodes them only when answering JSON clients.
+        return build_result(ctx)
 
     except Exception as e:
         self.update_state(state='FAILURE', meta={'error': str(e)})
         raise e
-    finally:
-        # Cleanup page image if it was created
-        if extension == '.pdf' and 'temp_img_path' in locals() and os.path.exists(temp_img_path):
-            os.remove(temp_img_path)
+
+@task_postrun.connect(sender=analyze_document_task)
+def _announce_completion(task_id=None, state=None, **kwargs):
+    """
+    Runs after the result has been stored, so streaming clients can fetch it
+    as soon as they receive this event.
+    """
+    if state not in ("SUCCESS", "FAILURE"):
+        return
+    publish_event(task_id, "done", {"state": state, "progress": 100})
+
+@task_revoked.connect(sender=analyze_document_task)
+def _forget_revoked(request=None, **kwargs):
+    """A revoked or expired task never starts, so it leaves its tenant's queue here."""
+    if request is not None:
+        mark_dequeued((request.kwargs or {}).get("tenant", ANONYMOUS_TENANT), request.id)
+
+def submit_analysis(file_path, original_filename, company=None, lane=INTERACTIVE_LANE, outputs=None, profile=False):
+    """
+    Enqueues an analysis task on the requested lane, keyed by the client
+    company so that tenants are scheduled fairly against each other.
+    """
+    queue = lane_queue(lane)
+    tenant = tenant_key(company)
+    weight = company.scheduling_weight if company is not None else None
+    max_concurrency = company.max_concurrent_tasks if company is not None else None
+
+    priority = fair_priority(tenant, weight)
+    # The id is chosen up front so the task is counted before a worker can start it
+    task_id = str(uuid.uuid4())
+    mark_enqueued(tenant, task_id)
+    try:
+        task = analyze_document_task.apply_async(
+            task_id=task_id,
+            args=[file_path, original_filename],
+            kwargs={"tenant": tenant, "max_concurrency": max_concurrency, "outputs": outputs,
+                    "profile": profile},
+            queue=queue,
+            priority=priority
+        )
+    except Exception:
+        mark_dequeued(tenant, task_id)
+        raise
+    mark_submitted(task.id)
+    return task
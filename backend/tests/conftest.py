@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app imports its packages (core, services, models) from backend/, so the
+# suite runs from there or from the repository root alike
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,24 @@
+import json
+import pytest
+import bulk_analyze
+
+def test_unknown_outputs_fail_before_the_pool_starts(tmp_path, monkeypatch, capsys):
+    pytest.importorskip("torch")
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("pool started")
+    monkeypatch.setattr(bulk_analyze.multiprocessing, "get_context", no_pool)
+    with pytest.raises(SystemExit) as exc:
+        bulk_analyze.main([str(tmp_path), "--output", str(tmp_path / "out.jsonl"), "--outputs", "ela,nope"])
+    assert exc.value.code == 2
+    assert "Unknown outputs: nope" in capsys.readouterr().err
+
+def test_checkpoint_skips_done_and_truncated_rows(tmp_path):
+    checkpoint = tmp_path / "out.jsonl.checkpoint.jsonl"
+    checkpoint.write_text(
+        json.dumps({"path": "a.png"}) + "\n"
+        + json.dumps({"path": "b.png", "error": "boom"}) + "\n"
+        + '{"path": "c.pn'
+    )
+    assert bulk_analyze.load_checkpoint(str(checkpoint)) == {"a.png", "b.png"}
+    assert bulk_analyze.load_checkpoint(str(checkpoint), retry_errors=True) == {"a.png"}
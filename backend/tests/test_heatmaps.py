@@ -0,0 +1,45 @@
+import io
+import numpy as np
+import pytest
+from PIL import Image
+from services.heatmaps import TILE_SIZE, ScoreGrid, pyramid_info, render_image, render_tile
+
+def png_size(data):
+    return Image.open(io.BytesIO(data)).size
+
+@pytest.fixture
+def grid():
+    # Covers the left half of a 1000x600 page
+    return ScoreGrid(np.array([[0.0, 1.0], [0.5, 0.25]], dtype=np.float32), (0, 0, 500, 600), (1000, 600))
+
+@pytest.mark.parametrize("base64_values", [False, True])
+def test_dict_round_trip_quantizes_to_a_byte(grid, base64_values):
+    data = grid.to_dict(base64_values)
+    assert isinstance(data["values"], str) == base64_values
+    restored = ScoreGrid.from_dict(data)
+    np.testing.assert_allclose(restored.values, grid.values, atol=1 / 255)
+    assert restored.box == grid.box and restored.page_size == grid.page_size
+
+def test_pyramid_levels_halve_down_to_one_pixel():
+    assert pyramid_info((1000, 600)) == {
+        "width": 1000, "height": 600, "tile_size": TILE_SIZE, "max_level": 10, "format": "png",
+    }
+
+def test_tiles_are_cropped_at_the_page_edge(grid):
+    assert png_size(render_tile(grid, 10, 0, 0)) == (TILE_SIZE, TILE_SIZE)
+    # 1000 = 3 * 256 + 232, 600 = 2 * 256 + 88
+    assert png_size(render_tile(grid, 10, 3, 2)) == (232, 88)
+    assert png_size(render_tile(grid, 0, 0, 0)) == (1, 1)
+
+def test_tiles_outside_the_pyramid_are_rejected(grid):
+    with pytest.raises(ValueError):
+        render_tile(grid, 11, 0, 0)
+    with pytest.raises(ValueError):
+        render_tile(grid, 10, 4, 0)
+
+def test_region_outside_the_grid_is_transparent(grid):
+    image = Image.open(io.BytesIO(render_image(grid, width=100)))
+    assert image.size == (100, 60)
+    alpha = np.asarray(image)[..., 3]
+    assert alpha[:, :50].min() == 255
+    assert alpha[:, 50:].max() == 0
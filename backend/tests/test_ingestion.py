@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import io
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from core import ingestion
+from core.ingestion import RequestSizeLimitMiddleware, ingest_upload
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\0" * 100
+PDF = b"%PDF-1.7\n" + b"\0" * 100
+
+def ingest(data: bytes, filename: str, max_bytes=None):
+    return asyncio.run(ingest_upload(StarletteUploadFile(io.BytesIO(data), filename=filename), max_bytes))
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "STORAGE_ROOT", str(tmp_path))
+    monkeypatch.setattr(ingestion, "INCOMING_DIR", str(tmp_path / ".incoming"))
+    return tmp_path
+
+@pytest.mark.parametrize("data, filename, status", [
+    (JPEG, "scan.gif", 400),
+    (b"GIF89a" + b"\0" * 10, "scan.jpg", 415),
+    (PDF, "scan.jpg", 400),
+    (b"", "scan.pdf", 400),
+])
+def test_rejected_uploads(data, filename, status):
+    with pytest.raises(HTTPException) as e:
+        ingest(data, filename)
+    assert e.value.status_code == status
+
+def test_oversized_upload_is_rejected_and_leaves_no_temp_file(store, monkeypatch):
+    monkeypatch.setattr(ingestion, "SPOOL_MAX_BYTES", 16)
+    monkeypatch.setattr(ingestion, "CHUNK_SIZE", 32)
+    with pytest.raises(HTTPException) as e:
+        ingest(PDF + b"\0" * 200, "big.pdf", max_bytes=128)
+    assert e.value.status_code == 413
+    assert not list((store / ".incoming").glob("*"))
+
+def test_small_upload_stays_in_memory():
+    upload = ingest(JPEG, "photo.JPEG")
+    assert upload.in_memory
+    assert upload.extension == ".jpg"
+    assert upload.sha256 == hashlib.sha256(JPEG).hexdigest()
+
+def test_large_upload_spools_to_disk_and_persists_by_content_hash(store, monkeypatch):
+    monkeypatch.setattr(ingestion, "SPOOL_MAX_BYTES", 16)
+    monkeypatch.setattr(ingestion, "CHUNK_SIZE", 32)
+    upload = ingest(PDF, "statement.pdf")
+    assert not upload.in_memory
+    path = upload.persist()
+    assert path == ingestion.storage_path(upload.sha256, ".pdf")
+    with open(path, "rb") as f:
+        assert f.read() == PDF
+    assert not list((store / ".incoming").glob("*"))
+
+def test_discard_removes_the_spooled_file(store, monkeypatch):
+    monkeypatch.setattr(ingestion, "SPOOL_MAX_BYTES", 16)
+    monkeypatch.setattr(ingestion, "CHUNK_SIZE", 32)
+    upload = ingest(PDF, "statement.pdf")
+    upload.discard()
+    assert not list((store / ".incoming").glob("*"))
+
+def _limited_app(max_bytes):
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=max_bytes)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+    return app
+
+def test_request_over_the_body_limit_is_rejected_from_content_length():
+    client = TestClient(_limited_app(1024))
+    response = client.post("/upload", files={"file": ("scan.pdf", PDF + b"\0" * 2048)})
+    assert response.status_code == 413
+
+def test_chunked_request_over_the_body_limit_is_rejected_while_streaming():
+    client = TestClient(_limited_app(1024))
+    body = iter([b"x" * 600, b"x" * 600])
+    response = client.post("/upload", content=body,
+                           headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+
+def test_request_within_the_body_limit_passes():
+    client = TestClient(_limited_app(4096))
+    response = client.post("/upload", files={"file": ("scan.pdf", PDF)})
+    assert response.json() == {"size": len(PDF)}
@@ -0,0 +1,33 @@
+from sqlalchemy import Boolean, Column, Index, Integer, MetaData, String, Table, create_engine, inspect, text
+from core.migrations import upgrade_schema
+
+def scans_table(metadata, *extra):
+    return Table("scans", metadata, Column("id", Integer, primary_key=True), Column("name", String), *extra)
+
+def test_upgrade_adds_columns_and_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    old = MetaData()
+    scans_table(old)
+    old.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO scans (name) VALUES ('existing')"))
+
+    new = MetaData()
+    scans_table(
+        new,
+        Column("tenant", String, default="public"),
+        Column("flagged", Boolean, default=False),
+        Index("ix_scans_tenant", "tenant"),
+    )
+    Table("events", new, Column("id", Integer, primary_key=True))
+    upgrade_schema(engine, new)
+    # Running it again is a no-op
+    upgrade_schema(engine, new)
+
+    inspector = inspect(engine)
+    assert {c["name"] for c in inspector.get_columns("scans")} == {"id", "name", "tenant", "flagged"}
+    assert "ix_scans_tenant" in {i["name"] for i in inspector.get_indexes("scans")}
+    assert inspector.has_table("events")
+    with engine.connect() as conn:
+        # Existing rows pick up the scalar defaults
+        assert conn.execute(text("SELECT tenant, flagged FROM scans")).one() == ("public", 0)
@@ -0,0 +1,24 @@
+import pytest
+
+pipeline = pytest.importorskip("services.pipeline", exc_type=ImportError)
+
+def test_plan_pulls_in_requirements_in_order():
+    assert pipeline.plan(["ela"]) == ["rasterize", "normalize", "ela"]
+    assert pipeline.plan(["layout"]) == ["rasterize", "normalize", "ocr", "route", "layout"]
+
+def test_optional_inputs_do_not_add_stages():
+    # score uses dl when it runs anyway, but never asks for it
+    assert "dl" not in pipeline.plan(["score"])
+    assert "ocr" in pipeline.plan(["route", "ocr"])
+    assert "ocr" not in pipeline.plan(["route"])
+
+def test_default_plan_runs_every_stage():
+    assert pipeline.plan() == list(pipeline.STAGES)
+
+def test_unknown_outputs_are_rejected():
+    with pytest.raises(ValueError, match="Unknown outputs: nope"):
+        pipeline.plan(["ela", "nope"])
+
+def test_parse_outputs():
+    assert pipeline.parse_outputs(None) == pipeline.DEFAULT_OUTPUTS
+    assert pipeline.parse_outputs(" ela, ner,") == ["ela", "ner"]
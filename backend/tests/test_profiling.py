@@ -0,0 +1,53 @@
+import threading
+import fakeredis
+import pytest
+from core import profiling
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(profiling, "get_redis", lambda: client)
+    return client
+
+def test_profiled_run_is_stored():
+    with profiling.maybe_profile("p1"):
+        sum(range(1000))
+    assert "Pipeline wall time" in profiling.load_profile("p1")["summary"]
+
+def test_concurrent_profiled_runs_do_not_fail():
+    inside, release = threading.Event(), threading.Event()
+
+    def first():
+        with profiling.maybe_profile("first"):
+            inside.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    inside.wait(5)
+    # The second run goes ahead unprofiled instead of raising
+    with profiling.maybe_profile("second"):
+        ran = True
+    release.set()
+    thread.join()
+
+    assert ran
+    assert profiling.load_profile("first") is not None
+    assert profiling.load_profile("second") is None
+
+def test_profiler_failing_to_start_does_not_fail_the_run(monkeypatch):
+    working_enter = profiling.PipelineProfile.__enter__
+
+    def broken_enter(self):
+        raise ValueError("Another profiling tool is already active")
+    monkeypatch.setattr(profiling.PipelineProfile, "__enter__", broken_enter)
+
+    with profiling.maybe_profile("broken"):
+        ran = True
+    assert ran
+    assert profiling.load_profile("broken") is None
+    # The lock was released: the next run is profiled again
+    monkeypatch.setattr(profiling.PipelineProfile, "__enter__", working_enter)
+    with profiling.maybe_profile("after"):
+        pass
+    assert profiling.load_profile("after") is not None
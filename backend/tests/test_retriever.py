@@ -0,0 +1,20 @@
+from services.retriever import HybridRetriever
+
+def test_empty_corpus_builds_and_returns_no_hits(tmp_path):
+    retriever = HybridRetriever(str(tmp_path))
+    retriever.build([], [], [])
+
+    assert retriever.exists()
+    assert retriever.size == 0
+    assert retriever.search("kyc policy", [0.1, 0.2, 0.3]) == []
+
+def test_rebuild_to_empty_corpus(tmp_path):
+    retriever = HybridRetriever(str(tmp_path))
+    retriever.build([[1.0, 0.0], [0.0, 1.0]], ["aadhaar checks", "pan checks"], [{"source": "a"}, {"source": "b"}])
+    assert retriever.search("aadhaar", [1.0, 0.0], k=1) == [("aadhaar checks", {"source": "a"})]
+
+    retriever.build([], [], [])
+    reloaded = HybridRetriever(str(tmp_path))
+    reloaded.load()
+    assert retriever.size == reloaded.size == 0
+    assert reloaded.search("aadhaar", [1.0, 0.0]) == []
@@ -0,0 +1,17 @@
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+
+main = pytest.importorskip("main", exc_type=ImportError)
+
+def test_cursor_round_trip():
+    scan = SimpleNamespace(timestamp=datetime(2024, 5, 1, 12, 30, 15, 123456), id=42)
+    cursor = main._encode_cursor(scan)
+    assert "=" not in cursor
+    assert main._decode_cursor(cursor) == (scan.timestamp, 42)
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "MjAyNC0wNS0wMQ"])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(main.HTTPException) as exc:
+        main._decode_cursor(cursor)
+    assert exc.value.status_code == 400
@@ -0,0 +1,65 @@
+import time
+import fakeredis
+import pytest
+from core import scheduler
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(scheduler, "get_redis", lambda: client)
+    monkeypatch.setattr(scheduler, "FAIR_SHARE_STEP", 2)
+    return client
+
+def enqueue(tenant, count):
+    for i in range(count):
+        scheduler.mark_enqueued(tenant, f"{tenant}-{i}")
+
+def test_priority_drops_with_queued_backlog():
+    assert scheduler.fair_priority("a") == 0
+    enqueue("a", 4)
+    assert scheduler.fair_priority("a") == 2
+    # A heavier tenant gets a larger share before it sinks
+    assert scheduler.fair_priority("a", weight=2) == 1
+    assert scheduler.fair_priority("b") == 0
+
+def test_priority_is_capped():
+    enqueue("a", 100)
+    assert scheduler.fair_priority("a") == scheduler.PRIORITY_STEPS[-1]
+
+def test_dequeued_tasks_stop_counting():
+    enqueue("a", 4)
+    for i in range(4):
+        scheduler.mark_dequeued("a", f"a-{i}")
+    assert scheduler.queued_count("a") == 0
+    assert scheduler.queue_depths()["tenants"] == {}
+
+def test_lost_queued_tasks_expire(fake_redis):
+    enqueue("a", 4)
+    stale = time.time() - scheduler.QUEUED_LEASE_SECONDS - 1
+    fake_redis.zadd("scheduler:queued:a", {"a-0": stale, "a-1": stale})
+    assert scheduler.queued_count("a") == 2
+    assert scheduler.fair_priority("a") == 1
+
+def test_slots_are_limited_per_tenant():
+    assert scheduler.acquire_slot("a", "t1", max_concurrency=1)
+    assert not scheduler.acquire_slot("a", "t2", max_concurrency=1)
+    assert scheduler.acquire_slot("b", "t3", max_concurrency=1)
+    scheduler.release_slot("a", "t1")
+    assert scheduler.acquire_slot("a", "t2", max_concurrency=1)
+
+def test_crashed_worker_slot_lease_expires(fake_redis):
+    stale = time.time() - scheduler.SLOT_LEASE_SECONDS - 1
+    fake_redis.zadd("scheduler:running:a", {"crashed": stale})
+    assert scheduler.acquire_slot("a", "t1", max_concurrency=1)
+
+def test_queue_depths_reports_tenants():
+    enqueue("a", 3)
+    enqueue("b", 1)
+    scheduler.mark_dequeued("b", "b-0")
+    scheduler.acquire_slot("b", "b-0")
+    depths = scheduler.queue_depths()
+    assert depths["lanes"] == {scheduler.INTERACTIVE_LANE: 0, scheduler.BULK_LANE: 0}
+    assert depths["tenants"] == {
+        "a": {"queued": 3, "running": 0},
+        "b": {"queued": 0, "running": 1},
+    }
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from core import serialization
+
+def test_round_trip_keeps_arrays_and_bytes():
+    payload = {
+        "grid": np.arange(12, dtype=np.float32).reshape(3, 4),
+        "raw": b"\x00\xff",
+        "score": np.float64(0.25),
+        "tags": {"a"},
+        1: "int key",
+    }
+    restored = serialization.loads(serialization.dumps(payload))
+    assert restored["grid"].dtype == np.float32
+    np.testing.assert_array_equal(restored["grid"], payload["grid"])
+    assert restored["raw"] == b"\x00\xff"
+    assert restored["score"] == 0.25
+    assert restored["tags"] == ["a"]
+    assert restored[1] == "int key"
+
+def test_non_contiguous_arrays_and_memoryviews():
+    array = np.arange(20, dtype=np.uint8).reshape(4, 5)[:, ::2]
+    data = serialization.dumps(array)
+    np.testing.assert_array_equal(serialization.loads(memoryview(data)), array)
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(TypeError, match="object"):
+        serialization.dumps(object())
@@ -1,6 +1,9 @@
 import streamlit as st
 import requests
-import base64
+import httpx
+import asyncio
+import json
+import hashlib
 import pandas as pd
 from PIL import Image
 from io import BytesIO
@@ -122,10 +125,23 @@ with st.sidebar:
                     st.session_state.messages.append({"role": "assistant", "content": full_res})
 
 # --- API Integration Helper ---
-def call_api(endpoint, files):
+# Pipeline outputs of both vision engines, requested once per document so
+# switching engines only changes which heatmap is shown
+ANALYSIS_OUTPUTS = "pdf_meta,ela,dl,gradcam,ner,score"
+
+def call_api(endpoint, files, params=None):
     url = f"{backend_base}{endpoint}"
     try:
-        response = requests.post(url, files=files, timeout=60)
+        response = requests.post(url, files=files, params=params, timeout=60)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        return {"error": str(e)}
+
+def call_cross_validation(task_ids):
+    url = f"{backend_base}/kyc/cross-validate"
+    try:
+        response = requests.post(url, json={"task_ids": task_ids}, timeout=30)
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -140,48 +156,185 @@ def call_chat_api(question):
     except Exception as e:
         return {"error": str(e)}
 
-def check_status(task_id):
+def check_status(task_id, images=True):
     url = f"{backend_base}/status/{task_id}"
     try:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, params={"images": images}, timeout=10)
         response.raise_for_status()
         return response.json()
     except Exception as e:
         return {"status": "ERROR", "error": str(e)}
 
+def stream_status(task_id):
+    """
+    Yields status updates pushed by the backend's Server-Sent Events stream.
+    Falls back to polling /status if the stream cannot be opened.
+    Results come without heatmaps; see fetch_artifact.
+    """
+    url = f"{backend_base}/stream/{task_id}"
+    try:
+        with requests.get(url, params={"images": False}, stream=True, timeout=(10, 60)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    status_res = json.loads(line[len("data:"):])
+                    yield status_res
+                    if status_res["status"] in ("SUCCESS", "FAILURE"):
+                        return
+    except Exception:
+        pass
+
+    while True:
+        status_res = check_status(task_id, images=False)
+        yield status_res
+        if status_res["status"] in ("SUCCESS", "FAILURE", "ERROR"):
+            return
+        time.sleep(2)
+
+# --- Concurrent KYC Submission ---
+TERMINAL_STATUSES = ("SUCCESS", "FAILURE", "ERROR")
+
+async def stream_status_async(client, task_id):
+    """Async counterpart of stream_status, for tracking many tasks at once."""
+    try:
+        async with client.stream("GET", f"/stream/{task_id}", params={"images": False}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    status_res = json.loads(line[len("data:"):])
+                    yield status_res
+                    if status_res["status"] in TERMINAL_STATUSES:
+                        return
+    except httpx.HTTPError:
+        pass
+
+    while True:
+        try:
+            response = await client.get(f"/status/{task_id}", params={"images": False})
+            response.raise_for_status()
+            status_res = response.json()
+        except httpx.HTTPError as e:
+            status_res = {"status": "ERROR", "error": str(e)}
+        yield status_res
+        if status_res["status"] in TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(2)
+
+async def track_document(client, upload, outputs, slot):
+    """
+    Submits one document to /analyze and renders its progress in `slot`
+    until it finishes. Returns (task_id, result), with result None on failure.
+    """
+    name = upload.name
+    try:
+        slot.info(f"📤 {name}: uploading...")
+        response = await client.post(
+            "/analyze",
+            files={"file": (upload.name, upload.getvalue(), upload.type)},
+            params={"outputs": outputs}
+        )
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+    except httpx.HTTPError as e:
+        slot.error(f"❌ {name}: {e}")
+        return None, None
+
+    async for status_res in stream_status_async(client, task_id):
+        if status_res["status"] == "SUCCESS":
+            result = status_res["result"]
+            slot.success(f"✅ {name}: {result['classification']} ({result['final_score']}%)")
+            return task_id, result
+        elif status_res["status"] in ("FAILURE", "ERROR"):
+            slot.error(f"❌ {name}: {status_res.get('error')}")
+            return task_id, None
+        else:
+            slot.progress(status_res.get("progress", 0), text=f"{name}: {status_res.get('message') or 'Queued...'}")
+    return task_id, None
+
+async def run_kyc_pack(uploads, outputs, slots):
+    """Analyses every document concurrently; wall time is that of the slowest one."""
+    async with httpx.AsyncClient(base_url=backend_base, timeout=httpx.Timeout(30.0, read=60.0)) as client:
+        return await asyncio.gather(*(
+            track_document(client, upload, outputs, slot) for upload, slot in zip(uploads, slots)
+        ))
+
+# --- Result Cache ---
+# Heatmaps are fetched one at a time, downscaled to the display size
+HEATMAP_DISPLAY_WIDTH = 800
+
+class ResultPending(Exception):
+    """Raised while a task has no result yet, so nothing gets cached."""
+
+def file_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def submit_analysis(file_hash, outputs, backend, _file):
+    """Submits a document once per (content, outputs, backend); reruns reuse the task."""
+    res = call_api("/analyze", {"file": _file}, params={"outputs": outputs})
+    if "error" in res:
+        raise RuntimeError(res["error"])
+    return res["task_id"]
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def fetch_result(task_id, backend):
+    """Finished result of a task, without heatmaps."""
+    status_res = check_status(task_id, images=False)
+    if status_res["status"] != "SUCCESS":
+        raise ResultPending(status_res)
+    return status_res["result"]
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def fetch_artifact(task_id, name, width, backend):
+    """One heatmap of a finished task as PNG bytes."""
+    url = f"{backend}/results/{task_id}/artifacts/{name}"
+    response = requests.get(url, params={"width": width}, timeout=30)
+    response.raise_for_status()
+    return response.content
+
 # --- UI Logic ---
 if mode == "Single Document":
     uploaded_file = st.file_uploader("Upload document for forensic analysis", type=["jpg", "jpeg", "png", "pdf"])
     
     if uploaded_file:
+        file_bytes = uploaded_file.getvalue()
+        # Analyses are keyed by content, so reruns and re-uploads reuse the result
+        analysis_key = (file_digest(file_bytes), ANALYSIS_OUTPUTS, backend_base)
+        if "analyses" not in st.session_state:
+            st.session_state.analyses = set()
+
         if st.button("🚀 Analyze Document", use_container_width=True):
-            files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-            init_res = call_api("/analyze", files)
-            
-            if "error" in init_res:
-                st.error(f"Backend Error: {init_res['error']}")
-            else:
-                task_id = init_res["task_id"]
+            st.session_state.analyses.add(analysis_key)
+
+        if analysis_key in st.session_state.analyses:
+            try:
+                task_id = submit_analysis(*analysis_key, _file=(uploaded_file.name, file_bytes, uploaded_file.type))
+            except Exception as e:
+                st.session_state.analyses.discard(analysis_key)
+                st.error(f"Backend Error: {e}")
+                st.stop()
+
+            try:
+                result = fetch_result(task_id, backend_base)
+            except ResultPending:
                 status_container = st.empty()
                 progress_bar = st.progress(0)
                 
                 with st.spinner("Models analyzing document in background..."):
-                    while True:
-                        status_res = check_status(task_id)
-                        
+                    for status_res in stream_status(task_id):
                         if status_res["status"] == "SUCCESS":
-                            result = status_res["result"]
                             status_container.success("Analysis Complete!")
                             progress_bar.progress(100)
                             time.sleep(1) # Brief pause to show completion
                             status_container.empty()
                             progress_bar.empty()
                             break
-                        elif status_res["status"] == "FAILURE":
-                            st.error(f"Analysis Failed: {status_res.get('error')}")
-                            st.stop()
-                        elif status_res["status"] == "ERROR":
-                            st.error(f"Polling Error: {status_res.get('error')}")
+                        elif status_res["status"] in ("FAILURE", "ERROR"):
+                            # Forget the task so the next click submits a fresh one
+                            st.session_state.analyses.discard(analysis_key)
+                            submit_analysis.clear()
+                            label = "Analysis Failed" if status_res["status"] == "FAILURE" else "Polling Error"
+                            st.error(f"{label}: {status_res.get('error')}")
                             st.stop()
                         else:
                             # It's still processing
@@ -189,157 +342,170 @@ if mode == "Single Document":
                             prog = status_res.get("progress", 0)
                             status_container.info(f"⏳ {msg}")
                             progress_bar.progress(prog)
-                        
-                        time.sleep(2)
+                result = fetch_result(task_id, backend_base)
 
-                    # Dashboard Layout (rendering with 'result' from the task)
-                    st.success("Analysis Results Loaded")
-                    
-                    # Dashboard Layout
-                    m1, m2, m3 = st.columns(3)
-                    label = result.get('classification', 'Unknown')
-                    m1.metric("Classification", label, delta="Warning" if label != "Authentic" else "Normal", delta_color="inverse")
-                    m2.metric("Fraud Score", f"{result.get('final_score', 0)}%")
-                    m3.metric("Status", "⚠️ Alert" if result.get('is_fraud') else "✅ Safe")
-                    
-                    st.divider()
-                    col_img1, col_img2 = st.columns(2)
-                    with col_img1:
-                        st.subheader("Original")
-                        st.image(uploaded_file, use_column_width=True)
-                    with col_img2:
-                        if vision_engine == "Baseline (ELA)":
-                            st.subheader("Tampering Map (ELA)")
-                            heatmap_data = base64.b64decode(result['heatmap_base64'])
-                        else:
-                            st.subheader("Deep Learning Map (ViT)")
-                            heatmap_data = base64.b64decode(result['dl_heatmap_base64'])
-                            
-                        st.image(Image.open(BytesIO(heatmap_data)), use_column_width=True, caption=f"Engine: {vision_engine}")
+            # Dashboard Layout (rendering with 'result' from the task)
+            st.success("Analysis Results Loaded")
+            artifacts = result.get('artifacts', [])
+            
+            # Dashboard Layout
+            m1, m2, m3 = st.columns(3)
+            label = result.get('classification', 'Unknown')
+            m1.metric("Classification", label, delta="Warning" if label != "Authentic" else "Normal", delta_color="inverse")
+            m2.metric("Fraud Score", f"{result.get('final_score', 0)}%")
+            m3.metric("Status", "⚠️ Alert" if result.get('is_fraud') else "✅ Safe")
+            routing = result.get('routing')
+            if routing:
+                reduced = ", ".join(f"{name} ({info['mode']})" for name, info in routing.get('reduced_stages', {}).items()) or "none"
+                st.caption(f"Document type: {routing['document_type'].replace('_', ' ')} "
+                           f"(confidence {routing['confidence']:.0%}, routed in {routing['cost_ms']:.0f} ms; reduced: {reduced})")
+            
+            st.divider()
+            col_img1, col_img2 = st.columns(2)
+            with col_img1:
+                st.subheader("Original")
+                st.image(uploaded_file, use_column_width=True)
+            with col_img2:
+                if vision_engine == "Baseline (ELA)":
+                    st.subheader("Tampering Map (ELA)")
+                    artifact = "ela"
+                else:
+                    st.subheader("Deep Learning Map (ViT)")
+                    artifact = "dl"
                     
-                    # Extracted Entities
-                    entities = result.get('extracted_entities')
-                    if entities:
-                        st.divider()
-                        st.subheader("📝 Intelligent Data Extraction")
-                        e1, e2, e3 = st.columns(3)
-                        e1.write(f"**Name:** {entities['person_name']}")
-                        e2.write(f"**Address:** {entities['address']}")
-                        e3.write(f"**Date:** {entities['date']}")
-
-                    # 4. Digital Forensics (PDF only)
-                    pdf_meta = result.get('pdf_metadata')
-                    if pdf_meta:
-                        st.divider()
-                        with st.expander("🔍 Digital Forensics & Metadata", expanded=pdf_meta.get('is_suspicious')):
-                            if pdf_meta.get('is_suspicious'):
-                                st.error("⚠️ **Digital Forgery Warning**: Suspicious metadata anomalies detected.")
-                                for reason in pdf_meta.get('suspicious_reasons', []):
-                                    st.write(f"- {reason}")
-                                st.divider()
-                            
-                            m_col1, m_col2 = st.columns(2)
-                            with m_col1:
-                                st.write("**Author:**", pdf_meta.get('author'))
-                                st.write("**Creator:**", pdf_meta.get('creator'))
-                                st.write("**Producer:**", pdf_meta.get('producer'))
-                            with m_col2:
-                                st.write("**Creation Date:**", pdf_meta.get('created'))
-                                st.write("**Mod Date:**", pdf_meta.get('modified'))
-
-                    # 5. AI Explanation (Grad-CAM)
-                    xai_img_64 = result.get('ai_explanation_64')
-                    if xai_img_64:
+                if artifact in artifacts:
+                    heatmap_data = fetch_artifact(task_id, artifact, HEATMAP_DISPLAY_WIDTH, backend_base)
+                    st.image(Image.open(BytesIO(heatmap_data)), use_column_width=True, caption=f"Engine: {vision_engine}")
+            
+            # Extracted Entities
+            entities = result.get('extracted_entities')
+            if entities:
+                st.divider()
+                st.subheader("📝 Intelligent Data Extraction")
+                e1, e2, e3 = st.columns(3)
+                e1.write(f"**Name:** {entities['person_name']}")
+                e2.write(f"**Address:** {entities['address']}")
+                e3.write(f"**Date:** {entities['date']}")
+
+            # 4. Digital Forensics (PDF only)
+            pdf_meta = result.get('pdf_metadata')
+            if pdf_meta:
+                st.divider()
+                with st.expander("🔍 Digital Forensics & Metadata", expanded=pdf_meta.get('is_suspicious')):
+                    if pdf_meta.get('is_suspicious'):
+                        st.error("⚠️ **Digital Forgery Warning**: Suspicious metadata anomalies detected.")
+                        for reason in pdf_meta.get('suspicious_reasons', []):
+                            st.write(f"- {reason}")
                         st.divider()
-                        st.subheader("🧠 AI Decision Explanation (Grad-CAM)")
-                        st.info(f"The AI is **{result['final_score']}%** confident this document is tampered. The highlighted regions below indicate the specific pixels and artifacts that most strongly influenced this decision.")
-                        xai_data = base64.b64decode(xai_img_64)
-                        st.image(Image.open(BytesIO(xai_data)), use_column_width=True, caption="Model Activation Map (Red = High Suspicion)")
+                    
+                    m_col1, m_col2 = st.columns(2)
+                    with m_col1:
+                        st.write("**Author:**", pdf_meta.get('author'))
+                        st.write("**Creator:**", pdf_meta.get('creator'))
+                        st.write("**Producer:**", pdf_meta.get('producer'))
+                    with m_col2:
+                        st.write("**Creation Date:**", pdf_meta.get('created'))
+                        st.write("**Mod Date:**", pdf_meta.get('modified'))
+
+            # 5. AI Explanation (Grad-CAM)
+            if "gradcam" in artifacts:
+                st.divider()
+                st.subheader("🧠 AI Decision Explanation (Grad-CAM)")
+                st.info(f"The AI is **{result['final_score']}%** confident this document is tampered. The highlighted regions below indicate the specific pixels and artifacts that most strongly influenced this decision.")
+                xai_data = fetch_artifact(task_id, "gradcam", HEATMAP_DISPLAY_WIDTH, backend_base)
+                st.image(Image.open(BytesIO(xai_data)), use_column_width=True, caption="Model Activation Map (Red = High Suspicion)")
 
 else: # Multi-Document KYC
-    col_u1, col_u2 = st.columns(2)
-    with col_u1:
-        doc1 = st.file_uploader("Upload Document A", type=["jpg", "jpeg", "png", "pdf"], key="doc1")
-    with col_u2:
-        doc2 = st.file_uploader("Upload Document B", type=["jpg", "jpeg", "png", "pdf"], key="doc2")
+    kyc_docs = st.file_uploader(
+        "Upload the KYC documents (two or more)", type=["jpg", "jpeg", "png", "pdf"],
+        accept_multiple_files=True, key="kyc_docs"
+    )
+
+    if kyc_docs and len(kyc_docs) >= 2:
+        outputs = ANALYSIS_OUTPUTS
+        pack_key = (tuple(file_digest(doc.getvalue()) for doc in kyc_docs), backend_base)
 
-    if doc1 and doc2:
         if st.button("🤝 Run KYC Cross-Validation", use_container_width=True):
-            with st.spinner("🔄 Benchmarking Data Points across documents..."):
-                # Prepare batch request
-                files = [
-                    ("files", (doc1.name, doc1.getvalue(), doc1.type)),
-                    ("files", (doc2.name, doc2.getvalue(), doc2.type))
-                ]
-                batch_result = call_api("/analyze-batch", files)
-                
-                if "error" in batch_result:
-                    st.error(f"Error: {batch_result['error']}")
-                else:
-                    st.balloons()
-                    
-                    # 1. KYC CONSISTENCY SECTION
-                    kyc = batch_result['kyc_validation']
-                    st.markdown("### 🧬 KYC Cross-Check Results")
-                    score_color = "green" if kyc['is_valid'] else "red"
-                    st.markdown(f"""
-                    <div style="background-color: white; padding: 20px; border-radius: 15px; border-left: 10px solid {score_color}; shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                        <h2 style="margin:0; color:{score_color};">Data Consistency Score: {kyc['consistency_score']}%</h2>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    if kyc['mismatches']:
-                        st.warning("#### 🚩 Flagged Mismatches")
-                        for m in kyc['mismatches']:
-                            st.write(f"- {m}")
-                    else:
-                        st.success("✅ All key data points consistent between documents.")
-                    
-                    st.divider()
-                    
-                    # 2. COMPARISON TABLE
-                    st.subheader("📊 Entity Comparison Table")
-                    data = []
-                    for i, res in enumerate(batch_result['results']):
-                        ent = res['extracted_entities']
-                        data.append({
-                            "Document": f"Doc {chr(65+i)} ({res['filename']})",
-                            "Name": ent['person_name'],
-                            "Address": ent['address'],
-                            "Date": ent['date'],
-                            "Fraud Score": f"{res['final_score']}%"
-                        })
-                    st.table(pd.DataFrame(data))
-                    
-                    st.divider()
+            st.markdown("#### ⏳ Document Progress")
+            # One live status line per document, updated as its events arrive
+            slots = [st.empty() for _ in kyc_docs]
+            tracked = asyncio.run(run_kyc_pack(kyc_docs, outputs, slots))
+            done = [(task_id, result) for task_id, result in tracked if result is not None]
+            if len(done) < 2:
+                st.error("Error: fewer than two documents were analysed successfully.")
+                st.stop()
+            kyc = call_cross_validation([task_id for task_id, _ in done])
+            if "error" in kyc:
+                st.error(f"Error: {kyc['error']}")
+                st.stop()
+            for slot in slots:
+                slot.empty()
+            st.session_state.kyc_pack = {"key": pack_key, "documents": done, "kyc_validation": kyc}
+            st.balloons()
+
+        pack = st.session_state.get("kyc_pack")
+        if pack and pack["key"] == pack_key:
+            # 1. KYC CONSISTENCY SECTION
+            kyc = pack['kyc_validation']
+            st.markdown("### 🧬 KYC Cross-Check Results")
+            score_color = "green" if kyc['is_valid'] else "red"
+            st.markdown(f"""
+            <div style="background-color: white; padding: 20px; border-radius: 15px; border-left: 10px solid {score_color}; shadow: 0 4px 6px rgba(0,0,0,0.1);">
+                <h2 style="margin:0; color:{score_color};">Data Consistency Score: {kyc['consistency_score']}%</h2>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            if kyc['mismatches']:
+                st.warning("#### 🚩 Flagged Mismatches")
+                for m in kyc['mismatches']:
+                    st.write(f"- {m}")
+            else:
+                st.success("✅ All key data points consistent between documents.")
+            
+            st.divider()
+            
+            # 2. COMPARISON TABLE
+            st.subheader("📊 Entity Comparison Table")
+            data = []
+            for i, (_, res) in enumerate(pack['documents']):
+                ent = res['extracted_entities']
+                data.append({
+                    "Document": f"Doc {chr(65+i)} ({res['filename']})",
+                    "Name": ent['person_name'],
+                    "Address": ent['address'],
+                    "Date": ent['date'],
+                    "Fraud Score": f"{res['final_score']}%"
+                })
+            st.table(pd.DataFrame(data))
+            
+            st.divider()
+            
+            # 3. VISUAL HEATMAPS
+            st.subheader("🖼️ Visual Forensic Evidence")
+            artifact = "ela" if vision_engine == "Baseline (ELA)" else "dl"
+            for i, (task_id, res) in enumerate(pack['documents']):
+                if i % 2 == 0:
+                    h_cols = st.columns(2)
+                with h_cols[i % 2]:
+                    st.markdown(f"**Doc {chr(65+i)} Analysis**")
+                    if artifact in res.get('artifacts', []):
+                        h_map = fetch_artifact(task_id, artifact, HEATMAP_DISPLAY_WIDTH, backend_base)
+                        st.image(Image.open(BytesIO(h_map)), use_column_width=True, caption=f"{res['classification']} ({vision_engine})")
                     
-                    # 3. VISUAL HEATMAPS
-                    st.subheader("🖼️ Visual Forensic Evidence")
-                    h_col1, h_col2 = st.columns(2)
-                    for i, res in enumerate(batch_result['results']):
-                        with [h_col1, h_col2][i]:
-                            st.markdown(f"**Doc {chr(65+i)} Analysis**")
-                            if vision_engine == "Baseline (ELA)":
-                                h_map = base64.b64decode(res['heatmap_base64'])
-                            else:
-                                h_map = base64.b64decode(res['dl_heatmap_base64'])
-                                
-                            st.image(Image.open(BytesIO(h_map)), use_column_width=True, caption=f"{res['classification']} ({vision_engine})")
-                            
-                            # PDF Metadata for Batch
-                            p_meta = res.get('pdf_metadata')
-                            if p_meta and p_meta.get('is_suspicious'):
-                                st.warning(f"🚩 Digital anomaly in {res['filename']}")
-                                
-                            # XAI for Batch
-                            x_img = res.get('ai_explanation_64')
-                            if x_img:
-                                with st.expander(f"🧠 View AI Reason for Doc {chr(65+i)}"):
-                                    st.image(Image.open(BytesIO(base64.b64decode(x_img))), use_column_width=True)
-                                    st.caption("Grad-CAM: Highlighted regions influenced the forgery score.")
+                    # PDF Metadata for Batch
+                    p_meta = res.get('pdf_metadata')
+                    if p_meta and p_meta.get('is_suspicious'):
+                        st.warning(f"🚩 Digital anomaly in {res['filename']}")
+                        
+                    # XAI for Batch
+                    if "gradcam" in res.get('artifacts', []):
+                        with st.expander(f"🧠 View AI Reason for Doc {chr(65+i)}"):
+                            x_img = fetch_artifact(task_id, "gradcam", HEATMAP_DISPLAY_WIDTH, backend_base)
+                            st.image(Image.open(BytesIO(x_img)), use_column_width=True)
+                            st.caption("Grad-CAM: Highlighted regions influenced the forgery score.")
 
     else:
-        st.info("Please upload two documents to perform a cross-validation check.")
+        st.info("Please upload at least two documents to perform a cross-validation check.")
 
 # Feature Showcase Footer
 st.markdown("---")